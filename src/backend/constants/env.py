@@ -2,7 +2,6 @@ import os
 import sys
 from pathlib import Path
 
-import torch
 from utils.containable_enum import ContainableEnum
 
 
@@ -15,7 +14,6 @@ class Environment(ContainableEnum):
 ENV: str = Environment.DEV.name
 
 # Device and OS
-DEVICE: torch.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 IS_WINDOWS: bool = 'win32' in sys.platform or 'win64' in sys.platform
 IS_LINUX: bool = 'linux' in sys.platform
 IS_OSX: bool = 'darwin' in sys.platform
@@ -32,12 +30,30 @@ TRANSFORMER_MODEL: str = 'shibing624_text2vec-base-chinese-sentence'
 BERT_MODEL: str = 'hfl--chinese-roberta-wwm-ext'
 CROSS_ENCODER_MODEL: str = 'tuhailong--cross_encoder_roberta-wwm-ext_v2'
 TAGGER_MODEL: str = 'fancyfeast--joytag'
+# Models which are not used for given seconds are unloaded from memory, and are loaded again on next use, 0 to never unload
+MODEL_IDLE_TIMEOUT_SECONDS: int = int(os.environ.get('MODEL_IDLE_TIMEOUT_SECONDS', 1800))
+# Inference backend of CLIP towers, 'eager' or 'torchscript', and if to quantize TorchScript towers to int8 for CPU
+CLIP_BACKEND: str = os.environ.get('CLIP_BACKEND', 'eager').lower()
+CLIP_INT8: bool = os.environ.get('CLIP_INT8', 'false').lower() == 'true'
+# Number of embedding worker processes, 0 to run models in current process, and intra-op threads of each worker (0 to
+# split CPU cores evenly among workers)
+EMBEDDING_WORKERS: int = int(os.environ.get('EMBEDDING_WORKERS', 0))
+EMBEDDING_WORKER_THREADS: int = int(os.environ.get('EMBEDDING_WORKER_THREADS', 0))
+# Number of images per forward pass of image tagger, and if to quantize its linear layers to int8 for CPU
+TAGGER_BATCH_SIZE: int = int(os.environ.get('TAGGER_BATCH_SIZE', 8))
+TAGGER_INT8: bool = os.environ.get('TAGGER_INT8', 'false').lower() == 'true'
 
 # Config folder, logging folder, etc.
 # - TODO: Change folders to installation path
 CONFIG_FOLDER: str = f'{Path(__file__).parent.parent.parent.parent}'
 LOGGING_FOLDER: str = f'{Path(__file__).parent.parent.parent.parent}/logs'
 
+# If to watch the active image library's folder, and apply file changes to the library without a scan
+LIB_WATCHER_ENABLED: bool = os.environ.get('LIB_WATCHER_ENABLED', 'false').lower() == 'true'
+# If image libraries share one embedding store in config folder, so that identical files in different libraries are
+# embedded only once
+SHARE_EMBEDDING_STORE: bool = os.environ.get('SHARE_EMBEDDING_STORE', 'false').lower() == 'true'
+
 REDIS_HOST: str = os.environ.get('REDIS_HOST', 'localhost')
 REDIS_PWD: str = os.environ.get('REDIS_PWD', 'test123')
 REDIS_PORT: int = int(os.environ.get('REDIS_PORT', 6379))
@@ -3,7 +3,9 @@ T_VIDEO: set[str] = {'mp4', 'webm', 'avi', 'mov', 'flv', 'wmv', '3gp', '3g2', 'm
 T_AUDIO: set[str] = {'mp3', "wav", "ogg", "mpeg", "aac", "3gpp", "3gpp2",
                      "aiff", "x-aiff", "amr", "mpga", 'oga', 'm4a', 'flac', 'aac', 'opus'}
 T_IMAGE: set[str] = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp',
-                     'svg', 'tiff', 'ico', 'jpe', 'jfif', 'pjpeg', 'pjp', 'avif', 'apng'}
+                     'svg', 'tiff', 'tif', 'ico', 'cur', 'jpe', 'jfif', 'pjpeg', 'pjp', 'avif', 'apng', 'dib',
+                     'jp2', 'j2k', 'jpf', 'jpx', 'ppm', 'pgm', 'pbm', 'pnm', 'tga', 'dds', 'pcx', 'icns', 'psd',
+                     'sgi', 'rgb', 'bw'}
 T_CODE: set[str] = {'css', 'scss', 'html', 'py', 'js', 'cpp', 'c', 'java', 'go', 'php', 'ts', 'tsx', 'dart', 'sh', 'bat', 'h', 'hpp', 'rb', 'rs', 'cs',
                     'swift', 'kt', 'vb', 'lua', 'pl', 'm', 'r', 'sql', 'json', 'xml', 'yml', 'yaml', 'toml', 'ini', 'cfg', 'conf', 'md', 'markdown', 'rst', 'tex', 'latex'}
 T_DOCUMENT: set[str] = {'docx', 'doc', 'csv', 'xls', 'xlsx', 'xlsm', 'xlsb', 'ods', 'ots', 'csv', 'tsv', 'ppt',
@@ -3,6 +3,15 @@ from utils.containable_enum import ContainableEnum
 LIB_DATA_FOLDER: str = '.LibraryData'
 INDEX_FOLDER: str = '.IndexStorage'  # All index files are stored in this folder under LIB_DATA_FOLDER
 MEM_VDB_IDX_FILENAME: str = 'MemVectorDb.idx'  # Default mem-vector DB's index file name, if file name is not given
+THUMBNAIL_FOLDER: str = '.Thumbnails'  # All thumbnails are stored in this folder under LIB_DATA_FOLDER
+
+
+class ThumbnailSize(ContainableEnum):
+    """Define fixed thumbnail sizes, a thumbnail fits in a square box of the given size in pixels
+    - SMALL is generated on scan, others are generated on first request
+    """
+    SMALL = 256
+    LARGE = 1024
 
 
 SORTED_BY_LABELS: set[str] = {'Name', 'Date Created', 'Date Modified', 'Size'}
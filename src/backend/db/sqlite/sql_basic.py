@@ -1,5 +1,8 @@
 from utils.errors.db_errors import SqlTableError
 
+# Max number of parameters bound to one statement, SQLite versions before 3.32 allow 999 at most
+MAX_SQL_PARAMS: int = 999
+
 """
 Table initialization method
 
@@ -22,6 +25,24 @@ def initialize_table_sql(table_name: str, table_structure: list[list[str]]) -> s
     """
 
 
+def table_columns_sql(table_name: str) -> str:
+    if not table_name:
+        raise SqlTableError('table_name is None')
+
+    return f"""
+    PRAGMA table_info("{table_name}");
+    """
+
+
+def add_column_sql(table_name: str, column: list[str]) -> str:
+    if not table_name:
+        raise SqlTableError('table_name is None')
+
+    return f"""
+    ALTER TABLE "{table_name}" ADD COLUMN {column[0]} {column[1]};
+    """
+
+
 """
 Index methods
 """
@@ -67,12 +88,25 @@ def select_by_id_sql(table_name: str) -> str:
     """
 
 
-def select_by_ids_sql(table_name: str) -> str:
+def in_params_sql(count: int) -> str:
+    """Placeholders of an `IN (...)` clause for given number of parameters
+    """
+    if count <= 0 or count > MAX_SQL_PARAMS:
+        raise SqlTableError(f'Invalid parameter count: {count}')
+
+    return f"({', '.join(['?'] * count)})"
+
+
+def select_by_ids_sql(table_name: str, count: int, columns: list[str] | None = None) -> str:
+    """Select rows by `count` IDs, the ID is always the first column of selected rows, followed by given columns or
+    all columns if `columns` is not given
+    """
     if not table_name:
         raise SqlTableError('table_name is None')
 
+    projection: str = ', '.join(columns) if columns else '*'
     return f"""
-    SELECT * FROM "{table_name}" WHERE id IN (?)
+    SELECT id, {projection} FROM "{table_name}" WHERE id IN {in_params_sql(count)};
     """
 
 
@@ -136,6 +170,15 @@ def get_row_count_sql(table_name: str) -> str:
     """
 
 
+def get_max_id_sql(table_name: str) -> str:
+    if not table_name:
+        raise SqlTableError('table_name is None')
+
+    return f"""
+    SELECT MAX(id) FROM "{table_name}";
+    """
+
+
 def check_table_exist_sql(table_name: str) -> str:
     if not table_name:
         raise SqlTableError('table_name is None')
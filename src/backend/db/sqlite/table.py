@@ -1,42 +1,194 @@
 import sqlite3
 from functools import wraps
 from sqlite3 import Connection, Cursor
+from threading import RLock
+from time import time
+from typing import Any, Callable
 
 from db.sqlite.sql_basic import *
 
 
 def ensure_db(func):
     """Decorator to ensure the DB is connected on every call
+    - If there is an active write batch, its buffered statements are executed first, so that the operation sees them,
+    and they are committed if the batch's deadline is passed
     """
     @wraps(func)
     def wrapper(self: 'SqliteTable', *args, **kwargs):
         if not self.db:
             raise SqlTableError("db is None")
+        if self.write_batch_ctx:
+            self.write_batch_ctx.flush()
         return func(self, *args, **kwargs)
     return wrapper
 
 
+def ensure_db_batchable(func):
+    """Decorator to ensure the DB is connected on every call, for operations which can be buffered by write batch
+    - Unlike `ensure_db`, buffered statements are not flushed, so consecutive operations are executed together
+    """
+    @wraps(func)
+    def wrapper(self: 'SqliteTable', *args, **kwargs):
+        if not self.db:
+            raise SqlTableError("db is None")
+        return func(self, *args, **kwargs)
+    return wrapper
+
+
+class WriteBatch:
+    """Group the writes to a table into transactions, a transaction is committed every `max_rows` rows or every
+    `max_delay_ms` milliseconds, whichever comes first
+    - Inserts are buffered and executed with `executemany()`, other writes (update, delete) are executed immediately but
+    committed with the batch
+    - Use it by `SqliteTable.write_batch()`, when it is active all writes of the table go through it, including the
+    ones from other threads
+    - `max_delay_ms` is a lower bound of the commit delay, not a guarantee: there is no timer, the deadline is checked
+    when the table is written or read, so writes followed by an idle period are committed by the next operation on the
+    table or on exit
+    - Pending writes are committed on exit, even if an exception is raised, so a cancelled scan keeps its progress
+    """
+
+    def __init__(self, table: 'SqliteTable', max_rows: int, max_delay_ms: int):
+        self.__table: SqliteTable = table
+        self.__max_rows: int = max(1, max_rows)
+        self.__max_delay: float = max(0, max_delay_ms) / 1000
+        self.__lock: RLock = RLock()
+        # Consecutive statements with the same SQL, they are executed with one `executemany()`
+        self.__pending_sql: str | None = None
+        self.__pending_params: list[tuple] = list()
+        self.__uncommitted_rows: int = 0
+        # Time of the first write (buffered or executed) since last commit
+        self.__first_uncommitted: float = 0
+
+    def __enter__(self) -> 'WriteBatch':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__table.write_batch_ctx = None
+        self.commit()
+
+    def execute(self, sql: str, params: tuple):
+        """Buffer a statement, it is executed when a statement with different SQL comes, or on flush
+        """
+        with self.__lock:
+            if sql != self.__pending_sql:
+                self.flush()
+                self.__pending_sql = sql
+            self.__write_started()
+            self.__pending_params.append(params)
+            if len(self.__pending_params) >= self.__max_rows or self.__deadline_passed():
+                self.flush()
+
+    def executed(self, count: int = 1):
+        """Notify that a write is executed directly on the connection, it will be committed with the batch
+        """
+        with self.__lock:
+            self.__write_started()
+            self.__row_written(count)
+
+    def flush(self):
+        """Execute buffered statements, they are not committed unless the batch is full or its deadline is passed
+        """
+        with self.__lock:
+            self.__row_written(self.__execute_pending())
+
+    def commit(self):
+        with self.__lock:
+            self.__uncommitted_rows += self.__execute_pending()
+            if self.__uncommitted_rows:
+                self.__table.db.commit()
+                self.__uncommitted_rows = 0
+
+    """
+    Private methods
+    """
+
+    def __write_started(self):
+        if not self.__uncommitted_rows and not self.__pending_params:
+            self.__first_uncommitted = time()
+
+    def __deadline_passed(self) -> bool:
+        return time() - self.__first_uncommitted >= self.__max_delay
+
+    def __row_written(self, count: int):
+        self.__uncommitted_rows += count
+        if self.__uncommitted_rows and (self.__uncommitted_rows >= self.__max_rows or self.__deadline_passed()):
+            self.commit()
+
+    def __execute_pending(self) -> int:
+        """Execute buffered statements, return the number of rows executed
+        """
+        if not self.__pending_params:
+            return 0
+        sql, params = self.__pending_sql, self.__pending_params
+        self.__pending_sql, self.__pending_params = None, list()
+        self.__table.db.cursor().executemany(sql, params)  # type: ignore
+        return len(params)
+
+
 class SqliteTable:
     """Base class for sqlite table operations
     """
 
     TABLE_STRUCTURE: list[list[str]] = []
 
-    def __init__(self, db_path: str, table_name: str):
+    def __init__(self, db_path: str | None, table_name: str, connection: Connection | None = None):
         """
         Args:
             table_name (str): Mandatory
             db_path (str): Optional if connection is provided
-            connection (Connection | None): Optional if db_path is provided
+            connection (Connection | None): Optional if db_path is provided, the connection of another table in the same
+            DB, so that the tables do not lock each other out. It is not closed by this table
         """
-        if not db_path:
+        if not db_path and not connection:
             raise SqlTableError('db_path is None')
         if not table_name:
             raise SqlTableError('table_name is None')
 
         self.table_name: str = table_name
         self.row_size: int = len(self.TABLE_STRUCTURE)
-        self.db: Connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.__own_connection: bool = connection is None
+        self.db: Connection = connection or sqlite3.connect(db_path, check_same_thread=False)  # type: ignore
+        self.write_batch_ctx: WriteBatch | None = None
+
+    def write_batch(self, max_rows: int = 500, max_delay_ms: int = 1000) -> WriteBatch:
+        """Get a context manager to group the writes of this table into transactions, see `WriteBatch`
+        - If there is already an active write batch, a new one is not created and the writes join the active one
+
+        Example:
+            with table.write_batch():
+                for row in rows:
+                    table.insert_row(row)
+        """
+        if self.write_batch_ctx:
+            return _JoinedWriteBatch(self.write_batch_ctx)  # type: ignore
+        self.write_batch_ctx = WriteBatch(self, max_rows, max_delay_ms)
+        return self.write_batch_ctx
+
+    def _select_by_keys(self, keys: list[Any], make_sql: Callable[[int], str]) -> list[tuple]:
+        """Select rows by a list of keys with `IN (...)` statements, return them in the order of given keys
+        - `make_sql` makes the statement for given number of keys, the key must be the first selected column, it is
+        removed from returned rows
+        - Keys are deduplicated before binding, a row is returned for each occurrence of its key, and keys with no row
+        are skipped
+        """
+        found: dict[Any, tuple] = dict()
+        unique_keys: list[Any] = list(dict.fromkeys(keys))
+        cur: Cursor = self.db.cursor()
+        for start in range(0, len(unique_keys), MAX_SQL_PARAMS):
+            chunk: list[Any] = unique_keys[start:start + MAX_SQL_PARAMS]
+            cur.execute(make_sql(len(chunk)), chunk)
+            for row in cur.fetchall():
+                found[row[0]] = row[1:]
+        return [found[key] for key in keys if key in found]
+
+    def _commit(self, count: int = 1):
+        """Commit a write operation, or leave it to the active write batch
+        """
+        if self.write_batch_ctx:
+            self.write_batch_ctx.executed(count)
+        else:
+            self.db.commit()
 
     @ensure_db
     def table_exists(self) -> bool:
@@ -44,6 +196,20 @@ class SqliteTable:
         cur.execute(check_table_exist_sql(self.table_name))
         return cur.fetchone() is not None
 
+    @ensure_db
+    def ensure_columns(self) -> None:
+        """Add the columns defined in TABLE_STRUCTURE but missing in an existing table
+        - Used to migrate tables created by previous versions, the new columns are NULL for existing rows
+        - Missing columns are appended, so they must be defined at the end of TABLE_STRUCTURE
+        """
+        cur: Cursor = self.db.cursor()
+        cur.execute(table_columns_sql(self.table_name))
+        existing: set[str] = set(row[1] for row in cur.fetchall())
+        for column in self.TABLE_STRUCTURE:
+            if column[0] not in existing:
+                cur.execute(add_column_sql(self.table_name, column))
+        self.db.commit()
+
     @ensure_db
     def row_count(self) -> int:
         cur: Cursor = self.db.cursor()
@@ -52,31 +218,46 @@ class SqliteTable:
         return res[0] if res else 0
 
     @ensure_db
+    def max_row_id(self) -> int:
+        cur: Cursor = self.db.cursor()
+        cur.execute(get_max_id_sql(self.table_name))
+        res: tuple | None = cur.fetchone()
+        return res[0] if res and res[0] is not None else 0
+
+    @ensure_db_batchable
     def insert_row(self, row: tuple) -> int | None:
+        """Insert a row, returns the row ID
+        - If there is an active write batch, the row is buffered and None is returned
+        """
         # Skip the first column (id)
         if not row or len(row) != self.row_size - 1:
             raise SqlTableError('Row size is not correct')
 
+        sql: str = insert_row_sql(table_name=self.table_name, table_structure=self.TABLE_STRUCTURE)
+        if self.write_batch_ctx:
+            self.write_batch_ctx.execute(sql, row)
+            return None
+
         cur: Cursor = self.db.cursor()
-        cur.execute(insert_row_sql(
-            table_name=self.table_name,
-            table_structure=self.TABLE_STRUCTURE
-        ), row)
+        cur.execute(sql, row)
         self.db.commit()
         return cur.lastrowid
 
-    @ensure_db
+    @ensure_db_batchable
     def insert_rows(self, rows: list[tuple]) -> int | None:
         # Skip the first column (id)
         for row in rows:
             if not row or len(row) != self.row_size - 1:
                 raise SqlTableError('Row size is not correct')
 
+        sql: str = insert_row_sql(table_name=self.table_name, table_structure=self.TABLE_STRUCTURE)
+        if self.write_batch_ctx:
+            for row in rows:
+                self.write_batch_ctx.execute(sql, row)
+            return None
+
         cur: Cursor = self.db.cursor()
-        cur.executemany(insert_row_sql(
-            table_name=self.table_name,
-            table_structure=self.TABLE_STRUCTURE
-        ), rows)
+        cur.executemany(sql, rows)
         self.db.commit()
         return cur.lastrowid
 
@@ -86,6 +267,13 @@ class SqliteTable:
         cur.execute(select_by_id_sql(self.table_name), (row_id,))
         return cur.fetchone()
 
+    @ensure_db
+    def select_rows(self, row_ids: list[int], columns: list[str] | None = None) -> list[tuple]:
+        """Select rows by IDs in one statement (or in one per `MAX_SQL_PARAMS` IDs), see `_select_by_keys()`
+        - Only given columns are selected if `columns` is given, otherwise rows are in table row format
+        """
+        return self._select_by_keys(row_ids, lambda count: select_by_ids_sql(self.table_name, count, columns))
+
     @ensure_db
     def select_many(self, k: int = -1, order_by: str | None = None, asc: bool = True) -> Cursor:
         cur: Cursor = self.db.cursor()
@@ -98,7 +286,7 @@ class SqliteTable:
     def delete_row(self, row_id: int) -> None:
         cur: Cursor = self.db.cursor()
         cur.execute(delete_by_id_sql(self.table_name), (row_id,))
-        self.db.commit()
+        self._commit()
 
     @ensure_db
     def clean_all_data(self) -> None:
@@ -121,4 +309,19 @@ class SqliteTable:
 
     @ensure_db
     def close(self):
-        self.db.close()
+        if self.__own_connection:
+            self.db.close()
+
+
+class _JoinedWriteBatch:
+    """A no-op context for nested `write_batch()` calls, the outer write batch commits the writes
+    """
+
+    def __init__(self, write_batch: WriteBatch):
+        self.__write_batch: WriteBatch = write_batch
+
+    def __enter__(self) -> WriteBatch:
+        return self.__write_batch
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
@@ -2,14 +2,20 @@ import math
 import os
 import pickle
 from functools import wraps
+from typing import Callable
 
 import numpy as np
 from constants.lib_constants import MEM_VDB_IDX_FILENAME
 from faiss import IndexFlatL2, IndexIDMap2, IndexIVFFlat
 from loggers import vector_db_logger as LOGGER
 from utils.errors.db_errors import VectorDbCoreError
+from utils.task_runner import report_progress
 
 DEFAULT_NEIGHBOR_COUNT: int = 5  # Default number of nearest neighbors to be queried for IVF
+# IVF is trained on a random sample of given points per cluster, faiss needs at least 39 and uses at most 256
+DEFAULT_TRAINING_POINTS_PER_CLUSTER: int = 64
+# IVF index is filled with given number of vectors per add, so progress can be reported
+IVF_ADD_CHUNK_SIZE: int = 65536
 
 
 def ensure_index(func):
@@ -90,11 +96,16 @@ class InMemoryVectorDb:
                          track_id: bool = False,
                          training_set: np.ndarray | None = None,
                          training_set_uuid_list: list[str] | None = None,
-                         expected_dataset_size: int = 0):
+                         expected_dataset_size: int = 0,
+                         training_points_per_cluster: int = DEFAULT_TRAINING_POINTS_PER_CLUSTER,
+                         progress_reporter: Callable[[int, int, str | None], None] | None = None,
+                         progress_phase: int = 1):
         """Initialize in-memory index
         - If no training set is given, use a flat index
         - If training set is given, use IVF index
         - If training set is given with UUIDs, track the ID mapping for IVF index
+        - IVF is trained on a random sample of the training set, then the whole training set is added in chunks, the
+        training set can be a memory-mapped array, only the sample is copied to memory
 
         Args:
             vector_dimension (int): _description_
@@ -102,6 +113,11 @@ class InMemoryVectorDb:
             training_set (list[np.ndarray] | None, optional): IVF index param. Defaults to None.
             training_set_uuid_list (list[str] | None, optional): IVF index param, whether to track ID. Defaults to None.
             expected_dataset_size (int, optional): IVF index param. Defaults to 0.
+            training_points_per_cluster (int, optional): IVF index param, sample size per cluster for training, 0 to
+            train on the whole training set. Defaults to DEFAULT_TRAINING_POINTS_PER_CLUSTER.
+            progress_reporter (Callable[[int, int, str | None], None] | None, optional): IVF index param, reports
+            progress of adding the training set. Defaults to None.
+            progress_phase (int, optional): IVF index param, the phase to report progress in. Defaults to 1.
         """
         LOGGER.info(
             f'Initializing index for in-memory vector DB, vector dimension: {vector_dimension}, track ID: {track_id}')
@@ -145,16 +161,39 @@ class InMemoryVectorDb:
         self._mem_index_ivf = IndexIVFFlat(quantizer, vector_dimension, cluster_count)
         self._mem_index_ivf.nprobe = DEFAULT_NEIGHBOR_COUNT
 
-        self._mem_index_ivf.train(training_set)  # type: ignore
+        # Training cost grows with the number of training points, while the accuracy barely improves beyond a few dozen
+        # points per cluster, so train on a random sample, sorted to read a memory-mapped training set sequentially
+        sample_size: int = training_points_per_cluster * cluster_count
+        if 0 < sample_size < len(training_set):
+            sample_indices: np.ndarray = np.sort(np.random.default_rng().choice(len(training_set), sample_size,
+                                                                                replace=False))
+            training_sample: np.ndarray = np.ascontiguousarray(training_set[sample_indices], dtype=np.float32)
+        else:
+            training_sample: np.ndarray = np.ascontiguousarray(training_set, dtype=np.float32)
+        LOGGER.info(f'Training IVF index with {len(training_sample)} points, cluster count: {cluster_count}')
+        self._mem_index_ivf.train(training_sample)  # type: ignore
+        del training_sample
         self.index_size_since_last_training = len(training_set)
         LOGGER.info(f'IVF index trained')
 
         # Track vector ID only when the embedding is added with a UUID
         if training_set_uuid_list:
             self.__id_mapping = dict(zip(range(len(training_set_uuid_list)), training_set_uuid_list))
-            self._mem_index_ivf.add_with_ids(training_set, np.asarray(range(len(training_set))))  # type: ignore
-        else:
-            self._mem_index_ivf.add(training_set)  # type: ignore
+        total: int = len(training_set)
+        previous_progress: int = -1
+        for start in range(0, total, IVF_ADD_CHUNK_SIZE):
+            current_progress: int = int(start / total * 100)
+            if current_progress > previous_progress:
+                previous_progress = current_progress
+                report_progress(progress_reporter, current_progress, current_phase=progress_phase, phase_name='INDEXING')
+
+            end: int = min(start + IVF_ADD_CHUNK_SIZE, total)
+            chunk: np.ndarray = np.ascontiguousarray(training_set[start:end], dtype=np.float32)
+            if training_set_uuid_list:
+                self._mem_index_ivf.add_with_ids(chunk, np.arange(start, end, dtype=np.int64))  # type: ignore
+            else:
+                self._mem_index_ivf.add(chunk)  # type: ignore
+        report_progress(progress_reporter, 100, current_phase=progress_phase, phase_name='INDEXING')
         LOGGER.info(f'IVF index trained data added')
 
     @ensure_index
@@ -185,6 +224,14 @@ class InMemoryVectorDb:
         else:
             target_index.add(np.asarray([embedding]))  # type: ignore
 
+    @ensure_index
+    def add_many(self, embeddings: np.ndarray):
+        """Save given (N, D) embeddings to vector DB in one call, without ID tracking
+        """
+        if self.__id_mapping:
+            raise VectorDbCoreError('Embeddings must be added with UUIDs when ID is tracked')
+        self.__get_index().add(np.ascontiguousarray(embeddings, dtype=np.float32))  # type: ignore
+
     @ensure_index
     def remove(self, uuids: list[str] | None, ids: list[int] | None):
         """Remove embeddings from vector DB by UUIDs or IDs
@@ -242,12 +289,16 @@ class InMemoryVectorDb:
         """Persist index to disk
         """
         LOGGER.info(f'Persisting vector index to disk, path: {self.mem_index_path}')
-        pickle.dump({
-            'id_mapping': self.__id_mapping,
-            'id_mapping_reverse': self.__id_mapping_reverse,
-            'index_flat': self._mem_index_flat,
-            'index_ivf': self._mem_index_ivf,
-        }, open(self.mem_index_path, 'wb'))
+        # Write to a temp file then replace, so that the existing index file is never left half-written
+        temp_path: str = f'{self.mem_index_path}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump({
+                'id_mapping': self.__id_mapping,
+                'id_mapping_reverse': self.__id_mapping_reverse,
+                'index_flat': self._mem_index_flat,
+                'index_ivf': self._mem_index_ivf,
+            }, f)
+        os.replace(temp_path, self.mem_index_path)
 
     def index_exists(self) -> bool:
         """Check if the index exists
@@ -1,40 +1,102 @@
+from datetime import datetime
 from functools import wraps
+from queue import Queue
+from threading import Event, Lock, Thread
+from time import sleep, time
 from typing import Any, Iterator
 
 from constants.env import *
-from redis import Redis
+from loggers import vector_db_logger as LOGGER
+from redis import Redis, ResponseError
 from redis.client import Pipeline
 from utils.errors.db_errors import VectorDbCoreError
 
 
 class BatchedPipeline:
     """A redis pipeline that executes commands automatically in batches of a given size as a context manager
+    - In async flush mode, a full batch is handed over to a background sender thread and the caller keeps filling a
+    fresh pipeline, so that the caller's work (e.g., embedding) overlaps with Redis network I/O
+    - At most `max_in_flight` batches can wait for the sender, the caller blocks when the limit is reached (backpressure)
+    - Any error raised by the sender is re-raised to the caller on next flush or on exit
     """
 
-    def __init__(self, redis_client: 'RedisClient', batch_size: int = 200):
+    def __init__(self,
+                 redis_client: 'RedisClient',
+                 batch_size: int = 200,
+                 async_flush: bool = False,
+                 max_in_flight: int = 2):
+        self.__redis_client: RedisClient = redis_client
         self.__batch_size: int = batch_size
         self.__pipeline: Pipeline = redis_client.pipeline()
 
+        self.__async_flush: bool = async_flush
+        self.__sender_queue: Queue[Pipeline | None] | None = None
+        self.__sender_thread: Thread | None = None
+        self.__sender_error: BaseException | None = None
+        if async_flush:
+            self.__sender_queue = Queue(maxsize=max(1, max_in_flight))
+            self.__sender_thread = Thread(target=self.__sender_loop, name='redis-pipeline-sender', daemon=True)
+            self.__sender_thread.start()
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if len(self.__pipeline) > 0:
-            self.__pipeline.execute()
-        self.__pipeline.close()
+        if not self.__async_flush:
+            if len(self.__pipeline) > 0:
+                self.__pipeline.execute()
+            self.__pipeline.close()
+            return
+
+        # Flush the remaining commands, then stop the sender and wait for all in-flight batches to be sent
+        if len(self.__pipeline) > 0 and self.__sender_error is None:
+            self.__sender_queue.put(self.__pipeline)  # type: ignore
+        else:
+            self.__pipeline.close()
+        self.__sender_queue.put(None)  # type: ignore
+        self.__sender_thread.join()  # type: ignore
+
+        # Do not shadow the original exception if the caller is already failing
+        if exc_type is None:
+            self.__raise_sender_error()
+
+    def __sender_loop(self):
+        """Background sender, executes the handed over pipelines one by one until a `None` is received
+        - After the first failure, the rest batches are dropped since the error will be raised to the caller anyway
+        """
+        while True:
+            pipeline: Pipeline | None = self.__sender_queue.get()  # type: ignore
+            if pipeline is None:
+                self.__sender_queue.task_done()  # type: ignore
+                return
+            try:
+                if self.__sender_error is None:
+                    pipeline.execute()
+            except BaseException as e:
+                LOGGER.error(f'Failed to execute batched pipeline in background: {e}')
+                self.__sender_error = e
+            finally:
+                pipeline.close()
+                self.__sender_queue.task_done()  # type: ignore
+
+    def __raise_sender_error(self):
+        if self.__sender_error is not None:
+            raise VectorDbCoreError(f'Batched pipeline execution failed: {self.__sender_error}')
+
+    def __flush_if_full(self):
+        if len(self.__pipeline) >= self.__batch_size:
+            self.execute()
 
     def set(self, key: str, value: Any):
         self.__pipeline.set(key, value)
-        if len(self.__pipeline) >= self.__batch_size:
-            self.__pipeline.execute()
+        self.__flush_if_full()
 
     def get(self, key: str) -> Any:
         return self.__pipeline.get(key)
 
     def delete(self, key: str) -> Any:
         self.__pipeline.delete(key)
-        if len(self.__pipeline) >= self.__batch_size:
-            self.__pipeline.execute()
+        self.__flush_if_full()
 
     def exists(self, key: str) -> bool:
         return bool(self.__pipeline.exists(key))
@@ -43,8 +105,7 @@ class BatchedPipeline:
         if not path:
             path = '$'
         self.__pipeline.json().set(name, path, obj)
-        if len(self.__pipeline) >= self.__batch_size:
-            self.__pipeline.execute()
+        self.__flush_if_full()
 
     def json_get(self, name: str) -> Any:
         return self.__pipeline.json().get(name)
@@ -53,16 +114,72 @@ class BatchedPipeline:
         if not path:
             path = '$'
         self.__pipeline.json().delete(name, path)
-        if len(self.__pipeline) >= self.__batch_size:
-            self.__pipeline.execute()
+        self.__flush_if_full()
 
     def execute(self) -> None:
-        self.__pipeline.execute()
+        """Execute buffered commands
+        - In async flush mode, hand over current pipeline to the sender and continue with a fresh one, this blocks
+        only when there are already `max_in_flight` batches waiting to be sent
+        """
+        if not self.__async_flush:
+            self.__pipeline.execute()
+            return
+
+        self.__raise_sender_error()
+        if len(self.__pipeline) == 0:
+            return
+        self.__sender_queue.put(self.__pipeline)  # type: ignore
+        self.__pipeline = self.__redis_client.pipeline()
+
+    def sync(self) -> None:
+        """Execute buffered commands and wait until all of them (including in-flight batches) are sent to Redis
+        """
+        self.execute()
+        if self.__async_flush:
+            self.__sender_queue.join()  # type: ignore
+            self.__raise_sender_error()
 
     def save(self) -> None:
         self.__pipeline.bgrewriteaof()
 
 
+class PersistenceStatus:
+    """Completion status of a background persistence (BGSAVE + AOF rewrite) on Redis server
+    - The status is resolved by a poller thread which checks `INFO persistence`
+    - Use `wait()` to block until the persistence is finished, or `is_done()` to check without blocking
+    """
+
+    def __init__(self):
+        self.started_on: float = time()
+        # If the BGSAVE of this persistence is accepted by Redis, it is retried by the poller otherwise
+        self.bgsave_started: bool = False
+        # State before BGSAVE is sent, to detect its completion
+        # - `rdb_saves` counter (Redis 7+) is preferred, `LASTSAVE` has one-second resolution so a save finished in the
+        # same second as the previous one cannot be told by it
+        self.saves_before: int | None = None
+        self.last_save_before: datetime | None = None
+        # If the BGSAVE is seen in progress by the poller
+        self.bgsave_seen_running: bool = False
+        self.success: bool = False
+        self.error: str = ''
+        self.__done: Event = Event()
+
+    def is_done(self) -> bool:
+        return self.__done.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Wait for the persistence to finish, return True if it is finished successfully within the timeout
+        """
+        if not self.__done.wait(timeout):
+            return False
+        return self.success
+
+    def resolve(self, success: bool, error: str = ''):
+        self.success = success
+        self.error = error
+        self.__done.set()
+
+
 def ensure_redis(func):
     """Decorator to ensure the Redis client is connected on every call
     """
@@ -75,6 +192,17 @@ def ensure_redis(func):
 
 
 class RedisClient:
+    # Interval and timeout in seconds for polling the background persistence state
+    PERSIST_POLL_INTERVAL: float = 0.5
+    PERSIST_TIMEOUT: float = 3600
+
+    # All clients connect to the same Redis server, so the pending persistence is shared across clients (libraries)
+    # to coalesce concurrent persist requests
+    __persist_lock: Lock = Lock()
+    __pending_persist: PersistenceStatus | None = None
+    # At most one persistence is queued behind the pending one, for callers arriving while the pending one is running
+    __queued_persist: PersistenceStatus | None = None
+
     def __init__(self, decode_responses: bool = True):
         self.__client: Redis = Redis(
             host=REDIS_HOST,
@@ -143,8 +271,11 @@ class RedisClient:
         return self.__client.pipeline()
 
     @ensure_redis
-    def batched_pipeline(self, batch_size: int = 1000) -> BatchedPipeline:
-        return BatchedPipeline(self, batch_size)
+    def batched_pipeline(self,
+                         batch_size: int = 1000,
+                         async_flush: bool = False,
+                         max_in_flight: int = 2) -> BatchedPipeline:
+        return BatchedPipeline(self, batch_size, async_flush=async_flush, max_in_flight=max_in_flight)
 
     @ensure_redis
     def close(self) -> None:
@@ -153,12 +284,117 @@ class RedisClient:
     @ensure_redis
     def snapshot(self) -> None:
         """Create a snapshot of the current database
+        - An AOF rewrite already in progress will cover current data too, so it is not an error
         """
-        self.__client.bgrewriteaof()
+        try:
+            self.__client.bgrewriteaof()
+        except ResponseError as e:
+            LOGGER.warning(f'AOF rewrite not started: {e}')
 
     @ensure_redis
-    def save(self) -> None:
-        """Dump whole database to disk
+    def save(self) -> PersistenceStatus:
+        """Dump whole database to disk in background, without blocking the Redis server
+        - Both AOF rewrite and BGSAVE are forked by Redis, other clients' queries are not blocked
+        - If a persistence is already in progress, the caller's writes might not be in its snapshot, so exactly one
+        follow-up persistence is queued to start when it finishes, and all callers during that time share the follow-up
         """
+        with RedisClient.__persist_lock:
+            pending: PersistenceStatus | None = RedisClient.__pending_persist
+            if pending and not pending.is_done():
+                if not RedisClient.__queued_persist:
+                    LOGGER.info('Redis persistence already in progress, queue a follow-up one')
+                    RedisClient.__queued_persist = PersistenceStatus()
+                return RedisClient.__queued_persist
+
+            # The pending one is finished but its poller has not started the queued one yet, start it here
+            status: PersistenceStatus = RedisClient.__queued_persist or PersistenceStatus()
+            RedisClient.__queued_persist = None
+            self.__start_persistence(status)
+            return status
+
+    def __start_persistence(self, status: PersistenceStatus):
+        """Start AOF rewrite and BGSAVE for given status, and a poller thread to resolve it, `__persist_lock` must be held
+        """
+        status.started_on = time()
         self.snapshot()
-        self.__client.save()
+        self.__start_bgsave(status)
+
+        RedisClient.__pending_persist = status
+        Thread(target=self.__poll_persistence, args=(status,), name='redis-persistence-poller', daemon=True).start()
+        LOGGER.info('Redis background persistence started')
+
+    def __start_bgsave(self, status: PersistenceStatus):
+        """Start BGSAVE, `SCHEDULE` queues it instead of failing when an AOF rewrite is in progress
+        - If an RDB save started by others is already running, it might not contain current data, BGSAVE is retried by
+        the poller when that save is finished
+        """
+        status.saves_before = self.__client.info('persistence').get('rdb_saves')
+        status.last_save_before = self.__client.lastsave()
+        try:
+            self.__client.bgsave(schedule=True)
+            status.bgsave_started = True
+        except ResponseError as e:
+            if 'already in progress' not in str(e):
+                raise e
+            LOGGER.info('Another RDB save is in progress, BGSAVE will be retried when it is finished')
+            status.bgsave_started = False
+
+    def __poll_persistence(self, status: PersistenceStatus):
+        """Poll `INFO persistence` until the background save is finished, then start the queued one
+        """
+        try:
+            self.__wait_for_persistence(status)
+        finally:
+            with RedisClient.__persist_lock:
+                queued: PersistenceStatus | None = RedisClient.__queued_persist
+                RedisClient.__queued_persist = None
+                if queued:
+                    try:
+                        self.__start_persistence(queued)
+                    except BaseException as e:
+                        queued.resolve(False, str(e))
+
+    def __is_bgsave_finished(self, status: PersistenceStatus, info: dict) -> bool:
+        """Check if the accepted BGSAVE (and the AOF rewrite) of given status is finished
+        - A scheduled BGSAVE starts after the running AOF rewrite, so "nothing in progress" alone is not completion
+        """
+        if info.get('rdb_bgsave_in_progress'):
+            status.bgsave_seen_running = True
+            return False
+        if info.get('aof_rewrite_in_progress') or info.get('aof_rewrite_scheduled'):
+            return False
+        if status.saves_before is not None and info.get('rdb_saves') is not None:
+            return info['rdb_saves'] > status.saves_before
+        # Redis before 7 has no save counter, the save is finished if it is seen running before, or `LASTSAVE` moves
+        return status.bgsave_seen_running or self.__client.lastsave() > status.last_save_before
+
+    def __wait_for_persistence(self, status: PersistenceStatus):
+        while time() - status.started_on < RedisClient.PERSIST_TIMEOUT:
+            sleep(RedisClient.PERSIST_POLL_INTERVAL)
+            try:
+                info: dict = self.__client.info('persistence')
+                if not status.bgsave_started:
+                    if not info.get('rdb_bgsave_in_progress'):
+                        self.__start_bgsave(status)
+                    continue
+                if not self.__is_bgsave_finished(status, info):
+                    continue
+
+                if info.get('rdb_last_bgsave_status') != 'ok':
+                    status.resolve(False, 'BGSAVE failed')
+                elif info.get('aof_last_bgrewrite_status', 'ok') != 'ok':
+                    status.resolve(False, 'AOF rewrite failed')
+                else:
+                    status.resolve(True)
+                break
+            except BaseException as e:
+                status.resolve(False, str(e))
+                break
+        else:
+            status.resolve(False, f'Persistence not finished in {RedisClient.PERSIST_TIMEOUT}s')
+
+        time_taken: float = time() - status.started_on
+        if status.success:
+            LOGGER.info(f'Redis background persistence finished, cost: {time_taken:.2f}s')
+        else:
+            LOGGER.error(f'Redis background persistence failed, cost: {time_taken:.2f}s, error: {status.error}')
@@ -1,11 +1,62 @@
-from db.vector.redis_client import BatchedPipeline, RedisClient
+from typing import Iterable
+
+from db.vector.redis_client import (BatchedPipeline, PersistenceStatus,
+                                    RedisClient)
 from loggers import vector_db_logger as LOGGER
 from redis import ResponseError
 from redis.commands.search import Search
-from redis.commands.search.field import VectorField
+from redis.commands.search.field import (NumericField, TagField, TextField,
+                                         VectorField)
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 from utils.errors.db_errors import VectorDbCoreError
 
+# Separator for TAG fields, paths may contain the default separator (comma)
+TAG_SEPARATOR: str = '|'
+# TAG field cannot match an empty value, use this tag for files under the library root
+ROOT_PATH_TAG: str = '.'
+# Characters need to be escaped in TAG/TEXT query values
+# - https://redis.io/docs/interact/search-and-query/advanced-concepts/escaping/
+SPECIAL_CHARS: str = ',.<>{}[]"\':;!@#$%^&*()-+=~|/ '
+
+
+def escape_query_value(value: str) -> str:
+    """Escape the special characters of a value in a search query
+    """
+    return ''.join(f'\\{c}' if c in SPECIAL_CHARS else c for c in value)
+
+
+def make_metadata(path: str, filename: str, timestamp: float) -> dict:
+    """Build the metadata fields to be saved along with an embedding
+    """
+    return {
+        'path': path or ROOT_PATH_TAG,
+        'filename': filename,
+        'timestamp': timestamp,
+    }
+
+
+def make_filter_expression(path: str | None = None,
+                           filename: str | None = None,
+                           start_time: float | None = None,
+                           end_time: float | None = None) -> str | None:
+    """Build a pre-filter expression for the KNN query from given metadata conditions
+    - `path` is an exact match on parent folder (TAG), `filename` is a full-text match on file name (TEXT)
+    - `start_time` and `end_time` are inclusive range on file's modified time in seconds (NUMERIC)
+    - Return None if no condition is given
+    """
+    conditions: list[str] = list()
+    if path is not None:
+        conditions.append(f'@path:{{{escape_query_value(path or ROOT_PATH_TAG)}}}')
+    if filename:
+        conditions.append(f'@filename:({escape_query_value(filename)})')
+    if start_time is not None or end_time is not None:
+        low: str = str(start_time) if start_time is not None else '-inf'
+        high: str = str(end_time) if end_time is not None else '+inf'
+        conditions.append(f'@timestamp:[{low} {high}]')
+    if not conditions:
+        return None
+    return ' '.join(conditions)
+
 
 class RedisVectorDb:
     """It maintains a vector database on Redis
@@ -27,9 +78,10 @@ class RedisVectorDb:
 
         # Define redis index schema
         # - https://redis.io/docs/get-started/vector-database/
+        # - Metadata fields are indexed along with the vector, so that filters are applied inside Redis before KNN
         schema = (
             VectorField(
-                "$",  # The path to the vector field in the JSON object
+                "$.vector",  # The path to the vector field in the JSON object
                 # Specifies the indexing method, which is either a FLAT or a hierarchical
                 # navigable small world graph (HNSW)
                 "FLAT",
@@ -40,6 +92,9 @@ class RedisVectorDb:
                 },
                 as_name="vector",
             ),
+            TagField("$.path", separator=TAG_SEPARATOR, as_name="path"),
+            TextField("$.filename", as_name="filename"),
+            NumericField("$.timestamp", as_name="timestamp"),
         )
 
         # Define the key-space for the index
@@ -47,25 +102,102 @@ class RedisVectorDb:
         definition: IndexDefinition = IndexDefinition(prefix=[f'{self.namespace}:'], index_type=IndexType.JSON)
 
         # Create the index
+        # - Index created by previous versions is upgraded by `upgrade_index()` on library load, if it is still here
+        # (e.g., the upgrade is skipped on force init), it is dropped without its documents and created again, so that
+        # new entries are never indexed by the outdated schema
+        if self.index_is_outdated():
+            LOGGER.warning(f'Dropping outdated index {self.index_name}, it has no metadata fields')
+            self.__redis.client().ft(self.index_name).dropindex(delete_documents=False)
         try:
             self.__redis.client().ft(self.index_name).create_index(fields=schema, definition=definition)
         except ResponseError as e:
-            if e.args[0] == 'Index already exists':
-                return
-            raise e
+            if e.args[0] != 'Index already exists':
+                raise e
 
-    def get_save_pipeline(self, batch_size: int = 1000) -> BatchedPipeline:
+    def index_is_outdated(self) -> bool:
+        """Check if the existing index is created by previous versions without metadata fields, False if no index
+        """
+        try:
+            info: dict = self.__redis.client().ft(self.index_name).info()
+        except ResponseError:
+            return False
+        attributes: list = info.get('attributes', list())
+        return not any('path' in attribute for attribute in attributes)
+
+    def upgrade_index(self, entries: Iterable[tuple[str, dict]], batch_size: int = 1000) -> int:
+        """Upgrade an index created by previous versions, return the number of entries migrated
+        - Previous versions saved each entry as a bare vector on JSON root, every entry is rewritten to the current
+        shape with the vector in `vector` field and given metadata (see `make_metadata()`) as sibling fields
+        - `entries` are (UUID, metadata) of all embedded files, keys without a record are left as is, they are not
+        indexed by the new schema
+        - The index is re-created after all entries are migrated, so queries never see a mix of old and new entries
+        """
+        if not self.index_is_outdated():
+            return 0
+
+        LOGGER.warning(f'Index {self.index_name} has no metadata fields, migrating entries of namespace: {self.namespace}')
+        dimension: int = -1
+        migrated: int = 0
+
+        def migrate(batch: list[tuple[str, dict]], pipeline: BatchedPipeline):
+            nonlocal dimension, migrated
+            keys: list[str] = [f'{self.namespace}:{uuid}' for uuid, _ in batch]
+            # JSONPath `$` returns a list of matches for each key, None for missing keys
+            values: list = self.__redis.client().json().mget(keys, '$')
+            for key, (_, metadata), value in zip(keys, batch, values):
+                vector: object = value[0] if value else None
+                if not isinstance(vector, list):
+                    continue
+                dimension = len(vector)
+                pipeline.json_set(key, metadata | {'vector': vector})
+                migrated += 1
+
+        with self.get_save_pipeline(batch_size) as pipeline:
+            batch: list[tuple[str, dict]] = list()
+            for entry in entries:
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    migrate(batch, pipeline)
+                    batch = list()
+            if batch:
+                migrate(batch, pipeline)
+
+        if dimension != -1:
+            self.initialize_index(dimension)
+        else:
+            self.__redis.client().ft(self.index_name).dropindex(delete_documents=False)
+        LOGGER.warning(f'Index {self.index_name} upgraded, {migrated} entries migrated')
+        return migrated
+
+    def get_save_pipeline(self, batch_size: int = 1000, async_flush: bool = False) -> BatchedPipeline:
         """Get a batched save pipeline for vector DB
+        - With `async_flush`, full batches are sent by a background thread while the caller continues
         """
-        return self.__redis.batched_pipeline(batch_size)
+        return self.__redis.batched_pipeline(batch_size, async_flush=async_flush)
 
-    def add(self, uuid: str, embedding: list[float], pipeline: BatchedPipeline | None = None):
+    def add(self,
+            uuid: str,
+            embedding: list[float],
+            pipeline: BatchedPipeline | None = None,
+            metadata: dict | None = None):
         """Save given embedding to vector DB
+        - The entry is a JSON object with the embedding in `vector` field, metadata (path, filename, timestamp) are
+        saved as sibling fields for filtering
         """
+        obj: dict = (metadata or dict()) | {'vector': embedding}
         if pipeline:
-            pipeline.json_set(f'{self.namespace}:{uuid}', embedding)
+            pipeline.json_set(f'{self.namespace}:{uuid}', obj)
         else:
-            self.__redis.json_set(f'{self.namespace}:{uuid}', embedding)
+            self.__redis.json_set(f'{self.namespace}:{uuid}', obj)
+
+    def update_metadata(self, uuid: str, metadata: dict, pipeline: BatchedPipeline | None = None):
+        """Update metadata fields of given entry, the vector is kept
+        """
+        for field, value in metadata.items():
+            if pipeline:
+                pipeline.json_set(f'{self.namespace}:{uuid}', value, f'$.{field}')
+            else:
+                self.__redis.json_set(f'{self.namespace}:{uuid}', value, f'$.{field}')
 
     def remove(self, uuid: str, pipeline: BatchedPipeline | None = None):
         """Remove given embedding from vector DB
@@ -94,11 +226,12 @@ class RedisVectorDb:
         self.__redis.client().ft(self.index_name).dropindex()
         self.__redis.save()
 
-    def persist(self):
-        """Persist index to disk
+    def persist(self) -> PersistenceStatus:
+        """Persist index to disk in background
+        - Return the status of the background persistence, which can be waited on
         """
         LOGGER.info(f'Persisting Redis vector DB for namespace: {self.namespace}')
-        self.__redis.save()
+        return self.__redis.save()
 
     def get_search(self) -> Search:
         return self.__redis.client().ft(self.index_name)
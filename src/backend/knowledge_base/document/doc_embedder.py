@@ -4,36 +4,83 @@ import numpy as np
 import numpy.typing as npt
 import torch
 from constants.env import CROSS_ENCODER_MODEL, MODEL_FOLDER, TRANSFORMER_MODEL
+from knowledge_base.embedding_worker_pool import (EmbeddingPriority,
+                                                  EmbeddingWorkerPool,
+                                                  get_embedding_pool)
+from knowledge_base.micro_batcher import get_micro_batcher
+from knowledge_base.model_registry import MODEL_REGISTRY
 from loggers import doc_embedder_logger as LOGGER
 from loggers import log_time_cost
 from sentence_transformers import CrossEncoder, SentenceTransformer
 
 
 class DocEmbedder:
-    def __init__(self, lite_mode: bool = False):
-        transformer_path: str = os.path.join(MODEL_FOLDER, 'sentence_transformers', TRANSFORMER_MODEL)
-        cross_encoder_path: str = os.path.join(MODEL_FOLDER, CROSS_ENCODER_MODEL)
+    """Embed texts with sentence transformer, and rerank with cross-encoder
+    - Models are loaded from the process-wide model registry on first use, so creating an embedder is cheap, and all
+    embedders share the same loaded models
+    - If the embedding worker pool is enabled, text embedding without gradient runs in worker processes, reranking
+    with cross-encoder always runs in current process
+    """
+
+    # Number of texts in one forward pass of sentence transformer
+    ENCODE_BATCH_SIZE: int = 64
 
-        LOGGER.info(f'Initializing text embedder, loading transformers')
-        self.transformer: SentenceTransformer = SentenceTransformer(transformer_path)
-        self.cross_encoder: CrossEncoder | None = None
+    def __init__(self, lite_mode: bool = False):
+        self.__transformer_path: str = os.path.join(MODEL_FOLDER, 'sentence_transformers', TRANSFORMER_MODEL)
+        self.__cross_encoder_path: str = os.path.join(MODEL_FOLDER, CROSS_ENCODER_MODEL)
         # Lite mode will use transformer only (no cross-encoder) for all purposes, to reduce total model size
-        if not lite_mode and os.path.isdir(cross_encoder_path):
-            self.cross_encoder = CrossEncoder(cross_encoder_path, max_length=512)
+        self.__use_cross_encoder: bool = not lite_mode and os.path.isdir(self.__cross_encoder_path)
+
+    @property
+    def transformer(self) -> SentenceTransformer:
+        return MODEL_REGISTRY.get(f'sentence_transformer:{TRANSFORMER_MODEL}',
+                                  lambda: SentenceTransformer(self.__transformer_path))
+
+    @property
+    def cross_encoder(self) -> CrossEncoder | None:
+        if not self.__use_cross_encoder:
+            return None
+        return MODEL_REGISTRY.get(f'cross_encoder:{CROSS_ENCODER_MODEL}',
+                                  lambda: CrossEncoder(self.__cross_encoder_path, max_length=512))
 
     @log_time_cost(
         start_log='Embedding text',
         end_log='Text embedded',
         LOGGER=LOGGER
     )
-    def embed_text(self, text: str, use_grad: bool = False) -> np.ndarray:
+    def embed_text(self,
+                   text: str,
+                   use_grad: bool = False,
+                   priority: EmbeddingPriority = EmbeddingPriority.INTERACTIVE) -> np.ndarray:
+        """Embed the given text, `priority` is for the embedding worker pool, use bulk priority for document ingestion
+        - Concurrent interactive calls without gradient (i.e., queries) are embedded in one batch
+        """
+        if not use_grad and priority == EmbeddingPriority.INTERACTIVE:
+            return get_micro_batcher(f'doc_text:{TRANSFORMER_MODEL}', self.embed_texts).submit(text)
         if not use_grad:
-            with torch.no_grad():
-                feature: np.ndarray = self.transformer.encode(text)  # type: ignore
-        else:
-            feature: np.ndarray = self.transformer.encode(text)  # type: ignore
+            return self.embed_texts([text], priority)[0]
+
+        feature: np.ndarray = self.transformer.encode(text)  # type: ignore
         return feature.astype(np.float32)
 
+    def embed_texts(self,
+                    texts: list[str],
+                    priority: EmbeddingPriority = EmbeddingPriority.INTERACTIVE) -> np.ndarray:
+        """Embed the given texts, return a (N, D) float32 matrix in the order of given texts
+        - Texts are encoded in batches of `ENCODE_BATCH_SIZE`, `SentenceTransformer.encode()` sorts them by length
+        internally, so texts in the same batch have similar lengths and little padding
+        """
+        pool: EmbeddingWorkerPool | None = get_embedding_pool()
+        if pool:
+            return pool.embed_doc_texts(texts, priority)
+        if not texts:
+            return np.empty((0, self.transformer.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        with torch.no_grad():
+            features: np.ndarray = self.transformer.encode(texts, batch_size=DocEmbedder.ENCODE_BATCH_SIZE,  # type: ignore
+                                                           convert_to_numpy=True)
+        return features.astype(np.float32, copy=False)
+
     @log_time_cost(
         start_log='Predicting text similarity',
         end_log='Text similarity predicted',
@@ -0,0 +1,351 @@
+import atexit
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from threading import Condition, Lock, Thread
+from typing import Any
+
+import numpy as np
+from constants.env import EMBEDDING_WORKER_THREADS, EMBEDDING_WORKERS
+from loggers import logger as LOGGER
+from utils.containable_enum import ContainableEnum
+from utils.errors.embedder_errors import EmbedderError
+
+# Size of each worker's shared memory slots, a (16, 3, 224, 224) float32 batch of pixel values takes about 9.2MB
+INPUT_SLOT_BYTES: int = 64 * 1024 * 1024
+OUTPUT_SLOT_BYTES: int = 8 * 1024 * 1024
+# Seconds to wait for a worker process to exit on shutdown, before it is terminated
+WORKER_EXIT_TIMEOUT: int = 10
+
+# True in worker processes, so that embedders in workers run the models directly instead of submitting to a pool
+_IN_WORKER: bool = False
+
+
+class EmbeddingPriority(ContainableEnum):
+    """Define priority of embedding jobs, interactive jobs (e.g., queries) are always dispatched before bulk jobs (e.g.,
+    scans and document ingestion)
+    """
+    INTERACTIVE = 'interactive'
+    BULK = 'bulk'
+
+
+class JobKind(ContainableEnum):
+    IMAGE_PIXELS = 'image_pixels'
+    IMAGE_TEXTS = 'image_texts'
+    DOC_TEXTS = 'doc_texts'
+
+
+def _attach_shared_memory(name: str) -> SharedMemory:
+    """Attach to a shared memory block created by the parent process
+    - The block is owned by the parent, unregister it from the resource tracker, otherwise it is unlinked (or warned
+    as leaked) when the worker exits
+    """
+    shm: SharedMemory = SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, 'shared_memory')  # type: ignore
+    return shm
+
+
+def _worker_main(conn: Connection, input_name: str, output_name: str, threads: int):
+    """Entry of a worker process, it runs jobs sent by its dispatcher thread in the parent process one by one
+    - Tensors are passed through the shared memory slots, only job kind, shapes and texts are sent through the pipe
+    - Models are loaded on first use, from the model registry of the worker process
+    """
+    global _IN_WORKER
+    _IN_WORKER = True
+
+    import torch
+    from knowledge_base.document.doc_embedder import DocEmbedder
+    from knowledge_base.image.image_embedder import ImageEmbedder
+    torch.set_num_threads(threads)
+
+    input_shm: SharedMemory = _attach_shared_memory(input_name)
+    output_shm: SharedMemory = _attach_shared_memory(output_name)
+    image_embedder: ImageEmbedder = ImageEmbedder()
+    doc_embedder: DocEmbedder = DocEmbedder(lite_mode=True)
+    try:
+        while True:
+            try:
+                job: tuple[str, dict[str, Any]] | None = conn.recv()
+            except EOFError:
+                break
+            if job is None:
+                break
+
+            kind, args = job
+            try:
+                if kind == JobKind.IMAGE_PIXELS.value:
+                    pixel_values: np.ndarray = np.ndarray(args['shape'], dtype=np.float32, buffer=input_shm.buf)
+                    res: np.ndarray = image_embedder.embed_pixel_values(torch.from_numpy(pixel_values))
+                    del pixel_values
+                elif kind == JobKind.IMAGE_TEXTS.value:
+                    res: np.ndarray = image_embedder.embed_texts(args['texts'])
+                elif kind == JobKind.DOC_TEXTS.value:
+                    res: np.ndarray = doc_embedder.embed_texts(args['texts'])
+                else:
+                    raise EmbedderError(f'Unknown job kind: {kind}')
+
+                res = np.ascontiguousarray(res, dtype=np.float32)
+                if res.nbytes > output_shm.size:
+                    raise EmbedderError(f'Output too large for shared memory slot: {res.nbytes} bytes')
+                np.ndarray(res.shape, dtype=np.float32, buffer=output_shm.buf)[...] = res
+                conn.send((True, res.shape))
+            except Exception as e:
+                conn.send((False, str(e)))
+    finally:
+        input_shm.close()
+        output_shm.close()
+
+
+class _Job:
+    def __init__(self, kind: JobKind, args: dict[str, Any], pixel_values: np.ndarray | None = None):
+        self.kind: JobKind = kind
+        self.args: dict[str, Any] = args
+        self.pixel_values: np.ndarray | None = pixel_values
+        self.future: Future = Future()
+
+
+class _WorkerHandle:
+    """Parent side of a worker process, it owns the worker's shared memory slots and pipe
+    """
+
+    def __init__(self, index: int, threads: int, input_bytes: int, output_bytes: int):
+        context = multiprocessing.get_context('spawn')
+        self.input_shm: SharedMemory = SharedMemory(create=True, size=input_bytes)
+        self.output_shm: SharedMemory = SharedMemory(create=True, size=output_bytes)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main,
+                                       args=(child_conn, self.input_shm.name, self.output_shm.name, threads),
+                                       name=f'embedding-worker-{index}',
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def run(self, job: _Job) -> np.ndarray:
+        if job.pixel_values is not None:
+            if job.pixel_values.nbytes > self.input_shm.size:
+                raise EmbedderError(f'Input too large for shared memory slot: {job.pixel_values.nbytes} bytes')
+            np.ndarray(job.pixel_values.shape, dtype=np.float32, buffer=self.input_shm.buf)[...] = job.pixel_values
+
+        try:
+            self.conn.send((job.kind.value, job.args))
+            succeeded, res = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise EmbedderError(f'Embedding worker {self.process.name} exited: {e}')
+        if not succeeded:
+            raise EmbedderError(res)
+        return np.ndarray(res, dtype=np.float32, buffer=self.output_shm.buf).copy()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (EOFError, OSError):
+            pass
+        self.process.join(WORKER_EXIT_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+        for shm in (self.input_shm, self.output_shm):
+            shm.close()
+            shm.unlink()
+
+
+class EmbeddingWorkerPool:
+    """A pool of embedding worker processes, each of them holds its own model replicas
+    - Inference runs outside of current process, so it does not compete with gRPC and task threads for the GIL, and
+    each worker uses its own intra-op threads
+    - Each worker has an input and an output shared memory slot, pixel values and embeddings are copied through them
+    without pickling, and jobs are dispatched to a worker by its own dispatcher thread in current process
+    - Interactive jobs are dispatched before queued bulk jobs, and `reserved_interactive_workers` workers run
+    interactive jobs only, so query latency is not affected by a running scan
+    - Workers are started on first submit, each loads models on its first job of that kind
+    - `submit_*()` methods return a future, so a bulk caller can keep up to `bulk_concurrency` jobs in flight and use
+    all workers available to bulk jobs
+    """
+
+    def __init__(self,
+                 worker_count: int,
+                 threads_per_worker: int,
+                 reserved_interactive_workers: int = 1,
+                 input_slot_bytes: int = INPUT_SLOT_BYTES,
+                 output_slot_bytes: int = OUTPUT_SLOT_BYTES):
+        """
+        Args:
+            worker_count (int): Number of worker processes
+            threads_per_worker (int): Number of intra-op threads of torch in each worker
+            reserved_interactive_workers (int, optional): Number of workers for interactive jobs only, at least one
+            worker is left for bulk jobs. Defaults to 1.
+            input_slot_bytes (int, optional): Size of each worker's input slot, it limits the size of an image batch
+            output_slot_bytes (int, optional): Size of each worker's output slot
+        """
+        if worker_count <= 0:
+            raise EmbedderError(f'Invalid worker count: {worker_count}')
+        self.worker_count: int = worker_count
+        self.threads_per_worker: int = max(1, threads_per_worker)
+        self.reserved_interactive_workers: int = max(0, min(reserved_interactive_workers, worker_count - 1))
+        self.__input_slot_bytes: int = input_slot_bytes
+        self.__output_slot_bytes: int = output_slot_bytes
+
+        self.__workers: list[_WorkerHandle] = list()
+        self.__dispatchers: list[Thread] = list()
+        self.__interactive_jobs: deque[_Job] = deque()
+        self.__bulk_jobs: deque[_Job] = deque()
+        self.__condition: Condition = Condition()
+        self.__started: bool = False
+        self.__stopped: bool = False
+
+    @property
+    def bulk_concurrency(self) -> int:
+        """Number of workers which run bulk jobs, a bulk caller gains no throughput with more jobs in flight than this
+        """
+        return self.worker_count - self.reserved_interactive_workers
+
+    """
+    Private methods
+    """
+
+    def __start(self):
+        LOGGER.info(f'Starting {self.worker_count} embedding workers, threads per worker: {self.threads_per_worker}, '
+                    f'reserved for interactive jobs: {self.reserved_interactive_workers}')
+        for i in range(self.worker_count):
+            worker: _WorkerHandle = _WorkerHandle(i, self.threads_per_worker,
+                                                  self.__input_slot_bytes, self.__output_slot_bytes)
+            dispatcher: Thread = Thread(target=self.__dispatch,
+                                        args=(worker, i < self.reserved_interactive_workers),
+                                        name=f'embedding-dispatcher-{i}',
+                                        daemon=True)
+            self.__workers.append(worker)
+            self.__dispatchers.append(dispatcher)
+            dispatcher.start()
+        self.__started = True
+
+    def __next_job(self, interactive_only: bool) -> _Job | None:
+        with self.__condition:
+            while not self.__stopped:
+                if self.__interactive_jobs:
+                    return self.__interactive_jobs.popleft()
+                if not interactive_only and self.__bulk_jobs:
+                    return self.__bulk_jobs.popleft()
+                self.__condition.wait()
+            return None
+
+    def __dispatch(self, worker: _WorkerHandle, interactive_only: bool):
+        while job := self.__next_job(interactive_only):
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                job.future.set_result(worker.run(job))
+            except BaseException as e:
+                job.future.set_exception(e)
+
+    def __submit(self, job: _Job, priority: EmbeddingPriority) -> Future:
+        with self.__condition:
+            if self.__stopped:
+                raise EmbedderError('Embedding worker pool is shut down')
+            if not self.__started:
+                self.__start()
+            queue: deque[_Job] = self.__interactive_jobs if priority == EmbeddingPriority.INTERACTIVE \
+                else self.__bulk_jobs
+            queue.append(job)
+            self.__condition.notify_all()
+        return job.future
+
+    """
+    Public methods
+    """
+
+    def submit_pixel_values(self,
+                            pixel_values: np.ndarray,
+                            priority: EmbeddingPriority = EmbeddingPriority.BULK) -> Future:
+        """Submit a (N, 3, H, W) batch of preprocessed images to be embedded with CLIP, the future's result is a (N, D)
+        float32 matrix
+        """
+        pixel_values = np.ascontiguousarray(pixel_values, dtype=np.float32)
+        job: _Job = _Job(JobKind.IMAGE_PIXELS, {'shape': pixel_values.shape}, pixel_values)
+        return self.__submit(job, priority)
+
+    def submit_image_texts(self,
+                           texts: list[str],
+                           priority: EmbeddingPriority = EmbeddingPriority.INTERACTIVE) -> Future:
+        """Submit texts to be embedded with CLIP, the future's result is a (N, D) float32 matrix
+        """
+        return self.__submit(_Job(JobKind.IMAGE_TEXTS, {'texts': texts}), priority)
+
+    def submit_doc_texts(self,
+                         texts: list[str],
+                         priority: EmbeddingPriority = EmbeddingPriority.INTERACTIVE) -> Future:
+        """Submit texts to be embedded with sentence transformer, the future's result is a (N, D) float32 matrix
+        """
+        return self.__submit(_Job(JobKind.DOC_TEXTS, {'texts': texts}), priority)
+
+    def embed_pixel_values(self,
+                           pixel_values: np.ndarray,
+                           priority: EmbeddingPriority = EmbeddingPriority.BULK) -> np.ndarray:
+        """Embed a (N, 3, H, W) batch of preprocessed images with CLIP, return a (N, D) float32 matrix
+        """
+        return self.submit_pixel_values(pixel_values, priority).result()
+
+    def embed_image_texts(self,
+                          texts: list[str],
+                          priority: EmbeddingPriority = EmbeddingPriority.INTERACTIVE) -> np.ndarray:
+        """Embed texts with CLIP, return a (N, D) float32 matrix
+        """
+        return self.submit_image_texts(texts, priority).result()
+
+    def embed_doc_texts(self,
+                        texts: list[str],
+                        priority: EmbeddingPriority = EmbeddingPriority.INTERACTIVE) -> np.ndarray:
+        """Embed texts with sentence transformer, return a (N, D) float32 matrix
+        - Bulk texts are split into `bulk_concurrency` jobs which run in parallel, the result is in the order of given
+        texts
+        """
+        if priority != EmbeddingPriority.BULK or self.bulk_concurrency <= 1 or len(texts) <= 1:
+            return self.submit_doc_texts(texts, priority).result()
+
+        part_size: int = -(-len(texts) // self.bulk_concurrency)
+        futures: list[Future] = [self.submit_doc_texts(texts[i:i + part_size], priority)
+                                 for i in range(0, len(texts), part_size)]
+        return np.ascontiguousarray(np.concatenate([future.result() for future in futures]))
+
+    def shutdown(self):
+        """Stop all workers, queued jobs are failed
+        """
+        with self.__condition:
+            if self.__stopped:
+                return
+            self.__stopped = True
+            pending: list[_Job] = list(self.__interactive_jobs) + list(self.__bulk_jobs)
+            self.__interactive_jobs.clear()
+            self.__bulk_jobs.clear()
+            self.__condition.notify_all()
+
+        for job in pending:
+            job.future.set_exception(EmbedderError('Embedding worker pool is shut down'))
+        for dispatcher in self.__dispatchers:
+            dispatcher.join()
+        for worker in self.__workers:
+            worker.close()
+        LOGGER.info('Embedding workers stopped')
+
+
+_POOL: EmbeddingWorkerPool | None = None
+_POOL_LOCK: Lock = Lock()
+
+
+def get_embedding_pool() -> EmbeddingWorkerPool | None:
+    """Get the embedding worker pool of current process, None if the pool is disabled (`EMBEDDING_WORKERS` is 0) or
+    current process is a worker, in which case models should run in current process
+    """
+    global _POOL
+    if _IN_WORKER or EMBEDDING_WORKERS <= 0:
+        return None
+
+    with _POOL_LOCK:
+        if not _POOL:
+            threads: int = EMBEDDING_WORKER_THREADS or max(1, (os.cpu_count() or 1) // EMBEDDING_WORKERS)
+            _POOL = EmbeddingWorkerPool(EMBEDDING_WORKERS, threads)
+            atexit.register(_POOL.shutdown)
+        return _POOL
@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+import torch
+from constants.env import MODEL_FOLDER
+from loggers import img_embedder_logger as LOGGER
+from torch import Tensor, nn
+from transformers import CLIPModel
+from utils.containable_enum import ContainableEnum
+
+# Compiled models are cached in this folder under MODEL_FOLDER, each model has its own sub folder
+COMPILED_MODEL_FOLDER: str = '.compiled'
+# Text inputs of compiled text tower are padded to this fixed length, it is the max position of CLIP's text encoder
+TEXT_SEQUENCE_LENGTH: int = 77
+# Max allowed cosine distance (1 - cosine similarity) between compiled and eager embeddings, checked on build
+FP32_TOLERANCE: float = 1e-4
+INT8_TOLERANCE: float = 2e-2
+
+
+class ClipBackend(ContainableEnum):
+    """Define inference backends of CLIP towers
+    - EAGER runs the transformers model directly
+    - TORCHSCRIPT runs a traced and frozen module, it can be quantized to int8 dynamically for CPU
+    """
+    EAGER = 'eager'
+    TORCHSCRIPT = 'torchscript'
+
+
+class _VisionTower(nn.Module):
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model: CLIPModel = model
+
+    def forward(self, pixel_values: Tensor) -> Tensor:
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class _TextTower(nn.Module):
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model: CLIPModel = model
+
+    def forward(self, input_ids: Tensor, attention_mask: Tensor) -> Tensor:
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+def _artifact_path(model_name: str, tower: str, quantize: bool) -> str:
+    """Artifacts are tied to torch version, as TorchScript files are not portable across versions
+    """
+    suffix: str = '_int8' if quantize else ''
+    return os.path.join(MODEL_FOLDER, COMPILED_MODEL_FOLDER, model_name,
+                        f'{tower}{suffix}_torch-{torch.__version__}.pt')
+
+
+def _max_cosine_distance(actual: Tensor, expected: Tensor) -> float:
+    a: np.ndarray = actual.float().numpy()
+    b: np.ndarray = expected.float().numpy()
+    similarity: np.ndarray = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return float((1 - similarity).max())
+
+
+def _compile(tower: nn.Module,
+             example_inputs: tuple[Tensor, ...],
+             validation_inputs: tuple[Tensor, ...],
+             quantize: bool,
+             path: str) -> torch.jit.ScriptModule | None:
+    """Trace, freeze and save given tower, return None if its output does not match eager model's output
+    - Validation inputs should have a different batch size from example inputs, to check batch size is not traced as
+    a constant
+    """
+    tower.eval()
+    with torch.no_grad():
+        expected: Tensor = tower(*validation_inputs)
+        if quantize:
+            tower = torch.ao.quantization.quantize_dynamic(tower, {nn.Linear}, dtype=torch.qint8)
+        traced: torch.jit.ScriptModule = torch.jit.freeze(torch.jit.trace(tower, example_inputs, strict=False))
+        distance: float = _max_cosine_distance(traced(*validation_inputs), expected)
+
+    tolerance: float = INT8_TOLERANCE if quantize else FP32_TOLERANCE
+    if distance > tolerance:
+        LOGGER.warning(f'Compiled model does not match eager model, distance: {distance:.6f}, tolerance: {tolerance}')
+        return None
+
+    LOGGER.info(f'Compiled model validated, distance: {distance:.6f}, saving to: {path}')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path: str = f'{path}.tmp'
+    torch.jit.save(traced, temp_path)
+    os.replace(temp_path, path)
+    return traced
+
+
+def load_vision_tower(model: CLIPModel,
+                      model_name: str,
+                      image_size: int,
+                      quantize: bool = False) -> torch.jit.ScriptModule | None:
+    """Load the compiled vision tower of CLIP, compile and cache it under MODEL_FOLDER if it is not cached
+    - It maps a (N, 3, H, W) batch of preprocessed images to (N, D) image features, same as `get_image_features()`
+    - Return None if the model cannot be compiled, the caller should use eager model instead
+    """
+    path: str = _artifact_path(model_name, 'vision', quantize)
+    if os.path.isfile(path):
+        return torch.jit.load(path)
+
+    LOGGER.info(f'Compiling CLIP vision tower, int8: {quantize}')
+    generator: torch.Generator = torch.Generator().manual_seed(0)
+    try:
+        return _compile(_VisionTower(model),
+                        (torch.randn(2, 3, image_size, image_size, generator=generator),),
+                        (torch.randn(3, 3, image_size, image_size, generator=generator),),
+                        quantize, path)
+    except Exception as e:
+        LOGGER.warning(f'Failed to compile CLIP vision tower: {e}')
+        return None
+
+
+def load_text_tower(model: CLIPModel,
+                    model_name: str,
+                    sample_inputs: tuple[Tensor, Tensor],
+                    quantize: bool = False) -> torch.jit.ScriptModule | None:
+    """Load the compiled text tower of CLIP, compile and cache it under MODEL_FOLDER if it is not cached
+    - It maps (input IDs, attention mask) of shape (N, TEXT_SEQUENCE_LENGTH) to (N, D) text features, same as
+    `get_text_features()`, inputs must be padded to `TEXT_SEQUENCE_LENGTH`
+    - `sample_inputs` are tokenized sample texts with at least 2 rows, they are used for tracing and validation
+    - Return None if the model cannot be compiled, the caller should use eager model instead
+    """
+    path: str = _artifact_path(model_name, 'text', quantize)
+    if os.path.isfile(path):
+        return torch.jit.load(path)
+
+    LOGGER.info(f'Compiling CLIP text tower, int8: {quantize}')
+    input_ids, attention_mask = sample_inputs
+    try:
+        return _compile(_TextTower(model),
+                        (input_ids[:1], attention_mask[:1]),
+                        (input_ids, attention_mask),
+                        quantize, path)
+    except Exception as e:
+        LOGGER.warning(f'Failed to compile CLIP text tower: {e}')
+        return None
@@ -1,8 +1,18 @@
 import os
+from time import time
 
 import numpy as np
 import torch
-from constants.env import CLIP_MODEL, CLIP_MODEL_CHN, MODEL_FOLDER
+from constants.env import (CLIP_BACKEND, CLIP_INT8, CLIP_MODEL, CLIP_MODEL_CHN,
+                           MODEL_FOLDER)
+from knowledge_base.image.clip_compiled import (TEXT_SEQUENCE_LENGTH,
+                                                ClipBackend, load_text_tower,
+                                                load_vision_tower)
+from knowledge_base.embedding_worker_pool import (EmbeddingPriority,
+                                                  EmbeddingWorkerPool,
+                                                  get_embedding_pool)
+from knowledge_base.micro_batcher import MicroBatcher, get_micro_batcher
+from knowledge_base.model_registry import MODEL_REGISTRY
 from loggers import img_embedder_logger as LOGGER
 from loggers import log_time_cost
 from PIL import Image
@@ -15,31 +25,166 @@ from transformers.tokenization_utils_base import BatchEncoding
 
 class ImageEmbedder:
     """It maintains multiple CLIP models for different languages, and provides functionalities to embed images and texts
+    - Models are loaded from the process-wide model registry on first use, so creating an embedder is cheap, and all
+    embedders share the same loaded models
+    - Chinese CLIP is loaded only if it is used
+    - If the embedding worker pool is enabled, inference without gradient runs in worker processes, see
+    `EmbeddingWorkerPool`
+    - Concurrent `embed_text()` and `embed_image()` calls (e.g., queries) are batched by process-wide micro-batchers
+    - With TorchScript backend, image and text embeddings are computed by compiled (optionally int8 quantized) towers,
+    the eager model is used for gradient calculation, and as the fallback if the towers cannot be compiled
     """
 
-    def __init__(self):
-        model_path: str = os.path.join(MODEL_FOLDER, CLIP_MODEL)
-        model_path_cn: str = os.path.join(MODEL_FOLDER, CLIP_MODEL_CHN)
-
-        LOGGER.info(f'Initializing image embedder, loading CLIP models')
-        # Use CLIP to embed images
-        # - https://huggingface.co/docs/transformers/model_doc/clip
-        self.encoder: CLIPProcessor = CLIPProcessor.from_pretrained(model_path)
-        self.encoder_cn: ChineseCLIPProcessor = ChineseCLIPProcessor.from_pretrained(model_path_cn)
-        self.model: CLIPModel = CLIPModel.from_pretrained(model_path)  # type: ignore
-        self.tokenizer: CLIPTokenizer = CLIPTokenizer.from_pretrained(model_path)
-        self.model_cn: ChineseCLIPModel = ChineseCLIPModel.from_pretrained(model_path_cn)  # type: ignore
-
-    def __embed_image(self, img: Image.Image) -> np.ndarray:
-        # The batch size is set to 1, so the first element of the output is the embedding of the image
+    # Default number of images to be fed into CLIP model in one forward pass
+    DEFAULT_BATCH_SIZE: int = 16
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, backend: str = CLIP_BACKEND, int8: bool = CLIP_INT8):
+        """
+        Args:
+            batch_size (int, optional): Number of images to be fed into CLIP model in one forward pass
+            backend (str, optional): Inference backend of CLIP towers, see `ClipBackend`
+            int8 (bool, optional): If to quantize compiled towers to int8 dynamically, for TorchScript backend only
+        """
+        if backend not in ClipBackend:
+            raise ValueError(f'Invalid CLIP backend: {backend}')
+        self.batch_size: int = batch_size if batch_size > 0 else ImageEmbedder.DEFAULT_BATCH_SIZE
+        self.backend: ClipBackend = ClipBackend(backend)
+        self.int8: bool = int8
+        self.__model_path: str = os.path.join(MODEL_FOLDER, CLIP_MODEL)
+        self.__model_path_cn: str = os.path.join(MODEL_FOLDER, CLIP_MODEL_CHN)
+
+    # Use CLIP to embed images
+    # - https://huggingface.co/docs/transformers/model_doc/clip
+    @property
+    def encoder(self) -> CLIPProcessor:
+        return MODEL_REGISTRY.get(f'clip_processor:{CLIP_MODEL}', lambda: CLIPProcessor.from_pretrained(self.__model_path))
+
+    @property
+    def model(self) -> CLIPModel:
+        return MODEL_REGISTRY.get(f'clip:{CLIP_MODEL}', lambda: CLIPModel.from_pretrained(self.__model_path))
+
+    @property
+    def tokenizer(self) -> CLIPTokenizer:
+        return MODEL_REGISTRY.get(f'clip_tokenizer:{CLIP_MODEL}',
+                                  lambda: CLIPTokenizer.from_pretrained(self.__model_path))
+
+    @property
+    def encoder_cn(self) -> ChineseCLIPProcessor:
+        return MODEL_REGISTRY.get(f'clip_processor:{CLIP_MODEL_CHN}',
+                                  lambda: ChineseCLIPProcessor.from_pretrained(self.__model_path_cn))
+
+    @property
+    def model_cn(self) -> ChineseCLIPModel:
+        return MODEL_REGISTRY.get(f'clip:{CLIP_MODEL_CHN}',
+                                  lambda: ChineseCLIPModel.from_pretrained(self.__model_path_cn))
+
+    @property
+    def vision_tower(self) -> torch.jit.ScriptModule | None:
+        """Compiled vision tower, None for eager backend or if it cannot be compiled
+        """
+        if self.backend == ClipBackend.EAGER:
+            return None
+        # The eager backend is cached as a marker if the tower cannot be compiled, so it is not compiled again
+        tower: torch.jit.ScriptModule | ClipBackend = MODEL_REGISTRY.get(
+            f'clip_vision:{CLIP_MODEL}:{self.backend.value}:{"int8" if self.int8 else "fp32"}',
+            lambda: load_vision_tower(self.model, CLIP_MODEL, self.image_size, self.int8) or ClipBackend.EAGER)
+        return None if tower is ClipBackend.EAGER else tower  # type: ignore
+
+    @property
+    def text_tower(self) -> torch.jit.ScriptModule | None:
+        """Compiled text tower, None for eager backend or if it cannot be compiled
+        """
+        if self.backend == ClipBackend.EAGER:
+            return None
+        tower: torch.jit.ScriptModule | ClipBackend = MODEL_REGISTRY.get(
+            f'clip_text:{CLIP_MODEL}:{self.backend.value}:{"int8" if self.int8 else "fp32"}',
+            lambda: load_text_tower(self.model, CLIP_MODEL, self.__tokenize_fixed(['a photo of a cat', 'a diagram']),
+                                    self.int8) or ClipBackend.EAGER)
+        return None if tower is ClipBackend.EAGER else tower  # type: ignore
+
+    @property
+    def text_batcher(self) -> MicroBatcher:
+        return get_micro_batcher(f'clip_text:{CLIP_MODEL}:{self.backend.value}:{"int8" if self.int8 else "fp32"}',
+                                 self.embed_texts)
+
+    @property
+    def image_batcher(self) -> MicroBatcher:
+        return get_micro_batcher(f'clip_image:{CLIP_MODEL}:{self.backend.value}:{"int8" if self.int8 else "fp32"}',
+                                 self.embed_images)
+
+    @property
+    def image_size(self) -> int:
+        """The input size of CLIP model, images are resized by the shorter side to this size
+        """
+        size: dict = self.encoder.image_processor.size  # type: ignore
+        return size.get('shortest_edge', size.get('height', 224))
+
+    def __embed_pixel_values(self, pixel_values: Tensor) -> np.ndarray:
+        # Each row of the output is the embedding of the image at the same position
         # - https://huggingface.co/transformers/model_doc/clip.html#clipmodel
-        batch_size: int = 1
+        vision_tower: torch.jit.ScriptModule | None = self.vision_tower if not torch.is_grad_enabled() else None
+        if vision_tower is not None:
+            image_features: Tensor = vision_tower(pixel_values)
+        else:
+            image_features: Tensor = self.model.get_image_features(pixel_values)
+        return np.ascontiguousarray(image_features.numpy(), dtype=np.float32)
 
-        # Encode image as input for CLIP model, to get features
-        encoded: BatchEncoding = self.encoder(images=img, return_tensors="pt", padding=True)
-        image_features: Tensor = self.model.get_image_features(encoded.get('pixel_values'))[batch_size - 1]
-        feature: np.ndarray = image_features.numpy()
-        return feature.astype(np.float32)
+    def __tokenize_fixed(self, texts: list[str]) -> tuple[Tensor, Tensor]:
+        """Tokenize texts as compiled text tower's input, padded to the fixed length
+        """
+        encoded: BatchEncoding = self.encoder.tokenizer(texts, return_tensors="pt", padding='max_length',  # type: ignore
+                                                        max_length=TEXT_SEQUENCE_LENGTH, truncation=True)
+        return encoded.get('input_ids'), encoded.get('attention_mask')
+
+    def preprocess_image(self, img: Image.Image) -> Tensor:
+        """Resize, crop and normalize given image as CLIP's input, returns a (3, H, W) tensor
+        - This is CPU work without model inference, it is safe to be called from multiple threads
+        """
+        encoded: BatchEncoding = self.encoder.image_processor(images=img, return_tensors="pt")  # type: ignore
+        return encoded.get('pixel_values')[0]
+
+    def embed_pixel_values(self,
+                           pixel_values: Tensor,
+                           use_grad: bool = False,
+                           priority: EmbeddingPriority = EmbeddingPriority.BULK) -> np.ndarray:
+        """Embed a (N, 3, H, W) tensor of preprocessed images (see `preprocess_image()`) in one forward pass
+        - `priority` is for the embedding worker pool, it is bulk by default as this is used by scans
+        """
+        pool: EmbeddingWorkerPool | None = get_embedding_pool()
+        if pool and not use_grad:
+            return pool.embed_pixel_values(pixel_values.numpy(), priority)
+        if not use_grad:
+            with torch.no_grad():
+                return self.__embed_pixel_values(pixel_values)
+        return self.__embed_pixel_values(pixel_values)
+
+    def embed_images(self,
+                     imgs: list[Image.Image],
+                     batch_size: int | None = None,
+                     use_grad: bool = False,
+                     priority: EmbeddingPriority = EmbeddingPriority.INTERACTIVE) -> np.ndarray:
+        """Embed the given images in batches, return a contiguous float32 matrix with one row per image
+
+        Args:
+            imgs (list[Image.Image]): Images to be embedded
+            batch_size (int | None, optional): Number of images per forward pass, use embedder's batch size if not given
+            use_grad (bool, optional): If enable gradient calculation. Defaults to False.
+            priority (EmbeddingPriority, optional): Priority in embedding worker pool. Defaults to interactive.
+        """
+        if not imgs:
+            return np.empty((0, 0), dtype=np.float32)
+
+        batch_size = batch_size or self.batch_size
+        start: float = time()
+        features: list[np.ndarray] = list()
+        for i in range(0, len(imgs), batch_size):
+            # Encode images as input for CLIP model, to get features
+            encoded: BatchEncoding = self.encoder(images=imgs[i:i + batch_size], return_tensors="pt", padding=True)
+            features.append(self.embed_pixel_values(encoded.get('pixel_values'), use_grad, priority))
+        res: np.ndarray = features[0] if len(features) == 1 else np.ascontiguousarray(np.concatenate(features))
+        time_taken: float = time() - start
+        LOGGER.debug(f'{len(imgs)} images embedded with CLIP, batch size: {batch_size}, cost: {time_taken:.2f}s')
+        return res
 
     @log_time_cost(
         start_log='Embedding image with CLIP',
@@ -47,14 +192,12 @@ class ImageEmbedder:
         LOGGER=LOGGER
     )
     def embed_image(self, img: Image.Image, use_grad: bool = False) -> np.ndarray:
-        """Embed the given image
+        """Embed the given image, concurrent calls without gradient are embedded in one batch
         - About use_grad(): https://datascience.stackexchange.com/questions/32651/what-is-the-use-of-torch-no-grad-in-pytorch
         """
         if not use_grad:
-            with torch.no_grad():
-                return self.__embed_image(img)
-        else:
-            return self.__embed_image(img)
+            return self.image_batcher.submit(img)
+        return self.embed_images([img], batch_size=1, use_grad=use_grad)[0]
 
     def embed_image_as_list(self, img: Image.Image, use_grad: bool = False) -> list[float]:
         """Embed an image and return vector as list
@@ -74,18 +217,34 @@ class ImageEmbedder:
         LOGGER=LOGGER
     )
     def embed_text(self, text: str, use_grad: bool = False) -> np.ndarray:
-        """Embed the given text with CLIP model
+        """Embed the given text with CLIP model, return a (1, D) matrix
+        - Concurrent calls without gradient are embedded in one batch
         """
+        if not use_grad:
+            return self.text_batcher.submit(text)[np.newaxis]
+
         encoded: BatchEncoding = self.encoder(text, return_tensors="pt", padding=True)
         text_features: FloatTensor = self.model.get_text_features(**encoded)  # type: ignore
-
-        if not use_grad:
-            with torch.no_grad():
-                feature: np.ndarray = text_features.numpy()
-        else:
-            feature: np.ndarray = text_features.numpy()
+        feature: np.ndarray = text_features.detach().numpy()
         return feature.astype(np.float32)
 
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        """Embed the given texts with CLIP model in one forward pass, return a (N, D) float32 matrix
+        """
+        pool: EmbeddingWorkerPool | None = get_embedding_pool()
+        if pool:
+            return pool.embed_image_texts(texts)
+
+        with torch.no_grad():
+            text_tower: torch.jit.ScriptModule | None = self.text_tower
+            if text_tower is not None:
+                text_features: FloatTensor = text_tower(*self.__tokenize_fixed(texts))
+            else:
+                # Shorter texts are padded, CLIP's attention mask keeps their features the same as embedding them alone
+                encoded: BatchEncoding = self.encoder(text=texts, return_tensors="pt", padding=True)
+                text_features: FloatTensor = self.model.get_text_features(**encoded)  # type: ignore
+            return np.ascontiguousarray(text_features.numpy(), dtype=np.float32)
+
     @log_time_cost(
         start_log='Computing text-image similarity with CLIP',
         end_log='Text-image similarity computed with CLIP',
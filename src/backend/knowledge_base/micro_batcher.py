@@ -0,0 +1,161 @@
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Lock, Thread
+from time import time
+from typing import Any, Callable, Sequence
+
+from loggers import logger as LOGGER
+
+# Default max number of requests in one batch, and max time in milliseconds to wait for more requests to fill a batch
+DEFAULT_MAX_BATCH_SIZE: int = 16
+DEFAULT_MAX_WAIT_MS: int = 5
+# Number of recent requests kept for latency percentiles
+LATENCY_WINDOW: int = 1000
+
+
+class _Request:
+    def __init__(self, item: Any):
+        self.item: Any = item
+        self.submitted_on: float = time()
+        self.future: Future = Future()
+
+
+class MicroBatcher:
+    """Collect concurrent single-item requests into batches, run each batch with one call and fan the results out
+    - A single thread runs the batches, requests arriving during a batch are queued for the next one
+    - A lone request is run immediately, only if other requests are already queued (i.e., there is concurrent load),
+    the batcher waits up to `max_wait_ms` for more requests to fill the batch, so single-request latency is not affected
+    - `batch_fn` maps a list of items to a sequence of results in the same order, its error fails all requests of the
+    batch
+    """
+
+    def __init__(self,
+                 name: str,
+                 batch_fn: Callable[[list[Any]], Sequence[Any]],
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: int = DEFAULT_MAX_WAIT_MS):
+        self.name: str = name
+        self.max_batch_size: int = max(1, max_batch_size)
+        self.max_wait_ms: int = max(0, max_wait_ms)
+        self.__batch_fn: Callable[[list[Any]], Sequence[Any]] = batch_fn
+        self.__queue: deque[_Request] = deque()
+        self.__condition: Condition = Condition()
+        self.__worker: Thread | None = None
+
+        # Metrics
+        self.__metrics_lock: Lock = Lock()
+        self.__request_count: int = 0
+        self.__batch_count: int = 0
+        self.__max_batch_size_seen: int = 0
+        self.__latencies_ms: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    """
+    Private methods
+    """
+
+    def __next_batch(self) -> list[_Request]:
+        with self.__condition:
+            while not self.__queue:
+                self.__condition.wait()
+            batch: list[_Request] = [self.__queue.popleft()]
+            # Some requests are queued during last batch, linger for more to fill this batch
+            linger: bool = bool(self.__queue)
+            deadline: float = time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                if self.__queue:
+                    batch.append(self.__queue.popleft())
+                    continue
+                remaining: float = deadline - time()
+                if not linger or remaining <= 0:
+                    break
+                self.__condition.wait(remaining)
+            return batch
+
+    def __run(self):
+        while True:
+            batch: list[_Request] = self.__next_batch()
+            try:
+                results: Sequence[Any] = self.__batch_fn([request.item for request in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f'Batch function returned {len(results)} results for {len(batch)} requests')
+                for request, result in zip(batch, results):
+                    request.future.set_result(result)
+            except BaseException as e:
+                LOGGER.error(f'Micro-batch of {self.name} failed, size: {len(batch)}, error: {e}')
+                for request in batch:
+                    request.future.set_exception(e)
+
+            now: float = time()
+            with self.__metrics_lock:
+                self.__request_count += len(batch)
+                self.__batch_count += 1
+                self.__max_batch_size_seen = max(self.__max_batch_size_seen, len(batch))
+                self.__latencies_ms.extend((now - request.submitted_on) * 1000 for request in batch)
+
+    def __ensure_worker(self):
+        if self.__worker:
+            return
+        self.__worker = Thread(target=self.__run, name=f'micro-batcher-{self.name}', daemon=True)
+        self.__worker.start()
+
+    """
+    Public methods
+    """
+
+    def submit(self, item: Any) -> Any:
+        """Submit an item and block until its result is ready
+        """
+        request: _Request = _Request(item)
+        with self.__condition:
+            self.__ensure_worker()
+            self.__queue.append(request)
+            self.__condition.notify()
+        return request.future.result()
+
+    def get_metrics(self) -> dict:
+        """Get request count, batch count, batch sizes and latency percentiles (in milliseconds, of recent requests)
+        """
+        with self.__metrics_lock:
+            latencies: list[float] = sorted(self.__latencies_ms)
+            request_count: int = self.__request_count
+            batch_count: int = self.__batch_count
+            max_batch_size: int = self.__max_batch_size_seen
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2)
+
+        return {
+            'name': self.name,
+            'requests': request_count,
+            'batches': batch_count,
+            'avg_batch_size': round(request_count / batch_count, 2) if batch_count else 0,
+            'max_batch_size': max_batch_size,
+            'latency_p50_ms': percentile(0.5),
+            'latency_p95_ms': percentile(0.95),
+            'latency_p99_ms': percentile(0.99),
+        }
+
+
+_BATCHERS: dict[str, MicroBatcher] = dict()
+_BATCHERS_LOCK: Lock = Lock()
+
+
+def get_micro_batcher(name: str, batch_fn: Callable[[list[Any]], Sequence[Any]]) -> MicroBatcher:
+    """Get the process-wide batcher of given name, create it with `batch_fn` if it does not exist
+    - Requests of the same name are batched together regardless of which embedder submits them, so the name must
+    identify the model and its settings
+    """
+    with _BATCHERS_LOCK:
+        batcher: MicroBatcher | None = _BATCHERS.get(name)
+        if not batcher:
+            batcher = MicroBatcher(name, batch_fn)
+            _BATCHERS[name] = batcher
+        return batcher
+
+
+def get_all_metrics() -> list[dict]:
+    with _BATCHERS_LOCK:
+        batchers: list[MicroBatcher] = list(_BATCHERS.values())
+    return [batcher.get_metrics() for batcher in batchers]
@@ -0,0 +1,142 @@
+import gc
+from threading import Event, Lock, Thread
+from time import time
+from typing import Any, Callable
+
+from constants.env import MODEL_IDLE_TIMEOUT_SECONDS
+from loggers import logger as LOGGER
+
+
+class _ModelEntry:
+    """A model slot in the registry, `model` is None if it is not loaded yet or has been unloaded
+    """
+
+    def __init__(self):
+        self.model: Any = None
+        self.last_used: float = time()
+        # Serialize loading of the same model only, loading of other models is not blocked
+        self.lock: Lock = Lock()
+
+
+class ModelRegistry:
+    """A process-wide registry of models, it loads each model lazily on its first use and shares it with all users
+    - A model is identified by a key, e.g., `clip:<model name>`, and is loaded by the loader given on `get()`
+    - Concurrent first uses of a model load it only once
+    - Models which are not used for `idle_timeout` seconds are unloaded by a background thread, and are loaded again on
+    next use, set `idle_timeout` to 0 to keep models loaded forever
+    - Users should call `get()` on every use instead of keeping the model, otherwise an unloaded model is not freed
+    """
+
+    def __init__(self, idle_timeout: int = MODEL_IDLE_TIMEOUT_SECONDS, check_interval: int = 60):
+        self.idle_timeout: int = idle_timeout
+        self.check_interval: int = check_interval
+        self.__entries: dict[str, _ModelEntry] = dict()
+        self.__lock: Lock = Lock()
+        self.__stop_event: Event = Event()
+        self.__reaper: Thread | None = None
+
+    """
+    Private methods
+    """
+
+    def __get_entry(self, key: str) -> _ModelEntry:
+        with self.__lock:
+            entry: _ModelEntry | None = self.__entries.get(key)
+            if not entry:
+                entry = _ModelEntry()
+                self.__entries[key] = entry
+            return entry
+
+    def __ensure_reaper(self):
+        if self.idle_timeout <= 0:
+            return
+        with self.__lock:
+            if self.__reaper and self.__reaper.is_alive():
+                return
+            self.__stop_event.clear()
+            self.__reaper = Thread(target=self.__reap, name='model-registry-reaper', daemon=True)
+            self.__reaper.start()
+
+    def __unload(self, key: str, idle_since: float | None = None) -> bool:
+        """Unload the model of given key, if `idle_since` is given, the model is kept if it is used after that time
+        """
+        with self.__lock:
+            entry: _ModelEntry | None = self.__entries.get(key)
+        if not entry:
+            return False
+
+        with entry.lock:
+            if entry.model is None or (idle_since is not None and entry.last_used > idle_since):
+                return False
+            entry.model = None
+        gc.collect()
+        LOGGER.info(f'Model unloaded: {key}')
+        return True
+
+    def __reap(self):
+        while not self.__stop_event.wait(self.check_interval):
+            self.unload_idle()
+
+    """
+    Public methods
+    """
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Get the model of given key, load it with `loader` if it is not loaded
+        """
+        entry: _ModelEntry = self.__get_entry(key)
+        entry.last_used = time()
+        model: Any = entry.model
+        if model is not None:
+            return model
+
+        with entry.lock:
+            if entry.model is None:
+                LOGGER.info(f'Loading model: {key}')
+                start: float = time()
+                entry.model = loader()
+                LOGGER.info(f'Model loaded: {key}, cost: {time() - start:.2f}s')
+            entry.last_used = time()
+            model = entry.model
+        self.__ensure_reaper()
+        return model
+
+    def is_loaded(self, key: str) -> bool:
+        with self.__lock:
+            entry: _ModelEntry | None = self.__entries.get(key)
+        return entry is not None and entry.model is not None
+
+    def unload(self, key: str) -> bool:
+        """Unload the model of given key, return False if it is not loaded
+        """
+        return self.__unload(key)
+
+    def unload_idle(self) -> list[str]:
+        """Unload models which are not used for `idle_timeout` seconds, return their keys
+        """
+        if self.idle_timeout <= 0:
+            return list()
+
+        idle_since: float = time() - self.idle_timeout
+        with self.__lock:
+            idle_keys: list[str] = [key for key, entry in self.__entries.items()
+                                    if entry.model is not None and entry.last_used <= idle_since]
+        return [key for key in idle_keys if self.__unload(key, idle_since)]
+
+    def unload_all(self):
+        with self.__lock:
+            keys: list[str] = list(self.__entries.keys())
+        for key in keys:
+            self.unload(key)
+
+    def stop(self):
+        """Stop the background thread for unloading idle models, loaded models are kept
+        """
+        self.__stop_event.set()
+        if self.__reaper:
+            self.__reaper.join()
+            self.__reaper = None
+
+
+# The registry shared by all libraries and tasks in current process
+MODEL_REGISTRY: ModelRegistry = ModelRegistry()
@@ -8,6 +8,7 @@ import numpy as np
 import numpy.typing as npt
 from constants.lib_constants import LibTypes
 from knowledge_base.document.doc_embedder import DocEmbedder
+from knowledge_base.embedding_worker_pool import EmbeddingPriority
 from library.document.doc_lib_vector_db import DocLibVectorDb
 from library.document.doc_provider_base import DocProviderBase
 from library.document.sql import DB_NAME
@@ -27,6 +28,9 @@ from faiss import IndexFlatL2, IndexIVFFlat  # Put faiss import AFTER sentence_t
 
 D = TypeVar('D', bound=DocProviderBase)
 
+# Suffix of the temp file of memory-mapped embedding buffer, it is deleted once the index is built
+EMBEDDING_BUFFER_SUFFIX: str = '.embeddings.tmp'
+
 
 class DocumentLib(Generic[D], LibraryBase):
     """Define a generic document library
@@ -36,6 +40,13 @@ class DocumentLib(Generic[D], LibraryBase):
     - A document library can only have one active document at a time
     """
 
+    LIB_TYPE: str = LibTypes.DOCUMENT.value
+    # Number of rows read from DB and embedded in one call on document initialization
+    EMBEDDING_CHUNK_SIZE: int = 1024
+    # Embeddings of IVF documents are buffered in memory on initialization, or in a memory-mapped file under library
+    # data folder if the buffer is larger than given bytes
+    MEMMAP_THRESHOLD_BYTES: int = 512 * 1024 * 1024
+
     def __init__(self,
                  lib_path: str,
                  lib_name: str,
@@ -115,50 +126,71 @@ class DocumentLib(Generic[D], LibraryBase):
                 use_IVF: bool = total > 7020
                 self.__vector_db = DocLibVectorDb(self._path_lib_data, uuid)
 
-                embedding_list: list[npt.ArrayLike] = list()
+                # For IVF case, embeddings are written to a preallocated buffer for training, it is allocated on first
+                # chunk when the dimension is known
+                buffer: np.ndarray | None = None
+                buffer_path: str = os.path.join(self._path_lib_data, f'{uuid}{EMBEDDING_BUFFER_SUFFIX}')
+                processed: int = 0
                 previous_progress: int = -1
                 first_round: bool = True
                 start: float = time()
 
-                LOGGER.info(f'Total records: {total}, start embedding')
-                for i, row in enumerate(self.__doc_provider.get_all_records()):
-                    if cancel_event and cancel_event.is_set():
-                        LOGGER.info('Embedding cancelled')
-                        raise TaskCancellationException('Library initialization cancelled')
-
-                    # If reporter is given, report progress to task manager
-                    # - Reduce report frequency, only report when progress changes
-                    current_progress: int = int(i / total * 100)
-                    if current_progress > previous_progress:
-                        previous_progress = current_progress
-                        report_progress(progress_reporter, current_progress, current_phase=2, phase_name='EMBEDDING')
-
-                    key_text: str = self.__doc_provider.get_key_text_from_record(row)
-                    embedding: np.ndarray = self.__embedder.embed_text(key_text)  # type: ignore
-
-                    # For IVF case, save all embeddings for further training
-                    if use_IVF:
-                        embedding_list.append(embedding)
-                        continue
-
-                    # For non-IVF (Flat) case, add embedding to index directly
-                    if first_round:
-                        first_round = False
-                        dimension: int = embedding.size
-                        self.__vector_db.initialize_index(dimension, training_set=None)
-                    self.__vector_db.add(None, embedding.tolist())
-
-                if use_IVF:
-                    # "ndarray.shape" is used to get the dimension of a matrix, the type is tuple
-                    # The length of the tuple is the dimension of the array, and each element represents the length of the array in that dimension:
-                    # - For a 2D matrix, the shape is a tuple of length 2: shape[0] is the number of rows, shape[1] is the number of columns
-                    # - For example: self.embeddings.shape is (1232, 76), which means there are 1232 texts, and each text is converted to a 76-dimension vector
-                    embeddings: np.ndarray = np.asarray(embedding_list)
-                    text_count: int = embeddings.shape[0]
-                    dimension: int = embeddings.shape[1]
-                    LOGGER.info(f'Building index with dimension {dimension}')
-                    self.__vector_db.initialize_index(dimension, training_set=embeddings, dataset_size=text_count)
-                    LOGGER.info('Index built')
+                try:
+                    # Rows are read and embedded in chunks, each chunk is encoded in length-sorted batches by the embedder
+                    LOGGER.info(f'Total records: {total}, start embedding')
+                    for rows in self.__doc_provider.iterate_records(DocumentLib.EMBEDDING_CHUNK_SIZE):
+                        if cancel_event and cancel_event.is_set():
+                            LOGGER.info('Embedding cancelled')
+                            raise TaskCancellationException('Library initialization cancelled')
+
+                        # If reporter is given, report progress to task manager
+                        # - Reduce report frequency, only report when progress changes
+                        current_progress: int = int(processed / total * 100)
+                        if current_progress > previous_progress:
+                            previous_progress = current_progress
+                            report_progress(progress_reporter, current_progress, current_phase=2, phase_name='EMBEDDING')
+
+                        key_texts: list[str] = [self.__doc_provider.get_key_text_from_record(row) for row in rows]
+                        embeddings: np.ndarray = self.__embedder.embed_texts(key_texts,  # type: ignore
+                                                                             priority=EmbeddingPriority.BULK)
+
+                        # For IVF case, save all embeddings to the buffer for further training
+                        if use_IVF:
+                            if buffer is None:
+                                buffer = self.__allocate_embedding_buffer(buffer_path, total, embeddings.shape[1])
+                            if processed + len(rows) > total:
+                                raise LibraryError(f'Document has more records than expected: {total}')
+                            buffer[processed:processed + len(rows)] = embeddings
+                            processed += len(rows)
+                            continue
+
+                        # For non-IVF (Flat) case, add embeddings to index directly, in row order
+                        if first_round:
+                            first_round = False
+                            dimension: int = embeddings.shape[1]
+                            self.__vector_db.initialize_index(dimension, training_set=None)
+                        self.__vector_db.add_many(embeddings)
+                        processed += len(rows)
+
+                    if use_IVF and buffer is not None:
+                        # "ndarray.shape" is used to get the dimension of a matrix, the type is tuple
+                        # The length of the tuple is the dimension of the array, and each element represents the length of the array in that dimension:
+                        # - For a 2D matrix, the shape is a tuple of length 2: shape[0] is the number of rows, shape[1] is the number of columns
+                        # - For example: self.embeddings.shape is (1232, 76), which means there are 1232 texts, and each text is converted to a 76-dimension vector
+                        dimension: int = buffer.shape[1]
+                        LOGGER.info(f'Building index with dimension {dimension}')
+                        self.__vector_db.initialize_index(dimension, training_set=buffer[:processed],
+                                                          dataset_size=processed, progress_reporter=progress_reporter,
+                                                          progress_phase=3)
+                        LOGGER.info('Index built')
+                    else:
+                        # Flat index is built while adding embeddings, so its indexing phase is finished here
+                        report_progress(progress_reporter, 100, current_phase=3, phase_name='INDEXING')
+                finally:
+                    # Drop the reference first, a memory-mapped file cannot be deleted while it is mapped on Windows
+                    buffer = None
+                    if os.path.isfile(buffer_path):
+                        os.remove(buffer_path)
 
                 self.__vector_db.persist()
 
@@ -168,6 +200,17 @@ class DocumentLib(Generic[D], LibraryBase):
             self._embedding_table.insert_row((timestamp, 0, uuid, relative_path))
             LOGGER.info(f'Document initialization finished for {relative_path}, cost: {time_taken:.2f}s')
 
+    def __allocate_embedding_buffer(self, path: str, count: int, dimension: int) -> np.ndarray:
+        """Allocate a (count, dimension) float32 buffer for embeddings, it is a memory-mapped file at given path if it
+        is larger than `MEMMAP_THRESHOLD_BYTES`, so the memory used for a large document is bounded by the OS page cache
+        """
+        size: int = count * dimension * np.dtype(np.float32).itemsize
+        if size <= DocumentLib.MEMMAP_THRESHOLD_BYTES:
+            return np.empty((count, dimension), dtype=np.float32)
+
+        LOGGER.info(f'Embedding buffer is memory-mapped, size: {size / 1024 / 1024:.0f}MB, path: {path}')
+        return np.memmap(path, dtype=np.float32, mode='w+', shape=(count, dimension))
+
     def __retrieve(self, text: str, top_k: int = 10) -> list[tuple]:
         """Get top_k most similar candidates under the given document (relative path)
         """
@@ -181,7 +224,7 @@ class DocumentLib(Generic[D], LibraryBase):
         LOGGER.info(f'Retrieving {top_k} candidates for {text}')
         query_embedding: np.ndarray = self.__embedder.embed_text(text)  # type: ignore
         ids: list[np.int64] = self.__vector_db.query(np.asarray([query_embedding]), top_k)
-        res: list[tuple] = list()
+        row_ids: list[int] = list()
 
         for i64 in ids:
             # If number of candidates is lesser than top_k, then the rest IDs are all -1
@@ -190,10 +233,8 @@ class DocumentLib(Generic[D], LibraryBase):
                 break
 
             # in-mem index's ID starts from 0 but DB's ID column starts from 1, plus 1
-            record: tuple | None = self.__doc_provider.get_record_by_id(i + 1)
-            if record:
-                res.append(record)
-        return res
+            row_ids.append(i + 1)
+        return self.__doc_provider.get_records_by_ids(row_ids)
 
     def __rerank(self, text: str, candidate_rows: list[tuple]) -> list[tuple]:
         if not self.__doc_provider:
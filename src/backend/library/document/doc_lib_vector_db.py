@@ -1,5 +1,6 @@
 import os
 from functools import wraps
+from typing import Callable
 
 import numpy as np
 from constants.lib_constants import INDEX_FOLDER
@@ -36,15 +37,22 @@ class DocLibVectorDb:
                                                                 index_filename=idx_file)
 
     @ensure_vector_db_connected
-    def initialize_index(self, vector_dimension: int, training_set: np.ndarray | None, dataset_size: int = -1):
+    def initialize_index(self,
+                         vector_dimension: int,
+                         training_set: np.ndarray | None,
+                         dataset_size: int = -1,
+                         progress_reporter: Callable[[int, int, str | None], None] | None = None,
+                         progress_phase: int = 1):
         LOGGER.info(f'Initializing index for DocLibVectorDb')
         self.mem_vector_db.initialize_index(vector_dimension,
                                             training_set=training_set,
                                             training_set_uuid_list=None,  # No need to track ID for document library
-                                            expected_dataset_size=dataset_size)
+                                            expected_dataset_size=dataset_size,
+                                            progress_reporter=progress_reporter,
+                                            progress_phase=progress_phase)
 
     @ensure_vector_db_connected
-    def get_save_pipeline(self, batch_size: int = 1000) -> BatchedPipeline:
+    def get_save_pipeline(self, batch_size: int = 1000, async_flush: bool = False) -> BatchedPipeline:
         raise NotImplementedError('In-memory vector DB does not support batched pipeline')
 
     @ensure_vector_db_connected
@@ -52,6 +60,11 @@ class DocLibVectorDb:
         LOGGER.debug(f'Adding embedding to vector DB')
         self.mem_vector_db.add(uuid, embedding)
 
+    @ensure_vector_db_connected
+    def add_many(self, embeddings: np.ndarray):
+        LOGGER.debug(f'Adding {len(embeddings)} embeddings to vector DB')
+        self.mem_vector_db.add_many(embeddings)
+
     @ensure_vector_db_connected
     def remove(self, uuid: str):
         LOGGER.debug(f'Removing embedding from vector DB')
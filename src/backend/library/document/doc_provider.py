@@ -143,19 +143,21 @@ class DocProvider(DocProviderBase[DocContentTable]):
         timestamp: datetime = datetime.now()
         previous_progress: int = -1
         i: int = 0
-        for line, current_progress in reader(doc_path):
-            i += 1
-            if not line:
-                continue
-
-            # If reporter is given, report progress to task manager
-            # - Reduce report frequency, only report when progress changes
-            if current_progress > previous_progress:
-                previous_progress = current_progress
-                report_progress(self._progress_reporter, current_progress, current_phase=1, phase_name='DUMP')
-
-            # (timestamp, text)
-            self._doc_content_table.insert_row((timestamp, line))
+        # Lines are inserted in batches, instead of one transaction per line
+        with self._doc_content_table.write_batch(max_rows=5000):
+            for line, current_progress in reader(doc_path):
+                i += 1
+                if not line:
+                    continue
+
+                # If reporter is given, report progress to task manager
+                # - Reduce report frequency, only report when progress changes
+                if current_progress > previous_progress:
+                    previous_progress = current_progress
+                    report_progress(self._progress_reporter, current_progress, current_phase=1, phase_name='DUMP')
+
+                # (timestamp, text)
+                self._doc_content_table.insert_row((timestamp, line))
 
         time_taken: float = time() - start
         LOGGER.info(f'Finished processing document: {doc_path}, cost: {time_taken:.2f}s')
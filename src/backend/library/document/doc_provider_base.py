@@ -1,5 +1,5 @@
 from sqlite3 import Cursor
-from typing import Callable, Generic, Type, TypeVar
+from typing import Callable, Generator, Generic, Type, TypeVar
 
 from db.sqlite.table import SqliteTable
 from loggers import doc_lib_logger as LOGGER
@@ -66,6 +66,11 @@ class DocProviderBase(Generic[T]):
         row: tuple | None = self._doc_content_table.select_row(id)
         return row
 
+    def get_records_by_ids(self, ids: list[int]) -> list[tuple]:
+        """Get lines/segments by IDs in one statement, in table row format and in the order of given IDs
+        """
+        return self._doc_content_table.select_rows(ids)
+
     def get_all_records(self, order_by: str = 'id', asc: bool = True) -> list[tuple]:
         """Get all lines/segments, in table row format
         """
@@ -75,6 +80,13 @@ class DocProviderBase(Generic[T]):
             return list()
         return rows
 
+    def iterate_records(self, chunk_size: int, order_by: str = 'id', asc: bool = True) -> Generator[list[tuple], None, None]:
+        """Get all lines/segments in chunks of table rows, rows are fetched from DB chunk by chunk
+        """
+        cursor: Cursor = self._doc_content_table.select_many(order_by=order_by, asc=asc)
+        while rows := cursor.fetchmany(chunk_size):
+            yield rows
+
     def get_records_by_column(self, **kwargs) -> list[tuple]:
         """Get lines/segments by specific columns defined in the table, in table row format
         """
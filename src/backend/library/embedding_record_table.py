@@ -1,3 +1,4 @@
+import os
 from datetime import datetime
 from sqlite3 import Cursor
 
@@ -44,6 +45,13 @@ class EmbeddingRecordTable(SqliteTable):
         cur.execute(select_by_uuid_sql(ongoing), (uuid,))
         return cur.fetchone()
 
+    @ensure_db
+    def select_by_uuids(self, uuids: list[str], columns: list[str] | None = None, ongoing: bool | None = None) -> list[tuple]:
+        """Select rows by UUIDs in one statement, rows are in the order of given UUIDs, see `_select_by_keys()`
+        - Only given columns are selected if `columns` is given, otherwise rows are in table row format
+        """
+        return self._select_by_keys(uuids, lambda count: select_by_uuids_sql(count, columns, ongoing))
+
     @ensure_db
     def relative_path_exists(self, relative_path: str, ongoing: bool | None = None) -> bool:
         return self.select_by_relative_path(relative_path, ongoing) is not None
@@ -80,37 +88,59 @@ class EmbeddingRecordTable(SqliteTable):
         cur.execute(select_all_sql(ongoing))
         return cur.fetchall()
 
+    @ensure_db
+    def get_relative_paths_under(self, folder_relative_path: str) -> list[str]:
+        """Get the relative paths of all embedded files under given folder (recursively)
+        - It is a range query on the relative path index, e.g., `a/` <= path < `a0` as '0' is next to '/'
+        """
+        start: str = folder_relative_path.rstrip(os.sep) + os.sep
+        end: str = start[:-1] + chr(ord(os.sep) + 1)
+        cur: Cursor = self.db.cursor()
+        cur.execute(select_relative_paths_in_range_sql(), (start, end))
+        return [row[0] for row in cur.fetchall()]
+
+    @ensure_db
+    def get_uuids_after(self, row_id: int) -> list[str]:
+        """Get the UUIDs of records inserted after given row ID
+        """
+        cur: Cursor = self.db.cursor()
+        cur.execute(select_uuids_after_id_sql(), (row_id,))
+        return [row[0] for row in cur.fetchall()]
+
     @ensure_db
     def update_record_by_relative_path(self, new_relative_path: str, old_relative_path: str) -> bool:
         cur: Cursor = self.db.cursor()
         cur.execute(update_relative_path_by_relative_path_sql(False), (new_relative_path, old_relative_path))
-        self.db.commit()
+        self._commit()
         return cur.rowcount > 0
 
     @ensure_db
     def update_record_by_uuid(self, new_relative_path: str, uuid: str) -> bool:
         cur: Cursor = self.db.cursor()
         cur.execute(update_relative_path_by_uuid_sql(False), (new_relative_path, uuid))
-        self.db.commit()
+        self._commit()
         return cur.rowcount > 0
 
     @ensure_db
     def delete_by_uuid(self, uuid: str, ongoing: bool | None = None) -> bool:
         cur: Cursor = self.db.cursor()
         cur.execute(delete_by_uuid_sql(ongoing), (uuid,))
-        self.db.commit()
+        self._commit()
         return cur.rowcount > 0
 
     @ensure_db
     def delete_by_relative_path(self, path: str, ongoing: bool | None = None) -> bool:
         cur: Cursor = self.db.cursor()
         cur.execute(delete_by_relative_path_sql(ongoing), (path,))
-        self.db.commit()
+        self._commit()
         return cur.rowcount > 0
 
 
 class OngoingEmbeddingManager:
     """Maintain an automatic embedding record tracker for a long-executed on going embedding operation
+    - The ongoing record is always committed on enter, even if there is an active write batch, so that an interrupted
+    embedding can be found after a crash
+    - On exit, removing the record joins the active write batch if any
     """
 
     def __init__(self, table: EmbeddingRecordTable, relative_path: str, uuid: str):
@@ -122,7 +152,10 @@ class OngoingEmbeddingManager:
         # On enter, add the given relative path and uuid to ongoing records
         LOGGER.info(f'Add ongoing embedding info: {self.relative_path} - {self.uuid}')
         # (timestamp, ongoing=1, uuid, relative_path)
-        return self.table.insert_row((datetime.now(), 1, self.uuid, self.relative_path))
+        row_id: int | None = self.table.insert_row((datetime.now(), 1, self.uuid, self.relative_path))
+        if self.table.write_batch_ctx:
+            self.table.write_batch_ctx.commit()
+        return row_id
 
     def __exit__(self, exc_type, exc_value, traceback):
         # On exit, remove the given relative path and uuid from ongoing records
@@ -0,0 +1,62 @@
+from sqlite3 import Cursor
+from threading import Lock
+
+import numpy as np
+from db.sqlite.sql_basic import *
+from db.sqlite.table import SqliteTable, ensure_db
+from library.image.sql import *
+
+
+class EmbeddingStoreTable(SqliteTable):
+    """A content-addressed embedding store, it maps `<model name>:<file hash>` to the embedding of the file
+    - Byte-identical files share one embedding, so the model inference is done only once for all copies
+    - Embeddings are stored as float32 bytes
+    - Entries are never removed, an entry is still valid after the file is deleted, as long as the model is not changed
+    - The store can be shared by multiple libraries, so the access is serialized by a lock as the decode stage of scan
+    pipeline reads it from multiple threads
+    """
+
+    # Row format: (id, content_key, embedding)
+    TABLE_STRUCTURE: list[list[str]] = [
+        ['id', 'INTEGER PRIMARY KEY'],
+        ['content_key', 'TEXT NOT NULL'],
+        ['embedding', 'BLOB NOT NULL'],
+    ]
+
+    def __init__(self, db_path: str):
+        super().__init__(db_path, EMBEDDING_STORE_TABLE_NAME)
+        self.__lock: Lock = Lock()
+
+        cursor = self.db.cursor()
+        cursor.execute(initialize_table_sql(
+            table_name=EMBEDDING_STORE_TABLE_NAME,
+            table_structure=self.TABLE_STRUCTURE
+        ))
+        cursor.execute(create_unique_index_sql(self.table_name, 'content_key'))
+        self.db.commit()
+
+    @staticmethod
+    def make_content_key(model_name: str, content_hash: str) -> str:
+        return f'{model_name}:{content_hash}'
+
+    @ensure_db
+    def get_embedding(self, content_key: str) -> list[float] | None:
+        with self.__lock:
+            cur: Cursor = self.db.cursor()
+            cur.execute(select_embedding_by_content_key_sql(), (content_key,))
+            row: tuple | None = cur.fetchone()
+        if not row:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    @ensure_db
+    def put_embeddings(self, entries: list[tuple[str, list[float]]]):
+        """Save a batch of (content key, embedding) in one transaction, existing keys are ignored
+        """
+        if not entries:
+            return
+        with self.__lock:
+            cur: Cursor = self.db.cursor()
+            cur.executemany(insert_embedding_ignore_sql(),
+                            [(key, np.asarray(embedding, dtype=np.float32).tobytes()) for key, embedding in entries])
+            self.db.commit()
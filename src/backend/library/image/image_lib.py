@@ -1,17 +1,30 @@
 import os
 import shutil
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
+from io import BytesIO
 from time import time
 from typing import Generator
 from uuid import uuid4
 
 import numpy as np
-from constants.lib_constants import LibTypes
+from constants.env import CLIP_MODEL, CONFIG_FOLDER
+from constants.lib_constants import THUMBNAIL_FOLDER, LibTypes, ThumbnailSize
 from db.vector.redis_client import BatchedPipeline
+from db.vector.redis_vector_db import make_metadata
 from knowledge_base.image.image_embedder import ImageEmbedder
+from knowledge_base.image.image_tagger import ImageTagger
+from library.image.embedding_store_table import EmbeddingStoreTable
 from library.image.image_lib_table import ImageLibTable
 from library.image.image_lib_vector_db import ImageLibVectorDb
-from library.image.sql import DB_NAME
+from library.image.image_tag_table import ImageTagTable
+from library.image.image_scan_pipeline import (DecodedImage,
+                                               ImageScanPipeline,
+                                               ScanPipelineConfig)
+from library.image.library_diff import DiffType, merge_diff
+from library.image.sql import DB_NAME, EMBEDDING_STORE_DB_NAME
+from library.image.thumbnail_cache import ThumbnailCache
 from library.lib_base import *
 from loggers import image_lib_logger as LOGGER
 from PIL import Image
@@ -19,6 +32,10 @@ from redis.commands.search.document import Document
 from torch import Tensor
 from utils.errors.task_errors import (LockAcquisitionFailure,
                                       TaskCancellationException)
+from utils.file_helper import (bytes_hash, file_hash, is_image_file,
+                               load_image_for_model)
+from utils.fs_watcher import (FsChanges, FsEventType, FsWatcher,
+                              WatcherBackend, get_default_backend)
 from utils.lock_context import LockContext
 from utils.task_runner import report_progress
 
@@ -28,16 +45,27 @@ class ImageLib(LibraryBase):
     - Each image library will have only one table for storing images' metadata, such as UUID, path, filename, etc.
     """
 
+    LIB_TYPE: str = LibTypes.IMAGE.value
+
+    # A full scan saves a checkpoint every given number of images or seconds, whichever comes first
+    CHECKPOINT_INTERVAL_IMAGES: int = 5000
+    CHECKPOINT_INTERVAL_SECONDS: int = 300
+    # Changes applied by file system watcher are persisted to vector index at most once per given seconds
+    WATCHER_PERSIST_INTERVAL_SECONDS: int = 300
+
     def __init__(self,
                  lib_path: str,
                  lib_name: str,
                  uuid: str,
-                 local_mode: bool = True):
+                 local_mode: bool = True,
+                 share_embedding_store: bool = False):
         """
         Args:
             lib_path (str): Path to the library
             uuid (str): UUID of the library
             local_mode (bool, optional): True for use local index, False for use Redis. Defaults to True.
+            share_embedding_store (bool, optional): True to use the embedding store in config folder which is shared by
+            all libraries, False to use library's own store. Defaults to False.
         """
         if not uuid or not lib_name:
             raise LibraryError('Invalid UUID or library name')
@@ -60,10 +88,25 @@ class ImageLib(LibraryBase):
             raise LibraryError('Library metadata not initialized')
 
         self.local_mode: bool = local_mode
+        self.share_embedding_store: bool = share_embedding_store
         self._embedding_table: ImageLibTable = ImageLibTable(os.path.join(self._path_lib_data, DB_NAME))
+        self.__tag_table: ImageTagTable = ImageTagTable(self._embedding_table.db)
 
         self.__vector_db: ImageLibVectorDb | None = None
         self.__embedder: ImageEmbedder | None = None
+        # Stage config (worker count, queue depth, batch size) for the scan pipeline
+        self.scan_pipeline_config: ScanPipelineConfig = ScanPipelineConfig()
+        # If to record a full content hash for each file, so that a file with changed mtime but same content (e.g., touched
+        # or copied back) is not re-embedded on incremental scan
+        self.use_content_hash: bool = True
+        # If to reuse embeddings of byte-identical files from the content-addressed embedding store on scan
+        self.use_embedding_store: bool = True
+        self.__embedding_store: EmbeddingStoreTable | None = None
+        # If to save a small thumbnail of each image on scan, from the image which is already decoded for embedding
+        self.generate_thumbnails: bool = True
+        self.__thumbnail_cache: ThumbnailCache = ThumbnailCache(os.path.join(self._path_lib_data, THUMBNAIL_FOLDER))
+        self.__watcher: FsWatcher | None = None
+        self.__watcher_last_persisted: float = time()
 
     """
     Private methods
@@ -81,11 +124,31 @@ class ImageLib(LibraryBase):
                                                 lib_uuid=self._metadata['uuid'],
                                                 data_folder=self._path_lib_data,
                                                 ignore_index_error=force_init)
+            # Entries saved by previous versions are migrated on load, incremental scans skip unchanged files so the
+            # scan cannot be relied on to rewrite them
+            if not self.local_mode and not force_init:
+                self.__vector_db.upgrade_index(self.__iter_vector_metadata())
+        if self.use_embedding_store and not self.__embedding_store:
+            store_folder: str = CONFIG_FOLDER if self.share_embedding_store else self._path_lib_data
+            self.__embedding_store = EmbeddingStoreTable(os.path.join(store_folder, EMBEDDING_STORE_DB_NAME))
+
+    def __iter_vector_metadata(self) -> Generator[tuple[str, dict], None, None]:
+        """Iterate (UUID, metadata) of all embedded files for Redis vector DB
+        - Records created by previous versions have no mtime, the file's current mtime is used instead
+        """
+        for relative_path, uuid, parent_folder, filename, mtime_ns in self._embedding_table.iter_metadata():  # type: ignore
+            if mtime_ns is None:
+                full_path: str = os.path.join(self.path_lib, relative_path)
+                mtime_ns = os.stat(full_path).st_mtime_ns if os.path.isfile(full_path) else 0
+            yield uuid, make_metadata(parent_folder, filename, mtime_ns / 1e9)
 
     def __write_embedding_entry(self, relative_path: str,
-                                embedding: list[float], save_pipeline: BatchedPipeline | None = None):
+                                embedding: list[float],
+                                save_pipeline: BatchedPipeline | None = None,
+                                fingerprint: tuple[int, int, str | None] | None = None):
         """Write an image entry (file info + embedding) to both DB and vector DB
         - An UUID is generated to identify the image globally
+        - The fingerprint (size, mtime, hash) is recorded for change detection on incremental scan
         """
         timestamp: datetime = datetime.now()
         uuid: str = str(uuid4())
@@ -93,87 +156,260 @@ class ImageLib(LibraryBase):
         filename: str = os.path.basename(relative_path)
         LOGGER.info(f'Write embedding entry for: {relative_path}, UUID: {uuid}')
 
-        # Row format: (id, timestamp, ongoing, uuid, relative_path, path, filename)
-        self._embedding_table.insert_row((timestamp, 0, uuid, relative_path, parent_folder, filename))
-        self.__vector_db.add(uuid, embedding, save_pipeline)  # type: ignore
-
-    def __library_walker(self,
-                         progress_reporter: Callable[[int, int, str | None], None] | None,
-                         incremental: bool = False,
-                         scan_only: bool = False) -> Generator[tuple[str, list[float] | None], None, None]:
-        """Walk in the library and embed the images on the fly
+        if not fingerprint:
+            stat: os.stat_result = os.stat(os.path.join(self.path_lib, relative_path))
+            fingerprint = (stat.st_size, stat.st_mtime_ns, None)
+        size, mtime_ns, content_hash = fingerprint
+
+        # Row format: (id, timestamp, ongoing, uuid, relative_path, path, filename, size, mtime, hash)
+        self._embedding_table.insert_row((timestamp, 0, uuid, relative_path, parent_folder, filename,
+                                          size, mtime_ns, content_hash))
+
+        # Metadata is indexed by Redis vector DB for filtered queries, file's modified time is used as the timestamp
+        metadata: dict | None = None
+        if not self.local_mode:
+            metadata = make_metadata(parent_folder, filename, mtime_ns / 1e9)
+        self.__vector_db.add(uuid, embedding, save_pipeline, metadata)  # type: ignore
+
+    def __library_walker(self, incremental: bool = False) -> tuple[list[str], dict[str, tuple[int, int]]]:
+        """Walk in the library and collect the files to be embedded
+
+        The sorted directory walk is merged with the sorted embedding records (see `merge_diff()`), so there is no
+        per-file DB query and neither side is loaded into memory as a whole
+        - Files in the library but not embedded are new files, they are embedded if they pass `is_image_file()`
+        - Embedded files no longer exist in the library are leftovers, they are removed during the walk
+        - For an embedded file, it is changed if its fingerprint is changed
+            - Fingerprint is the (size, mtime) from the directory walk, no extra stat call is needed
+            - If the size or mtime is changed but the full content hash is the same, only the fingerprint is updated
+            - Records whose hash is a fast content hash of previous versions never match, they are re-embedded
+            - Changed files have their old embeddings removed here, and are re-embedded as new files
+            - Records created by previous versions have no fingerprint, their fingerprints are backfilled without
+            re-embedding
 
         Args:
-            progress_reporter (Callable[[int, int, str | None], None] | None): The progress reporter function to report the progress to task manager
             incremental (bool, optional): If this is an incremental run. Defaults to False.
-            scan_only (bool, optional): If do file scan only (without embedding). Defaults to False.
 
-        Yields:
-            Generator[tuple[str, list[float] | None], None, None]: _description_
+        Returns:
+            tuple[list[str], dict[str, tuple[int, int]]]: Relative paths of the files to be embedded, and the
+            (size, mtime) of each of them
         """
-        all_files: set[str] = set()
-        to_be_embedded: set[str] = set()
+        to_be_embedded: list[str] = list()
+        file_stats: dict[str, tuple[int, int]] = dict()
+        skipped: int = 0
+        found: int = 0
+        changed: int = 0
+        unchanged: int = 0
+        deleted: int = 0
 
-        # Get all files under current library's root
         LOGGER.info(f'Fetching all files under current library')
-        for relative_path in self._file_operator.folder_walker(relative_path=''):
-            all_files.add(relative_path)
-            if incremental:
-                if self._embedding_table.relative_path_exists(relative_path, ongoing=False):
-                    LOGGER.info(f'File already embedded: {relative_path}, skip for incremental scan')
+        all_files: Generator[tuple[str, os.stat_result], None, None] = \
+            self._file_operator.folder_scanner(relative_path='', sort=True)
+        for diff_type, relative_path, stat, record in merge_diff(all_files, self._embedding_table.iter_fingerprints()):
+            # Files are deleted but left in embedded files list
+            # - This can happen when user deletes files from file system directly and library is not aware of these operation
+            if diff_type == DiffType.DELETED:
+                LOGGER.info(f'Found leftover item: {relative_path}, removing')
+                self.delete_file_embedding(relative_path)
+                deleted += 1
+                continue
+
+            # New files are filtered by extension and file signature before any decoding, non-image files are skipped
+            # - Embedded files are not filtered, so a file accepted by previous versions is never treated as deleted
+            if diff_type == DiffType.NEW and not is_image_file(os.path.join(self.path_lib, relative_path)):
+                skipped += 1
+                continue
+            found += 1
+
+            if diff_type == DiffType.EXISTING:
+                _, size, mtime_ns, content_hash = record  # type: ignore
+                if size == stat.st_size and mtime_ns == stat.st_mtime_ns:  # type: ignore
+                    unchanged += 1
                     continue
-                to_be_embedded.add(relative_path)
 
-        # Check if there are files are deleted but left in embedded files list
-        # - This can happen when user deletes files from file system directly and library is not aware of these operation
-        if self._embedding_table.row_count() > 0:
-            to_be_deleted: set[str] = self._embedding_table.get_all_relative_paths() - all_files
-            if to_be_deleted:
-                LOGGER.info(f'Incremental scan, found {len(to_be_deleted)} leftover items, removing leftovers')
-                for relative_path in to_be_deleted:
-                    self.delete_file_embedding(relative_path)
+                full_path: str = os.path.join(self.path_lib, relative_path)
+                new_hash: str | None = None
+                if self.use_content_hash and (size is None or content_hash):
+                    new_hash = file_hash(full_path)
+                if size is None or (content_hash and content_hash == new_hash):
+                    self._embedding_table.update_fingerprint(relative_path, stat.st_size, stat.st_mtime_ns, new_hash)  # type: ignore
+                    unchanged += 1
+                    continue
+
+                # Remove outdated embedding of changed file, it will be embedded again as a new file
+                LOGGER.info(f'File changed: {relative_path}, re-embed')
+                self.delete_file_embedding(relative_path)
+                changed += 1
+
+            to_be_embedded.append(relative_path)
+            file_stats[relative_path] = (stat.st_size, stat.st_mtime_ns)  # type: ignore
+        LOGGER.info(f'Found {found} image files, skipped {skipped} non-image files, removed {deleted} leftover items')
 
         if incremental:
-            all_files.clear()
             if len(to_be_embedded):
-                LOGGER.info(f'Library incremental scanned, found {len(to_be_embedded)} new files')
+                LOGGER.info(f'Library incremental scanned, found {len(to_be_embedded) - changed} new files, '
+                            f'{changed} changed files, {unchanged} unchanged files')
             else:
-                LOGGER.info(f'Library incremental scanned, no new file found')
+                LOGGER.info(f'Library incremental scanned, no new or changed file found')
         else:
-            to_be_embedded = all_files
-            LOGGER.info(f'Library scanned, found {len(all_files)} files')
+            LOGGER.info(f'Library scanned, found {found} files')
+        return to_be_embedded, file_stats
+
+    def __save_checkpoint(self, save_pipeline: BatchedPipeline | None):
+        """Save a checkpoint of current full scan, so that it can be resumed after cancellation, crash or restart
+        1. Send all pending vectors to Redis and commit all pending embedding records
+        2. Persist the vector index
+        3. Save the max row ID of embedding records to metadata, which is the scan cursor
+
+        A record after the cursor might have no vector in persisted index, it is rolled back on resume, see
+        `__restore_checkpoint()`
+        - The files of rolled back records are treated as new files and embedded again by the resumed scan
+        """
+        if save_pipeline:
+            save_pipeline.sync()
+        if self._embedding_table.write_batch_ctx:
+            self._embedding_table.write_batch_ctx.commit()
+        self.__vector_db.persist()  # type: ignore
+
+        last_row_id: int = self._embedding_table.max_row_id()
+        self._metadata['scan_checkpoint'] = {
+            'last_row_id': last_row_id,
+            'saved_on': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self._save_metadata()
+        LOGGER.info(f'Scan checkpoint saved, last row ID: {last_row_id}')
+
+    def __restore_checkpoint(self):
+        """Roll back the embedding records (and their vectors) saved after the last checkpoint
+        """
+        checkpoint: dict | None = self._metadata.get('scan_checkpoint')
+        if not checkpoint:
+            return
 
-        # Start to process each image
-        LOGGER.info(f'Start to embed scanned images')
-        total: int = len(to_be_embedded)
-        previous_progress: int = -1
-        for i, relative_path in enumerate(to_be_embedded):
-            try:
-                # Validate if the file is an image and insert it into the table
-                # - After verify() the file stream is closed, need to reopen it
-                img: Image.Image = Image.open(os.path.join(self.path_lib, relative_path))
-                img.verify()
-                img = Image.open(os.path.join(self.path_lib, relative_path))
-            except BaseException:
-                LOGGER.info(f'Invalid image: {relative_path}, skip')
+        uuids: list[str] = self._embedding_table.get_uuids_after(checkpoint['last_row_id'])
+        LOGGER.info(f'Resuming scan from checkpoint saved on {checkpoint["saved_on"]}, '
+                    f'rolling back {len(uuids)} records after the checkpoint')
+        with self._embedding_table.write_batch():
+            for uuid in uuids:
+                self.__vector_db.remove(uuid)  # type: ignore
+                self._embedding_table.delete_by_uuid(uuid)
+
+    def __move_embedding(self, src_relative_path: str, dest_relative_path: str):
+        """Move the embedding record of a file or a folder (all embedded files under it) to a new relative path
+        - The embedding at destination (if any) is replaced, as the destination file is overwritten by the move
+        """
+        row: tuple | None = self._embedding_table.select_by_relative_path(src_relative_path, ongoing=False)
+        if not row:
+            for relative_path in self._embedding_table.get_relative_paths_under(src_relative_path):
+                self.__move_embedding(relative_path, dest_relative_path + relative_path[len(src_relative_path):])
+            return
+
+        if self._embedding_table.relative_path_exists(dest_relative_path, ongoing=False):
+            self.delete_file_embedding(dest_relative_path)
+        LOGGER.info(f'Move embedding: {src_relative_path} -> {dest_relative_path}')
+        self.__update_record(row, dest_relative_path)
+
+    def __update_record(self, row: tuple, new_relative_path: str) -> bool:
+        """Update the relative path of an embedding record, and the metadata of its vector in Redis
+        """
+        # Row format: (id, timestamp, ongoing, uuid, relative_path, path, filename, size, mtime, hash)
+        if not self._embedding_table.update_record_by_relative_path(new_relative_path, row[4]):
+            return False
+        if not self.local_mode:
+            mtime_ns: int | None = row[8]
+            metadata: dict = make_metadata(os.path.dirname(new_relative_path),
+                                           os.path.basename(new_relative_path),
+                                           mtime_ns / 1e9 if mtime_ns else 0)
+            self.__vector_db.update_metadata(row[3], metadata)  # type: ignore
+        return True
+
+    def __apply_file_changes(self, changes: FsChanges):
+        """Apply the changes reported by file system watcher, see `FsChanges`
+        """
+        to_be_embedded: list[str] = list()
+        file_stats: dict[str, tuple[int, int]] = dict()
+        for event_type, relative_path, src_relative_path in changes.operations:
+            if event_type == FsEventType.MOVED:
+                self.__move_embedding(src_relative_path, relative_path)  # type: ignore
+            elif event_type == FsEventType.DELETED:
+                self.delete_file_embedding(relative_path)
+                for r in self._embedding_table.get_relative_paths_under(relative_path):
+                    self.delete_file_embedding(r)
+
+        for relative_path in changes.upserts:
+            full_path: str = os.path.join(self.path_lib, relative_path)
+            if not os.path.isfile(full_path):
                 continue
+            row: tuple | None = self._embedding_table.select_by_relative_path(relative_path, ongoing=False)
+            if not row and not is_image_file(full_path):
+                continue
+            stat: os.stat_result = os.stat(full_path)
+            if row:
+                if row[7] == stat.st_size and row[8] == stat.st_mtime_ns:
+                    continue
+                self.delete_file_embedding(relative_path)
+            to_be_embedded.append(relative_path)
+            file_stats[relative_path] = (stat.st_size, stat.st_mtime_ns)
 
-            # If reporter is given, report progress to task manager
-            # - Reduce report frequency, only report when progress changes
-            current_progress: int = int(i / total * 100)
-            if current_progress > previous_progress:
-                previous_progress = current_progress
-                report_progress(progress_reporter, current_progress)
-
-            LOGGER.info(f'Processing image: {relative_path}')
-            if not scan_only:
-                start_time: float = time()
-                embedding: list[float] = self.__embedder.embed_image_as_list(img)  # type: ignore
-                time_taken: float = time() - start_time
-                LOGGER.info(f'Image embedded: {relative_path}, dimension: {len(embedding)}, cost: {time_taken:.2f}s')
-                yield relative_path, embedding
-            else:
-                yield relative_path, None
+        if not to_be_embedded:
+            return
+
+        LOGGER.info(f'Embedding {len(to_be_embedded)} new or changed files reported by file system watcher')
+        save_pipeline: BatchedPipeline | None = None
+        try:
+            save_pipeline = self.__vector_db.get_save_pipeline(batch_size=200)  # type: ignore
+        except NotImplementedError:
+            pass
+        with save_pipeline or nullcontext():
+            self.__embed_files(to_be_embedded, file_stats, save_pipeline, None, None, first_run=False)
+
+    def __load_image(self,
+                     relative_path: str,
+                     content_hash: str | None = None,
+                     content: bytes | None = None) -> Tensor | None:
+        """Open, validate and preprocess an image as embedder's input, return None if the file is not a valid image
+        - Called from the decode stage of scan pipeline, so it runs in parallel
+        - The file is opened once and decoded at reduced resolution near model's input size
+        - If `content_hash` is given, the small thumbnail is saved from the decoded image as well
+        - If `content` is given, the image is decoded from it instead of reading the file again
+        """
+        target_size: int = self.__embedder.image_size  # type: ignore
+        if content_hash:
+            target_size = max(target_size, ThumbnailSize.SMALL.value)
+        try:
+            source: str | BytesIO = BytesIO(content) if content is not None else os.path.join(self.path_lib, relative_path)
+            img: Image.Image = load_image_for_model(source, target_size)
+        except BaseException:
+            LOGGER.info(f'Invalid image: {relative_path}, skip')
+            return None
+
+        if content_hash:
+            try:
+                self.__thumbnail_cache.put(content_hash, img)
+            except BaseException as e:
+                LOGGER.warning(f'Failed to save thumbnail for: {relative_path}, error: {e}')
+
+        LOGGER.info(f'Processing image: {relative_path}')
+        return self.__embedder.preprocess_image(img)  # type: ignore
+
+    def __hydrate_search_result(self, docs: list) -> list[tuple]:
+        """Get file data of vector search result from DB in one statement, in the order of the search result
+        - The local key of an image is `uuid` or `id` of the vector in the index
+        - The redis key of an image is `lib_uuid`:`img_uuid`
+
+        Returns: Rows in search result format (uuid, path, filename)
+        """
+        uuids: list[str] = list()
+        if self.local_mode:
+            casted_local: list[int | str] = docs
+            for possible_uuid in casted_local:
+                if isinstance(possible_uuid, int):
+                    raise LibraryError('ID tracking not enabled, cannot get UUID')
+                uuids.append(possible_uuid)
+        else:
+            casted_redis: list[Document] = docs
+            uuids = [doc.id.split(':')[1] for doc in casted_redis]
+
+        return self._embedding_table.select_by_uuids(uuids, columns=ImageLibTable.SEARCH_RESULT_COLUMNS)
 
     def __do_scan(self,
                   save_pipeline: BatchedPipeline | None,
@@ -181,8 +417,9 @@ class ImageLib(LibraryBase):
                   cancel_event: Event | None,
                   first_run: bool,
                   incremental: bool,
-                  scan_only: bool):
-        """Call __library_walker() to do the actual library scan
+                  scan_only: bool,
+                  checkpoint: bool = False):
+        """Call __library_walker() to collect files, then embed them with the scan pipeline
 
         Args:
             save_pipeline (BatchedPipeline | None): _description_
@@ -191,19 +428,81 @@ class ImageLib(LibraryBase):
             first_run (bool): If this is a fresh run, index creation depends on this param
             incremental (bool): If this is an incremental run
             scan_only (bool): If this is a scan only action, no embedding will be created
+            checkpoint (bool, optional): If to save checkpoints periodically during the scan. Defaults to False.
         """
-        dimension: int = -1
-        for relative_path, embedding in self.__library_walker(progress_reporter=progress_reporter,
-                                                              incremental=incremental,
-                                                              scan_only=scan_only):
-            if cancel_event is not None and cancel_event.is_set():
-                raise TaskCancellationException('Library initialization cancelled')
+        to_be_embedded, file_stats = self.__library_walker(incremental=incremental)
+        if scan_only:
+            return
+        self.__embed_files(to_be_embedded, file_stats, save_pipeline, progress_reporter, cancel_event,
+                           first_run=first_run, checkpoint=checkpoint)
+
+    def __embed_files(self,
+                      to_be_embedded: list[str],
+                      file_stats: dict[str, tuple[int, int]],
+                      save_pipeline: BatchedPipeline | None,
+                      progress_reporter: Callable[[int, int, str | None], None] | None,
+                      cancel_event: Event | None,
+                      first_run: bool,
+                      checkpoint: bool = False):
+        """Embed given files with the scan pipeline and write them to DBs
 
-            if not scan_only:
+        Args:
+            to_be_embedded (list[str]): Relative paths of the files to be embedded, they must not be embedded yet
+            file_stats (dict[str, tuple[int, int]]): The (size, mtime) of each file
+            first_run (bool): If this is a fresh run, index creation depends on this param
+            checkpoint (bool, optional): If to save checkpoints periodically. Defaults to False.
+        """
+        dimension: int = -1
+        # Content hashes and keys are computed by the decode stage in parallel, and consumed by the write stage
+        content_hashes: dict[str, str] = dict()
+        content_keys: dict[str, str] = dict()
+        embedding_store: EmbeddingStoreTable | None = self.__embedding_store
+        since_checkpoint: int = 0
+        last_checkpoint: float = time()
+
+        def loader(relative_path: str) -> DecodedImage | None:
+            """Decode stage of scan pipeline
+            - If the file's content is found in embedding store, the stored embedding is reused and no decoding is needed
+            - If a content hash is needed, the file is read once, the hash is computed from the bytes and the image is
+            decoded from the same bytes
+            """
+            full_hash: str | None = None
+            content: bytes | None = None
+            if self.use_content_hash or embedding_store or self.generate_thumbnails:
+                with open(os.path.join(self.path_lib, relative_path), 'rb') as f:
+                    content = f.read()
+                full_hash = bytes_hash(content)
+            if self.use_content_hash:
+                content_hashes[relative_path] = full_hash  # type: ignore
+
+            content_key: str | None = None
+            if embedding_store:
+                content_key = EmbeddingStoreTable.make_content_key(CLIP_MODEL, full_hash)  # type: ignore
+                content_keys[relative_path] = content_key
+                embedding: list[float] | None = embedding_store.get_embedding(content_key)
+                if embedding is not None:
+                    LOGGER.info(f'Embedding reused for: {relative_path}')
+                    return DecodedImage(embedding=embedding, content_key=content_key)
+
+            thumbnail_hash: str | None = full_hash if self.generate_thumbnails else None
+            tensor: Tensor | None = self.__load_image(relative_path, thumbnail_hash, content)
+            if tensor is None:
+                return None
+            return DecodedImage(tensor=tensor, content_key=content_key)
+
+        def writer(batch: list[tuple[str, list[float]]]):
+            """Write stage of scan pipeline, it is the only thread writes to DBs during the scan
+            """
+            nonlocal dimension, first_run, since_checkpoint, last_checkpoint
+            store_entries: list[tuple[str, list[float]]] = list()
+            for relative_path, embedding in batch:
                 if not embedding:
                     raise LibraryError('Invalid embedding')
                 if dimension == -1:
                     dimension = len(embedding)
+                    # Redis index creation is idempotent, ensure the index exists with latest schema on every scan
+                    if not self.local_mode:
+                        self.__vector_db.initialize_index(dimension)  # type: ignore
 
                 # If this is the very first embedding and in local mode, initialize the index as memory vector DB's FLAT index
                 # needs to build an index before adding data
@@ -212,16 +511,40 @@ class ImageLib(LibraryBase):
                         LOGGER.info(f'Creating index for the first time, dimension: {dimension}')
                         self.__vector_db.initialize_index(dimension)  # type: ignore
                         first_run = False
-                self.__write_embedding_entry(relative_path, embedding, save_pipeline)
+                size, mtime_ns = file_stats[relative_path]
+                fingerprint: tuple[int, int, str | None] = (size, mtime_ns, content_hashes.pop(relative_path, None))
+                self.__write_embedding_entry(relative_path, embedding, save_pipeline, fingerprint)
+                if relative_path in content_keys:
+                    store_entries.append((content_keys.pop(relative_path), embedding))
+            if embedding_store:
+                embedding_store.put_embeddings(store_entries)
+
+            # Checkpoints are saved on batch boundaries by the write stage, so no write is in progress
+            since_checkpoint += len(batch)
+            if checkpoint and (since_checkpoint >= self.CHECKPOINT_INTERVAL_IMAGES
+                               or time() - last_checkpoint >= self.CHECKPOINT_INTERVAL_SECONDS):
+                self.__save_checkpoint(save_pipeline)
+                since_checkpoint, last_checkpoint = 0, time()
+
+        LOGGER.info(f'Start to embed scanned images')
+        pipeline: ImageScanPipeline = ImageScanPipeline(loader=loader,
+                                                        embedder=self.__embedder.embed_pixel_values,  # type: ignore
+                                                        writer=writer,
+                                                        config=self.scan_pipeline_config)
+        embedded: int = pipeline.run(to_be_embedded, progress_reporter, cancel_event)
+        LOGGER.info(f'{embedded} images embedded')
 
     def __scan(self,
                progress_reporter: Callable[[int, int, str | None], None] | None,
                cancel_event: Event | None,
                first_run: bool,
                incremental: bool = False,
-               scan_only: bool = False):
+               scan_only: bool = False,
+               resume: bool = False):
         """Do scan to the library content and make embeddings
 
+        A full scan (fresh or resumed) is checkpointed, the checkpoint is kept in metadata until the scan is finished
+
         Args:
             save_pipeline (BatchedPipeline | None): _description_
             progress_reporter (Callable[[int, int, str | None], None] | None): _description_
@@ -229,9 +552,11 @@ class ImageLib(LibraryBase):
             first_run (bool): If this is a fresh run, index creation depends on this param
             incremental (bool): If this is an incremental run
             scan_only (bool): If this is a scan only action, no embedding will be created
+            resume (bool): If this is to resume an unfinished full scan from its last checkpoint
         """
-        if (incremental and first_run) or (scan_only and first_run):
+        if (incremental and first_run) or (scan_only and first_run) or (resume and (incremental or scan_only)):
             raise LibraryError('Invalid scan param')
+        checkpoint: bool = first_run or resume
 
         with LockContext(self._file_lock) as lock:
             if not lock.acquired:
@@ -240,34 +565,50 @@ class ImageLib(LibraryBase):
             LOGGER.info(f'Library scan started, incremental: {incremental}, scan only: {scan_only}')
             try:
                 self._metadata['last_scanned'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                if resume:
+                    self.__restore_checkpoint()
+                elif first_run:
+                    self._metadata['scan_checkpoint'] = {
+                        'last_row_id': 0,
+                        'saved_on': self._metadata['last_scanned'],
+                    }
                 self._save_metadata()
 
+                # Redis writes are flushed by a background sender, so that embedding and Redis I/O are overlapped
+                # - Sender errors are raised when the pipeline exits, and handled as a scan failure below
                 save_pipeline: BatchedPipeline | None = None
                 try:
-                    save_pipeline = self.__vector_db.get_save_pipeline(batch_size=200)  # type: ignore
+                    save_pipeline = self.__vector_db.get_save_pipeline(batch_size=200, async_flush=True)  # type: ignore
                 except NotImplementedError:
                     pass
 
+                # Embedding records are committed in batches, not one transaction per image
                 start: float = time()
-                if save_pipeline:
-                    with save_pipeline:
-                        self.__do_scan(save_pipeline,
+                with self._embedding_table.write_batch():
+                    if save_pipeline:
+                        with save_pipeline:
+                            self.__do_scan(save_pipeline,
+                                           progress_reporter,
+                                           cancel_event,
+                                           first_run=first_run,
+                                           incremental=incremental,
+                                           scan_only=scan_only,
+                                           checkpoint=checkpoint)
+                    else:
+                        self.__do_scan(None,
                                        progress_reporter,
                                        cancel_event,
                                        first_run=first_run,
                                        incremental=incremental,
-                                       scan_only=scan_only)
-                else:
-                    self.__do_scan(None,
-                                   progress_reporter,
-                                   cancel_event,
-                                   first_run=first_run,
-                                   incremental=incremental,
-                                   scan_only=scan_only)
+                                       scan_only=scan_only,
+                                       checkpoint=checkpoint)
 
                 if not scan_only:
                     # On scan finished, persist index and save scan history
                     self.__vector_db.persist()  # type: ignore
+                if checkpoint:
+                    self._metadata['scan_checkpoint'] = None
+                    self._save_metadata()
 
                 time_taken: float = time() - start
                 if not incremental:
@@ -276,10 +617,19 @@ class ImageLib(LibraryBase):
                     LOGGER.info(f'Image library incrementally scanned successfully, cost: {time_taken:.2f}s')
 
             except Exception as e:
-                # On cancel or failure, persist current progress
-                self.__vector_db.persist()  # type: ignore
+                # On cancel or failure, persist current progress, a full scan saves a checkpoint to be resumed later
+                # - A failure of saving progress is logged only, so it never hides the original error
+                progress_saved: bool = True
+                try:
+                    if checkpoint:
+                        self.__save_checkpoint(None)
+                    else:
+                        self.__vector_db.persist()  # type: ignore
+                except Exception as save_error:
+                    progress_saved = False
+                    LOGGER.error(f'Failed to save progress of library scan: {save_error}')
                 if isinstance(e, TaskCancellationException):
-                    LOGGER.warn('Library scan cancelled, progress saved')
+                    LOGGER.warn(f'Library scan cancelled, progress {"saved" if progress_saved else "not saved"}')
                 else:
                     LOGGER.error(f'Library scan failed: {e}')
                     raise LibraryError(f'Library scan failed: {e}')
@@ -297,10 +647,14 @@ class ImageLib(LibraryBase):
                   force_init: bool = False,
                   progress_reporter: Callable[[int, int, str | None], None] | None = None,
                   cancel_event: Event | None = None):
+        """Do a full scan to initialize the library
+        - If a previous full scan is unfinished (cancelled, failed or process exited), it is resumed from its last
+        checkpoint instead of starting over, unless `force_init` is given
+        """
         LOGGER.info(f'Prepare to do full scan for library: {self.path_lib}, force init: {force_init}')
 
         ready: bool = self.is_ready()
-        if ready and not force_init:
+        if ready and not force_init and not self.has_unfinished_scan():
             LOGGER.info(f'Library is already ready, abort operation')
             return
 
@@ -313,6 +667,13 @@ class ImageLib(LibraryBase):
             LOGGER.info(f'Library not ready, try to load DBs')
             self.__instanize_db(force_init)
 
+        if not force_init and self.has_unfinished_scan():
+            LOGGER.info(f'Found unfinished full scan, resume it from last checkpoint')
+            self.__scan(progress_reporter, cancel_event,
+                        first_run=not self.__vector_db.db_is_ready(),  # type: ignore
+                        resume=True)
+            return
+
         # If DBs are all loaded (case#2, an existing lib) and not force init, return directly
         if not force_init and self._embedding_table.row_count() > 0 and self.__vector_db.db_is_ready():  # type: ignore
             LOGGER.info(f'Library is already ready, abort full scan operation')
@@ -355,9 +716,12 @@ class ImageLib(LibraryBase):
                     raise LibraryError('For Redis vector DB, the library must be initialized before demolish')
                 self.__vector_db.delete_db()
 
+            self.stop_watcher()
             self.__embedder = None
             self._embedding_table = None  # type: ignore
+            self.__tag_table = None  # type: ignore
             self.__vector_db = None
+            self.__embedding_store = None
             shutil.rmtree(self._path_lib_data)
             LOGGER.warning(f'Library demolished: {self.path_lib}')
 
@@ -380,12 +744,205 @@ class ImageLib(LibraryBase):
 
         return True
 
+    def _update_record_by_relative_path(self, new_relative_path: str, old_relative_path: str) -> bool:
+        """Update the embedding record of a file moved or renamed through the library, and its metadata in Redis, so
+        that folder and filename filters see the new location
+        """
+        row: tuple | None = self._embedding_table.select_by_relative_path(old_relative_path, ongoing=False)
+        if not row:
+            return False
+        return self.__update_record(row, new_relative_path)
+
+    def __decode_for_tagging(self, tagger: ImageTagger, relative_path: str) -> Tensor | None:
+        """Open and preprocess an image for tagger model, return None if it cannot be opened
+        """
+        try:
+            img: Image.Image = load_image_for_model(os.path.join(self.path_lib, relative_path), tagger.image_size)
+            return tagger.preprocess_image(img)
+        except BaseException as e:
+            LOGGER.info(f'Failed to open image for tagging: {relative_path}, skip, error: {e}')
+            return None
+
     """
     Public methods
     """
 
     def set_embedder(self, embedder: ImageEmbedder):
         self.__embedder = embedder
+        self.scan_pipeline_config.batch_size = embedder.batch_size
+
+    def start_watcher(self, backend: WatcherBackend | None = None) -> bool:
+        """Start to watch the library folder, new, changed, moved and deleted images are applied to the library without
+        a scan, see `apply_file_changes()`
+        - Return False if there is no watcher backend available on current platform
+        """
+        if self.__watcher:
+            return True
+
+        backend = backend or get_default_backend()
+        if not backend:
+            LOGGER.warning('No file system watcher backend available on current platform')
+            return False
+
+        LOGGER.info(f'Start file system watcher for library: {self.path_lib}')
+        self.__watcher = FsWatcher(self.path_lib, self.apply_file_changes, backend, excluded=[self._path_lib_data])
+        self.__watcher.start()
+        return True
+
+    def stop_watcher(self):
+        if not self.__watcher:
+            return
+
+        LOGGER.info(f'Stop file system watcher for library: {self.path_lib}')
+        self.__watcher.stop()
+        self.__watcher = None
+        if self.__vector_db:
+            self.__vector_db.persist()
+
+    def apply_file_changes(self, changes: FsChanges) -> bool:
+        """Apply file changes reported by file system watcher
+        - Return False if the changes cannot be applied now, i.e., the library is not ready or a scan is running, the
+        watcher retries later
+        - If events are lost, an incremental scan is done instead
+        """
+        if not self.is_ready() or not self.__vector_db.db_is_ready():  # type: ignore
+            return False
+
+        if changes.overflow:
+            LOGGER.warning('File system events lost, do incremental scan')
+            try:
+                self.incremental_scan()
+            except LockAcquisitionFailure:
+                return False
+            return True
+
+        with LockContext(self._file_lock) as lock:
+            if not lock.acquired:
+                return False
+
+            with self._embedding_table.write_batch():
+                self.__apply_file_changes(changes)
+
+            # Vectors are already searchable in memory (or in Redis), persisting the index is throttled
+            if time() - self.__watcher_last_persisted >= self.WATCHER_PERSIST_INTERVAL_SECONDS:
+                self.__vector_db.persist()  # type: ignore
+                self.__watcher_last_persisted = time()
+        return True
+
+    def get_thumbnail(self, relative_path: str, size: ThumbnailSize = ThumbnailSize.SMALL) -> bytes | None:
+        """Get the encoded bytes of given image's thumbnail, the image is decoded only if the thumbnail is not cached
+        - The thumbnail is looked up by the full content hash of the file, so a changed file never gets a stale thumbnail
+        - The hash recorded on embedding is reused if the file's size and mtime still match its fingerprint, the file is
+        hashed otherwise
+        - The encoding format is given by `get_thumbnail_mime_type()`
+        - Return None if the file does not exist or is not a valid image
+        """
+        if not relative_path:
+            return None
+
+        relative_path = relative_path.strip().lstrip(os.path.sep)
+        full_path: str = os.path.join(self.path_lib, relative_path)
+        if not relative_path or not os.path.isfile(full_path):
+            return None
+        return self.__thumbnail_cache.get_or_create(self.__get_content_hash(relative_path), size, full_path)
+
+    def __get_content_hash(self, relative_path: str) -> str:
+        """Get the full content hash of a file, from its fingerprint if the file is not changed since it is embedded
+        """
+        full_path: str = os.path.join(self.path_lib, relative_path)
+        if self.is_ready():
+            stat: os.stat_result = os.stat(full_path)
+            fingerprint: tuple[int | None, int | None, str | None] | None = \
+                self._embedding_table.get_fingerprint(relative_path)  # type: ignore
+            if fingerprint and fingerprint[2] and fingerprint[:2] == (stat.st_size, stat.st_mtime_ns):
+                return fingerprint[2]
+        return file_hash(full_path)
+
+    def get_thumbnail_mime_type(self) -> str:
+        return self.__thumbnail_cache.mime_type
+
+    @ensure_lib_is_ready
+    def tag_images(self,
+                   tagger: ImageTagger,
+                   progress_reporter: Callable[[int, int, str | None], None] | None = None,
+                   cancel_event: Event | None = None) -> int:
+        """Predict tags of embedded images which are not tagged yet, and save them to the tag store, return the number of
+        images tagged
+        - Each image is tagged only once, tags are kept when the image is moved or renamed, and a changed image is
+        tagged again as it is embedded with a new UUID
+        - Tags of deleted images are purged first
+        """
+        self.__tag_table.delete_orphans()
+        untagged: list[tuple[str, str]] = self.__tag_table.get_untagged_images()
+        total: int = len(untagged)
+        LOGGER.info(f'Start to tag {total} images')
+
+        tagged: int = 0
+        previous_progress: int = -1
+        batch_size: int = tagger.batch_size
+        chunks: list[list[tuple[str, str]]] = [untagged[i:i + batch_size] for i in range(0, total, batch_size)]
+
+        # Images of next chunk are decoded in the background while current chunk is running on the model
+        decode_pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1),
+                                                             thread_name_prefix='image-tagger-decoder')
+        prefetch_pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-tagger-prefetch')
+
+        def decode_chunk(chunk: list[tuple[str, str]]) -> list[Tensor | None]:
+            return list(decode_pool.map(lambda row: self.__decode_for_tagging(tagger, row[1]), chunk))
+
+        try:
+            with self.__tag_table.write_batch():
+                next_chunk: Future | None = prefetch_pool.submit(decode_chunk, chunks[0]) if chunks else None
+                for i, chunk in enumerate(chunks):
+                    if cancel_event and cancel_event.is_set():
+                        raise TaskCancellationException('Image tagging cancelled')
+
+                    current_progress: int = int(i * batch_size / total * 100)
+                    if current_progress > previous_progress:
+                        previous_progress = current_progress
+                        report_progress(progress_reporter, current_progress)
+
+                    decoded: list[Tensor | None] = next_chunk.result()  # type: ignore
+                    next_chunk = prefetch_pool.submit(decode_chunk, chunks[i + 1]) if i + 1 < len(chunks) else None
+
+                    uuids: list[str] = [uuid for (uuid, _), tensor in zip(chunk, decoded) if tensor is not None]
+                    tensors: list[Tensor] = [tensor for tensor in decoded if tensor is not None]
+                    if not tensors:
+                        continue
+                    for uuid, tags in zip(uuids, tagger.select_all(tagger.predict_scores(tensors))):
+                        self.__tag_table.save_tags(uuid, tags)
+                    tagged += len(tensors)
+        finally:
+            prefetch_pool.shutdown(wait=True, cancel_futures=True)
+            decode_pool.shutdown(wait=True, cancel_futures=True)
+
+        LOGGER.info(f'{tagged} images tagged')
+        return tagged
+
+    @ensure_lib_is_ready
+    def get_image_tags(self, relative_path: str, top_k: int = 10, en: bool = False) -> list[tuple[str, float]]:
+        """Get top K (tag, score) of given image from the tag store, empty if it is not tagged yet
+        """
+        relative_path = relative_path.strip().lstrip(os.path.sep)
+        uuid: str | None = self._embedding_table.get_uuid(relative_path, ongoing=False)
+        if not uuid:
+            return list()
+        return self.__tag_table.get_tags(uuid, top_k, en)
+
+    @ensure_lib_is_ready
+    def search_images_by_tag(self, tag: str, top_k: int = 10, offset: int = 0, en: bool = False) -> list[tuple]:
+        """Get images with given tag from the tag store, ordered by the score of the tag
+
+        Returns: Rows in search result format (uuid, path, filename)
+        """
+        if not tag or top_k <= 0:
+            return list()
+        return self.__tag_table.search_by_tag(tag.strip(), top_k, max(0, offset), en)
+
+    def has_unfinished_scan(self) -> bool:
+        """Check if there is an unfinished full scan which can be resumed
+        """
+        return bool(self._metadata.get('scan_checkpoint'))
 
     def get_scan_gap(self) -> int:
         """Get the time gap from last scan in days
@@ -397,8 +954,8 @@ class ImageLib(LibraryBase):
                          progress_reporter: Callable[[int, int, str | None], None] | None = None,
                          cancel_event: Event | None = None):
         """Incrementally scan and partially initialize the library
-        - Already-embedded images are skipped
-        - Only embed and record the new images that are newly added to the library but not embedded yet, and add them to the DB
+        - Already-embedded images are skipped if their size and mtime (or content hash) are not changed
+        - Only embed and record the new or changed images, and add them to the DB
         - If an embedded image is deleted but its leftover remains, then remove embedding entry from the DB
         """
         LOGGER.info(f'Prepare to do incremental scan for library: {self.path_lib}')
@@ -410,7 +967,11 @@ class ImageLib(LibraryBase):
             LOGGER.info(f'Library not ready, do full scan and initialization')
             self.__instanize_db()
 
-        # If there is no single embedded image, do full scan directly
+        # If there is no single embedded image, do full scan directly, and an unfinished full scan is resumed instead
+        if self.has_unfinished_scan():
+            LOGGER.info(f'Found unfinished full scan, resume it instead of incremental scan')
+            self.full_scan(progress_reporter=progress_reporter, cancel_event=cancel_event)
+            return
         if not self._embedding_table.row_count():
             LOGGER.info(f'No embedded image found, do full scan and initialization')
             self.full_scan(force_init=True,
@@ -436,41 +997,36 @@ class ImageLib(LibraryBase):
     """
 
     @ensure_lib_is_ready
-    def image_for_image_search(self, img: Image.Image, top_k: int = 10, extra_params: dict | None = None) -> list[tuple]:
+    def image_for_image_search(self, img: Image.Image,
+                               top_k: int = 10,
+                               extra_params: dict | None = None,
+                               filter_expression: str | None = None) -> list[tuple]:
+        """Search similar images, `filter_expression` is a Redis pre-filter built by `make_filter_expression()`
+
+        Returns: Rows in search result format (uuid, path, filename), ordered by similarity
+        """
         if not img or not top_k or top_k <= 0:
             return list()
 
         LOGGER.info(f'Image search with image similarity')
         start: float = time()
         image_embedding: np.ndarray = self.__embedder.embed_image(img)  # type: ignore
-        docs: list = self.__vector_db.query(np.asarray([image_embedding]), top_k)  # type: ignore
+        docs: list = self.__vector_db.query(np.asarray([image_embedding]), top_k,  # type: ignore
+                                            filter_expression=filter_expression)
         time_taken: float = time() - start
         LOGGER.info(f'Image search with image similarity completed, cost: {time_taken:.2f}s, start to parse result')
 
-        # Parse the result, get file data from DB
-        # - The local key of an image is `uuid` or `id` of the vector in the index
-        # - The redis key of an image is `lib_uuid`:`img_uuid`
-        res: list[tuple] = list()
-        if self.local_mode:
-            casted_local: list[int | str] = docs
-            for possible_uuid in casted_local:
-                if isinstance(possible_uuid, int):
-                    raise LibraryError('ID tracking not enabled, cannot get UUID')
-                row: tuple | None = self._embedding_table.select_by_uuid(possible_uuid)
-                if row:
-                    res.append(row)
-        else:
-            casted_redis: list[Document] = docs
-            for doc in casted_redis:
-                uuid: str = doc.id.split(':')[1]
-                row: tuple | None = self._embedding_table.select_by_uuid(uuid)
-                if row:
-                    res.append(row)
-
-        return res
+        return self.__hydrate_search_result(docs)
 
     @ensure_lib_is_ready
-    def text_for_image_search(self, text: str, top_k: int = 10, extra_params: dict | None = None) -> list[tuple]:
+    def text_for_image_search(self, text: str,
+                              top_k: int = 10,
+                              extra_params: dict | None = None,
+                              filter_expression: str | None = None) -> list[tuple]:
+        """Search similar images, `filter_expression` is a Redis pre-filter built by `make_filter_expression()`
+
+        Returns: Rows in search result format (uuid, path, filename), ordered by similarity
+        """
         if not text or not top_k or top_k <= 0:
             return list()
 
@@ -478,31 +1034,12 @@ class ImageLib(LibraryBase):
         start: float = time()
         # Text embedding is a 2D array, the first element is the embedding of the text
         text_embedding: np.ndarray = self.__embedder.embed_text(text)[0]  # type: ignore
-        docs: list = self.__vector_db.query(np.asarray([text_embedding]), top_k)  # type: ignore
+        docs: list = self.__vector_db.query(np.asarray([text_embedding]), top_k,  # type: ignore
+                                            filter_expression=filter_expression)
         time_taken: float = time() - start
         LOGGER.info(f'Image search with text similarity completed, cost: {time_taken:.2f}s, start to parse result')
 
-        # Parse the result, get file data from DB
-        # - The local key of an image is `uuid` or `id` of the vector in the index
-        # - The redis key of an image is `lib_uuid`:`img_uuid`
-        res: list[tuple] = list()
-        if self.local_mode:
-            casted_local: list[int | str] = docs
-            for possible_uuid in casted_local:
-                if isinstance(possible_uuid, int):
-                    raise LibraryError('ID tracking not enabled, cannot get UUID')
-                row: tuple | None = self._embedding_table.select_by_uuid(possible_uuid)
-                if row:
-                    res.append(row)
-        else:
-            casted_redis: list[Document] = docs
-            for doc in casted_redis:
-                uuid: str = doc.id.split(':')[1]
-                row: tuple | None = self._embedding_table.select_by_uuid(uuid)
-                if row:
-                    res.append(row)
-
-        return res
+        return self.__hydrate_search_result(docs)
 
     @ensure_lib_is_ready
     def text_image_similarity(self, tokens: list[str], img: Image.Image) -> dict[str, float]:
@@ -1,5 +1,6 @@
 import os
 from sqlite3 import Cursor
+from typing import Generator
 
 from db.sqlite.sql_basic import create_index_sql
 from db.sqlite.table import ensure_db
@@ -10,14 +11,24 @@ from library.image.sql import *
 class ImageLibTable(EmbeddingRecordTable):
 
     # Add additional columns for image lib
-    # Row format: (id, timestamp, ongoing, uuid, relative_path, path, filename)
+    # - `size`, `mtime` (in nanoseconds) and `hash` (optional, full content hash) are the fingerprint of the file when
+    # it is embedded, they are used to detect changed files in incremental scan
+    # Row format: (id, timestamp, ongoing, uuid, relative_path, path, filename, size, mtime, hash)
     TABLE_STRUCTURE: list[list[str]] = EmbeddingRecordTable.TABLE_STRUCTURE + [
         ['path', 'TEXT'],
         ['filename', 'TEXT'],
+        ['size', 'INTEGER'],
+        ['mtime', 'INTEGER'],
+        ['hash', 'TEXT'],
     ]
 
+    # Columns selected for search results, row format: (uuid, path, filename)
+    SEARCH_RESULT_COLUMNS: list[str] = ['uuid', 'path', 'filename']
+
     def __init__(self, db_path: str):
         super().__init__(db_path)
+        # Fingerprint columns are missing for tables created by previous versions
+        self.ensure_columns()
 
         cursor = self.db.cursor()
         cursor.execute(create_index_sql(self.table_name, 'path'))
@@ -39,3 +50,62 @@ class ImageLibTable(EmbeddingRecordTable):
         cur: Cursor = self.db.cursor()
         cur.execute(select_by_filename_sql(), (filename,))
         return cur
+
+    @ensure_db
+    def iter_fingerprints(self, page_size: int = 1000) -> Generator[tuple[str, int | None, int | None, str | None], None, None]:
+        """Iterate the fingerprints (relative_path, size, mtime, hash) of all embedded files, ordered by relative path
+        - The fingerprint can be (None, None, None) for records created by previous versions
+        - Rows are fetched page by page with the relative path index (keyset pagination), each page is a complete query
+        so the table can be modified between pages, e.g., delete the row just iterated
+        """
+        last_relative_path: str = ''
+        while True:
+            cur: Cursor = self.db.cursor()
+            cur.execute(select_fingerprints_after_sql(), (last_relative_path, page_size))
+            rows: list[tuple] = cur.fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_relative_path = rows[-1][0]
+
+    @ensure_db
+    def get_fingerprint(self, relative_path: str) -> tuple[int | None, int | None, str | None] | None:
+        """Get the fingerprint (size, mtime, hash) of an embedded file, None if the file is not embedded
+        """
+        cur: Cursor = self.db.cursor()
+        cur.execute(select_fingerprint_by_relative_path_sql(), (relative_path,))
+        return cur.fetchone()
+
+    @ensure_db
+    def iter_metadata(self, page_size: int = 1000) -> Generator[tuple[str, str, str, str, int | None], None, None]:
+        """Iterate (relative_path, uuid, path, filename, mtime) of all embedded files, ordered by relative path
+        - Rows are fetched page by page in the same way as `iter_fingerprints()`
+        """
+        last_relative_path: str = ''
+        while True:
+            cur: Cursor = self.db.cursor()
+            cur.execute(select_metadata_after_sql(), (last_relative_path, page_size))
+            rows: list[tuple] = cur.fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_relative_path = rows[-1][0]
+
+    @ensure_db
+    def update_fingerprint(self, relative_path: str, size: int, mtime: int, hash: str | None) -> bool:
+        cur: Cursor = self.db.cursor()
+        cur.execute(update_fingerprint_sql(), (size, mtime, hash, relative_path))
+        self._commit()
+        return cur.rowcount > 0
+
+    @ensure_db
+    def update_record_by_relative_path(self, new_relative_path: str, old_relative_path: str) -> bool:
+        """Update the relative path of a record, and its parent folder and filename accordingly
+        """
+        cur: Cursor = self.db.cursor()
+        cur.execute(update_relative_path_and_location_sql(), (new_relative_path,
+                                                              os.path.dirname(new_relative_path),
+                                                              os.path.basename(new_relative_path),
+                                                              old_relative_path))
+        self._commit()
+        return cur.rowcount > 0
@@ -1,9 +1,10 @@
 import os
 from functools import wraps
+from typing import Iterable
 
 import numpy as np
 from db.vector.mem_vector_db import InMemoryVectorDb
-from db.vector.redis_client import BatchedPipeline
+from db.vector.redis_client import BatchedPipeline, PersistenceStatus
 from db.vector.redis_vector_db import RedisVectorDb
 from loggers import vector_db_logger as LOGGER
 from redis.commands.search.query import Query
@@ -58,19 +59,42 @@ class ImageLibVectorDb:
             self.mem_vector_db.initialize_index(vector_dimension, track_id=True)
 
     @ensure_vector_db_connected
-    def get_save_pipeline(self, batch_size: int = 1000) -> BatchedPipeline:
+    def upgrade_index(self, entries: Iterable[tuple[str, dict]]) -> int:
+        """Upgrade Redis index created by previous versions (see `RedisVectorDb.upgrade_index()`), in-memory vector DB
+        has nothing to upgrade
+        """
+        if self.redis_vector_db:
+            return self.redis_vector_db.upgrade_index(entries)
+        return 0
+
+    @ensure_vector_db_connected
+    def get_save_pipeline(self, batch_size: int = 1000, async_flush: bool = False) -> BatchedPipeline:
         if self.redis_vector_db:
-            return self.redis_vector_db.get_save_pipeline(batch_size)
+            return self.redis_vector_db.get_save_pipeline(batch_size, async_flush=async_flush)
         raise NotImplementedError('In-memory vector DB does not support batched pipeline')
 
     @ensure_vector_db_connected
-    def add(self, uuid: str, embedding: list[float], pipeline: BatchedPipeline | None = None):
+    def add(self,
+            uuid: str,
+            embedding: list[float],
+            pipeline: BatchedPipeline | None = None,
+            metadata: dict | None = None):
+        """Add an embedding to vector DB
+        - Metadata is only saved by Redis vector DB for filtered queries, in-memory vector DB ignores it
+        """
         LOGGER.debug(f'Adding embedding to vector DB')
         if self.redis_vector_db:
-            self.redis_vector_db.add(uuid, embedding, pipeline)
+            self.redis_vector_db.add(uuid, embedding, pipeline, metadata)
         elif self.mem_vector_db:
             self.mem_vector_db.add(uuid, embedding)
 
+    @ensure_vector_db_connected
+    def update_metadata(self, uuid: str, metadata: dict, pipeline: BatchedPipeline | None = None):
+        """Update metadata of an embedding, only for Redis vector DB as in-memory vector DB has no metadata
+        """
+        if self.redis_vector_db:
+            self.redis_vector_db.update_metadata(uuid, metadata, pipeline)
+
     @ensure_vector_db_connected
     def remove(self, uuid: str, pipeline: BatchedPipeline | None = None):
         LOGGER.debug(f'Removing embedding from vector DB')
@@ -112,30 +136,48 @@ class ImageLibVectorDb:
             os.remove(file_path)
 
     @ensure_vector_db_connected
-    def persist(self):
+    def persist(self) -> PersistenceStatus | None:
+        """Persist the vector DB
+        - For redis, the persistence runs in background and its status is returned
+        - For in-memory, the index file is written synchronously and None is returned
+        """
         LOGGER.info('Persisting vector DB')
         if self.redis_vector_db:
-            self.redis_vector_db.persist()
+            return self.redis_vector_db.persist()
         elif self.mem_vector_db:
             self.mem_vector_db.persist()
+        return None
 
     @ensure_vector_db_connected
-    def query(self, embedding: np.ndarray, top_k: int = 10, extra_params: dict | None = None) -> list:
+    def query(self,
+              embedding: np.ndarray,
+              top_k: int = 10,
+              extra_params: dict | None = None,
+              filter_expression: str | None = None) -> list:
         """Query the given embedding against the index for similar images
+
+        Args:
+            filter_expression (str | None, optional): Redis only, a pre-filter on metadata fields (see
+            `make_filter_expression()`), the KNN search runs on filtered entries only. Defaults to None.
         """
         if embedding is None or not top_k or top_k <= 0:
             return list()
 
-        LOGGER.debug(f'Querying vector DB for top {top_k} similar images')
+        LOGGER.debug(f'Querying vector DB for top {top_k} similar images, filter: {filter_expression}')
         if self.redis_vector_db:
             embedding_as_bytes: bytes = embedding.tobytes()
             param: dict = {"query_vector": embedding_as_bytes} if not extra_params else \
                 {"query_vector": embedding_as_bytes} | extra_params
-            query: Query = Query(f'(*)=>[KNN {top_k} @vector $query_vector AS vector_score]')\
-                .sort_by("vector_score").return_fields("$").dialect(2)
+            prefix: str = f'({filter_expression})' if filter_expression else '(*)'
+            # Only keys are returned, file data is read from the embedding record table by the caller
+            # - RediSearch returns 10 results by default (`LIMIT 0 10`), paging is required for more
+            query: Query = Query(f'{prefix}=>[KNN {top_k} @vector $query_vector AS vector_score]')\
+                .sort_by("vector_score").paging(0, top_k).no_content().dialect(2)
             search_result: Result = self.redis_vector_db.get_search().search(query, param)  # type: ignore
             return search_result.docs
         elif self.mem_vector_db:
+            if filter_expression:
+                raise LibraryVectorDbError('Filtered query is only supported by Redis vector DB')
             return self.mem_vector_db.query(embedding, top_k)
         raise LibraryVectorDbError('Vector DB not connected')
 
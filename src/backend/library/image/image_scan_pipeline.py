@@ -0,0 +1,318 @@
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import time
+from typing import Any, Callable
+
+import numpy as np
+import torch
+from knowledge_base.embedding_worker_pool import (EmbeddingWorkerPool,
+                                                  get_embedding_pool)
+from loggers import image_lib_logger as LOGGER
+from torch import Tensor
+from utils.errors.lib_errors import LibraryError
+from utils.errors.task_errors import TaskCancellationException
+from utils.task_runner import report_progress
+
+# Sentinel to mark the end of a stage's output
+STAGE_END: object = object()
+# Timeout in seconds for blocking queue operations, so that stages can check for stop signal periodically
+QUEUE_POLL_INTERVAL: float = 0.1
+# Max number of recently embedded content keys to be remembered by inference stage, so that a duplicate image arrives
+# after the original one is embedded can reuse its embedding before it is written to the embedding store
+RECENT_EMBEDDING_CACHE_SIZE: int = 4096
+
+
+class ScanPipelineConfig:
+    """Worker count and queue depth of each stage for the image scan pipeline
+    """
+
+    def __init__(self,
+                 decode_workers: int = min(8, os.cpu_count() or 1),
+                 decode_queue_depth: int = 64,
+                 batch_size: int = 16,
+                 write_queue_depth: int = 8,
+                 inference_workers: int | None = None):
+        """
+        Args:
+            decode_workers (int, optional): Number of threads to open, decode and preprocess images
+            decode_queue_depth (int, optional): Max number of preprocessed images waiting for inference
+            batch_size (int, optional): Number of images to be embedded in one forward pass
+            write_queue_depth (int, optional): Max number of embedded batches waiting to be written to DBs
+            inference_workers (int | None, optional): Max number of batches in inference at the same time. Defaults
+            to the bulk concurrency of embedding worker pool, or 1 if models run in current process.
+        """
+        self.decode_workers: int = max(1, decode_workers)
+        self.decode_queue_depth: int = max(1, decode_queue_depth)
+        self.batch_size: int = max(1, batch_size)
+        self.write_queue_depth: int = max(1, write_queue_depth)
+        if inference_workers is None:
+            pool: EmbeddingWorkerPool | None = get_embedding_pool()
+            inference_workers = pool.bulk_concurrency if pool else 1
+        self.inference_workers: int = max(1, inference_workers)
+
+
+class DecodedImage:
+    """Output of the decode stage for an image
+    - `tensor` is the preprocessed image to be embedded, it can be None if `embedding` is already known (e.g., reused
+    from the embedding store)
+    - Images with the same `content_key` are byte-identical, only the first one is embedded and others share its embedding
+    """
+
+    def __init__(self,
+                 tensor: Tensor | None = None,
+                 embedding: list[float] | None = None,
+                 content_key: str | None = None):
+        if tensor is None and embedding is None:
+            raise LibraryError('Either tensor or embedding is required')
+        self.tensor: Tensor | None = tensor
+        self.embedding: list[float] | None = embedding
+        self.content_key: str | None = content_key
+
+
+class ImageScanPipeline:
+    """A staged producer/consumer pipeline for embedding images of a library scan
+    1. Decode stage: a thread pool opens, decodes and preprocesses images into tensors, then puts them on a bounded queue
+    2. Inference stage: the caller's thread batches the tensors, and keeps up to `inference_workers` batches running
+    through the model in a thread pool, results are collected in submission order
+    3. Write stage: a single thread commits the embeddings to DBs, so DB writes are never concurrent
+
+    Disk I/O and decoding overlap with inference, and inference overlaps with DB writes
+    - Bounded queues give backpressure to the faster stages
+    - An error on decode is treated as an invalid image and skipped, an error on write stops the pipeline and is
+    raised to the caller
+    - Inference is skipped for images with known embedding, and for duplicates of an image which is already embedded
+    or waiting for inference in current run
+    """
+
+    def __init__(self,
+                 loader: Callable[[str], DecodedImage | None],
+                 embedder: Callable[[Tensor], np.ndarray],
+                 writer: Callable[[list[tuple[str, list[float]]]], None],
+                 config: ScanPipelineConfig | None = None):
+        """
+        Args:
+            loader (Callable[[str], DecodedImage | None]): Load an image by relative path and preprocess it, return
+            None if it is not a valid image
+            embedder (Callable[[Tensor], np.ndarray]): Embed a (N, C, H, W) batch, return a (N, D) matrix
+            writer (Callable[[list[tuple[str, list[float]]]], None]): Write a batch of (relative path, embedding)
+            config (ScanPipelineConfig | None, optional): Stage config. Defaults to None.
+        """
+        self.__loader: Callable[[str], DecodedImage | None] = loader
+        self.__embedder: Callable[[Tensor], np.ndarray] = embedder
+        self.__writer: Callable[[list[tuple[str, list[float]]]], None] = writer
+        self.__config: ScanPipelineConfig = config or ScanPipelineConfig()
+
+        self.__stop_event: Event = Event()
+        self.__write_error: BaseException | None = None
+
+    def __put(self, queue: Queue, item: Any) -> bool:
+        """Put an item to a bounded queue, give up if the pipeline is stopped
+        """
+        while not self.__stop_event.is_set():
+            try:
+                queue.put(item, timeout=QUEUE_POLL_INTERVAL)
+                return True
+            except Full:
+                continue
+        return False
+
+    def __decode_worker(self, path_queue: Queue, decoded_queue: Queue):
+        """Decode stage worker, loads images until the path queue is exhausted
+        """
+        while not self.__stop_event.is_set():
+            relative_path: str | object = path_queue.get()
+            if relative_path is STAGE_END:
+                break
+
+            try:
+                decoded: DecodedImage | None = self.__loader(relative_path)  # type: ignore
+            except BaseException as e:
+                LOGGER.info(f'Invalid image: {relative_path}, skip, error: {e}')
+                decoded = None
+            if not self.__put(decoded_queue, (relative_path, decoded)):
+                return
+        self.__put(decoded_queue, STAGE_END)
+
+    def __write_worker(self, write_queue: Queue):
+        """Write stage worker, writes embedded batches until the end of inference
+        """
+        while True:
+            try:
+                batch: list[tuple[str, list[float]]] | object = write_queue.get(timeout=QUEUE_POLL_INTERVAL)
+            except Empty:
+                if self.__stop_event.is_set():
+                    return
+                continue
+            if batch is STAGE_END:
+                return
+
+            try:
+                self.__writer(batch)  # type: ignore
+            except BaseException as e:
+                LOGGER.error(f'Failed to write embeddings: {e}')
+                self.__write_error = e
+                self.__stop_event.set()
+                return
+
+    def __embed_batch(self, tensors: list[Tensor]) -> np.ndarray:
+        """Embed a batch of images, it runs in the inference thread pool
+        """
+        start: float = time()
+        embeddings: np.ndarray = self.__embedder(torch.stack(tensors))
+        time_taken: float = time() - start
+        LOGGER.info(f'{len(tensors)} images embedded, dimension: {embeddings.shape[1]}, cost: {time_taken:.2f}s')
+        return embeddings
+
+    def __collect_batch(self,
+                        paths: list[str],
+                        keys: list[str | None],
+                        embeddings: np.ndarray,
+                        waiting: dict[str, list[str]],
+                        recent: OrderedDict[str, list[float]]) -> list[tuple[str, list[float]]]:
+        """Return the (relative path, embedding) of an embedded batch and of the duplicates waiting for its images
+        """
+        res: list[tuple[str, list[float]]] = list()
+        for relative_path, key, embedding in zip(paths, keys, embeddings.tolist()):
+            res.append((relative_path, embedding))
+            if key is None:
+                continue
+            for duplicate in waiting.pop(key, list()):
+                res.append((duplicate, embedding))
+            recent[key] = embedding
+            if len(recent) > RECENT_EMBEDDING_CACHE_SIZE:
+                recent.popitem(last=False)
+        return res
+
+    def __check_state(self, cancel_event: Event | None):
+        if self.__write_error is not None:
+            raise LibraryError(f'Failed to write embeddings: {self.__write_error}')
+        if cancel_event is not None and cancel_event.is_set():
+            raise TaskCancellationException('Library initialization cancelled')
+
+    def run(self,
+            relative_paths: list[str],
+            progress_reporter: Callable[[int, int, str | None], None] | None = None,
+            cancel_event: Event | None = None) -> int:
+        """Run the pipeline on given images and block until all of them are written, return the number of images written
+        """
+        total: int = len(relative_paths)
+        if not total:
+            return 0
+
+        workers: int = min(self.__config.decode_workers, total)
+        path_queue: Queue = Queue()
+        for relative_path in relative_paths:
+            path_queue.put(relative_path)
+        for _ in range(workers):
+            path_queue.put(STAGE_END)
+        decoded_queue: Queue = Queue(maxsize=self.__config.decode_queue_depth)
+        write_queue: Queue = Queue(maxsize=self.__config.write_queue_depth)
+
+        LOGGER.info(f'Start scan pipeline for {total} files, decode workers: {workers}, '
+                    f'batch size: {self.__config.batch_size}, inference workers: {self.__config.inference_workers}')
+        self.__stop_event.clear()
+        self.__write_error = None
+        writer_thread: Thread = Thread(target=self.__write_worker, args=(write_queue,), name='scan-pipeline-writer')
+        writer_thread.start()
+        decode_pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan-pipeline-decoder')
+        for _ in range(workers):
+            decode_pool.submit(self.__decode_worker, path_queue, decoded_queue)
+        inference_pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=self.__config.inference_workers,
+                                                                thread_name_prefix='scan-pipeline-inference')
+
+        embedded: int = 0
+        reused: int = 0
+        try:
+            # Inference stage, batches are built and their results are collected on current thread
+            finished_workers: int = 0
+            processed: int = 0
+            previous_progress: int = -1
+            pending_paths: list[str] = list()
+            pending_tensors: list[Tensor] = list()
+            pending_keys: list[str | None] = list()
+            # Embeddings ready to be written, and duplicates waiting for the inference of the first image with same key
+            ready: list[tuple[str, list[float]]] = list()
+            waiting: dict[str, list[str]] = dict()
+            recent: OrderedDict[str, list[float]] = OrderedDict()
+            # Batches in inference, as (paths, keys, future of embeddings), in submission order
+            in_flight: deque[tuple[list[str], list[str | None], Future]] = deque()
+
+            def collect_oldest():
+                nonlocal embedded
+                paths, keys, future = in_flight.popleft()
+                ready.extend(self.__collect_batch(paths, keys, future.result(), waiting, recent))
+                embedded += len(paths)
+
+            while finished_workers < workers:
+                self.__check_state(cancel_event)
+                try:
+                    item: tuple[str, Tensor | None] | object = decoded_queue.get(timeout=QUEUE_POLL_INTERVAL)
+                except Empty:
+                    continue
+                if item is STAGE_END:
+                    finished_workers += 1
+                    continue
+
+                # If reporter is given, report progress to task manager
+                # - Reduce report frequency, only report when progress changes
+                processed += 1
+                current_progress: int = int(processed / total * 100)
+                if current_progress > previous_progress:
+                    previous_progress = current_progress
+                    report_progress(progress_reporter, current_progress)
+
+                relative_path, decoded = item  # type: ignore
+                if decoded is None:
+                    continue
+                key: str | None = decoded.content_key
+                if decoded.embedding is not None:
+                    ready.append((relative_path, decoded.embedding))
+                    reused += 1
+                elif key is not None and key in recent:
+                    recent.move_to_end(key)
+                    ready.append((relative_path, recent[key]))
+                    reused += 1
+                elif key is not None and key in waiting:
+                    waiting[key].append(relative_path)
+                    reused += 1
+                else:
+                    pending_paths.append(relative_path)
+                    pending_tensors.append(decoded.tensor)  # type: ignore
+                    pending_keys.append(key)
+                    if key is not None:
+                        waiting[key] = list()
+
+                if len(pending_tensors) >= self.__config.batch_size:
+                    if len(in_flight) >= self.__config.inference_workers:
+                        collect_oldest()
+                    in_flight.append((pending_paths, pending_keys,
+                                      inference_pool.submit(self.__embed_batch, pending_tensors)))
+                    pending_paths, pending_tensors, pending_keys = list(), list(), list()
+                while in_flight and in_flight[0][2].done():
+                    collect_oldest()
+                if len(ready) >= self.__config.batch_size:
+                    self.__put(write_queue, ready)
+                    ready = list()
+
+            if pending_tensors:
+                in_flight.append((pending_paths, pending_keys, inference_pool.submit(self.__embed_batch, pending_tensors)))
+            while in_flight:
+                self.__check_state(cancel_event)
+                collect_oldest()
+            if ready:
+                self.__put(write_queue, ready)
+            self.__put(write_queue, STAGE_END)
+        except BaseException:
+            self.__stop_event.set()
+            raise
+        finally:
+            writer_thread.join()
+            decode_pool.shutdown(wait=True)
+            inference_pool.shutdown(wait=True, cancel_futures=True)
+
+        self.__check_state(None)
+        LOGGER.info(f'Scan pipeline finished, {embedded} images embedded, {reused} embeddings reused')
+        return embedded + reused
@@ -0,0 +1,102 @@
+from datetime import datetime
+from sqlite3 import Connection, Cursor
+
+from db.sqlite.sql_basic import *
+from db.sqlite.table import SqliteTable, ensure_db
+from library.image.sql import *
+
+
+class ImageTagTable(SqliteTable):
+    """Tags of images predicted by the image tagger, keyed by image UUID
+    - The (tag, score) indexes are the inverted index from a tag to its images, so searching images by tag is an index
+    range scan, and no model inference is needed at query time
+    - Tags of an image are kept when the image is moved or renamed, as its UUID is not changed
+    - Tags of deleted images are filtered out by joining embedding records, and purged by `delete_orphans()`
+    - The table is in the DB of embedding records and shares its connection, as a second connection to the DB would
+    get "database is locked" errors while the other one is in a write transaction
+    """
+
+    # Row format: (id, uuid, tag, tag_cn, score)
+    TABLE_STRUCTURE: list[list[str]] = [
+        ['id', 'INTEGER PRIMARY KEY'],
+        ['uuid', 'TEXT NOT NULL'],
+        ['tag', 'TEXT NOT NULL'],
+        ['tag_cn', 'TEXT NOT NULL'],
+        ['score', 'REAL NOT NULL'],
+    ]
+    # Row format: (uuid, tagged_on)
+    TAGGED_IMAGE_TABLE_STRUCTURE: list[list[str]] = [
+        ['uuid', 'TEXT PRIMARY KEY'],
+        ['tagged_on', 'INTEGER NOT NULL'],
+    ]
+
+    def __init__(self, connection: Connection):
+        super().__init__(None, IMAGE_TAG_TABLE_NAME, connection=connection)
+
+        cursor = self.db.cursor()
+        cursor.execute(initialize_table_sql(
+            table_name=IMAGE_TAG_TABLE_NAME,
+            table_structure=self.TABLE_STRUCTURE
+        ))
+        cursor.execute(initialize_table_sql(
+            table_name=TAGGED_IMAGE_TABLE_NAME,
+            table_structure=self.TAGGED_IMAGE_TABLE_STRUCTURE
+        ))
+        cursor.execute(create_index_sql(self.table_name, 'uuid'))
+        cursor.execute(create_tag_index_sql(en=True))
+        cursor.execute(create_tag_index_sql(en=False))
+        self.db.commit()
+
+    @ensure_db
+    def get_untagged_images(self) -> list[tuple[str, str]]:
+        """Get (UUID, relative path) of embedded images which are not tagged yet
+        """
+        cur: Cursor = self.db.cursor()
+        cur.execute(select_untagged_images_sql())
+        return cur.fetchall()
+
+    @ensure_db
+    def save_tags(self, uuid: str, tags: list[tuple[str, str, float]]):
+        """Replace the tags of an image with given (tag, Chinese tag, score), and mark it as tagged
+        """
+        cur: Cursor = self.db.cursor()
+        cur.execute(delete_tags_by_uuid_sql(), (uuid,))
+        insert_sql: str = insert_row_sql(table_name=self.table_name, table_structure=self.TABLE_STRUCTURE)
+        cur.executemany(insert_sql, [(uuid, tag, tag_cn, score) for tag, tag_cn, score in tags])
+        cur.execute(insert_tagged_image_sql(), (uuid, int(datetime.now().timestamp())))
+        self._commit()
+
+    @ensure_db
+    def get_tags(self, uuid: str, top_k: int = 10, en: bool = False) -> list[tuple[str, float]]:
+        """Get top K (tag, score) of an image, ordered by score
+        """
+        cur: Cursor = self.db.cursor()
+        cur.execute(select_tags_by_uuid_sql(en), (uuid, top_k))
+        return cur.fetchall()
+
+    @ensure_db
+    def search_by_tag(self, tag: str, top_k: int = 10, offset: int = 0, en: bool = False) -> list[tuple]:
+        """Get images with given tag, ordered by the score of the tag, supports paging by `offset`
+
+        Returns: Rows in search result format (uuid, path, filename)
+        """
+        cur: Cursor = self.db.cursor()
+        cur.execute(select_images_by_tag_sql(en), (tag, top_k, offset))
+        return cur.fetchall()
+
+    @ensure_db
+    def get_tag_counts(self, top_k: int = 100, en: bool = False) -> list[tuple[str, int]]:
+        """Get top K most used (tag, image count)
+        """
+        cur: Cursor = self.db.cursor()
+        cur.execute(select_tag_counts_sql(en), (top_k,))
+        return cur.fetchall()
+
+    @ensure_db
+    def delete_orphans(self):
+        """Delete tags of images which are no longer in embedding records
+        """
+        cur: Cursor = self.db.cursor()
+        cur.execute(delete_orphan_tags_sql())
+        cur.execute(delete_orphan_tagged_images_sql())
+        self.db.commit()
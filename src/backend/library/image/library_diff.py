@@ -0,0 +1,45 @@
+import os
+from typing import Generator, Iterator
+
+from utils.containable_enum import ContainableEnum
+
+
+class DiffType(ContainableEnum):
+    NEW = 'new'
+    DELETED = 'deleted'
+    EXISTING = 'existing'
+
+
+def merge_diff(files: Iterator[tuple[str, os.stat_result]],
+               records: Iterator[tuple[str, int | None, int | None, str | None]]) \
+        -> Generator[tuple[DiffType, str, os.stat_result | None, tuple | None], None, None]:
+    """Diff the files in library with the embedding records, by merging two streams sorted by relative path
+    - Only the current item of each stream is held in memory, the DB is scanned once sequentially
+    - Both streams must be sorted in the same order, see `FileOperator.folder_scanner()` and
+    `ImageLibTable.iter_fingerprints()`
+
+    Args:
+        files (Iterator[tuple[str, os.stat_result]]): Sorted (relative path, stat) of files in library
+        records (Iterator[tuple[str, int | None, int | None, str | None]]): Sorted (relative path, size, mtime, hash)
+        of embedding records
+
+    Returns:
+        Generator[tuple[DiffType, str, os.stat_result | None, tuple | None], None, None]: (diff type, relative path,
+        stat of the file, fingerprint record)
+        - NEW: file is not embedded, record is None
+        - DELETED: record's file no longer exists, stat is None
+        - EXISTING: file is embedded, its stat and record are both given to check if it is changed
+    """
+    file: tuple[str, os.stat_result] | None = next(files, None)
+    record: tuple | None = next(records, None)
+    while file is not None or record is not None:
+        if record is None or (file is not None and file[0] < record[0]):
+            yield DiffType.NEW, file[0], file[1], None  # type: ignore
+            file = next(files, None)
+        elif file is None or record[0] < file[0]:
+            yield DiffType.DELETED, record[0], None, record
+            record = next(records, None)
+        else:
+            yield DiffType.EXISTING, file[0], file[1], record
+            file = next(files, None)
+            record = next(records, None)
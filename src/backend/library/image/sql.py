@@ -5,6 +5,20 @@ from library.sql import EMBEDDING_RECORD_TABLE_NAME
 # - Table name `EMBEDDING_RECORD_TABLE_NAME` is fixed
 DB_NAME: str = 'ImageLib.db'
 
+# Content-addressed embedding store, it locates in current library's data folder, or in config folder if it is shared
+# across libraries
+# - The key is `<model name>:<file hash>`, so embeddings of different models are never mixed
+EMBEDDING_STORE_DB_NAME: str = 'EmbeddingStore.db'
+EMBEDDING_STORE_TABLE_NAME: str = 'embedding_store'
+
+# Tags of images predicted by the image tagger, they are in the same DB as embedding records
+# - Each row is a tag of an image (by UUID) with its score, and the (tag, score) index is the inverted index for
+# searching images by tag
+# - An image is recorded in the tagged image table once it is tagged, even if no tag is above the threshold, so it is
+# never tagged again
+IMAGE_TAG_TABLE_NAME: str = 'image_tag'
+TAGGED_IMAGE_TABLE_NAME: str = 'tagged_image'
+
 
 def select_by_path_sql() -> str:
     return f"""
@@ -16,3 +30,112 @@ def select_by_filename_sql() -> str:
     return f"""
     SELECT * FROM "{EMBEDDING_RECORD_TABLE_NAME}" WHERE filename = ?;
     """
+
+
+def select_fingerprints_after_sql() -> str:
+    return f"""
+    SELECT relative_path, size, mtime, hash FROM "{EMBEDDING_RECORD_TABLE_NAME}"
+    WHERE ongoing = 0 AND relative_path > ? ORDER BY relative_path LIMIT ?;
+    """
+
+
+def select_fingerprint_by_relative_path_sql() -> str:
+    return f"""
+    SELECT size, mtime, hash FROM "{EMBEDDING_RECORD_TABLE_NAME}" WHERE relative_path = ? AND ongoing = 0;
+    """
+
+
+def select_metadata_after_sql() -> str:
+    return f"""
+    SELECT relative_path, uuid, path, filename, mtime FROM "{EMBEDDING_RECORD_TABLE_NAME}"
+    WHERE ongoing = 0 AND relative_path > ? ORDER BY relative_path LIMIT ?;
+    """
+
+
+def update_fingerprint_sql() -> str:
+    return f"""
+    UPDATE "{EMBEDDING_RECORD_TABLE_NAME}" SET size = ?, mtime = ?, hash = ? WHERE relative_path = ?;
+    """
+
+
+def select_embedding_by_content_key_sql() -> str:
+    return f"""
+    SELECT embedding FROM "{EMBEDDING_STORE_TABLE_NAME}" WHERE content_key = ?;
+    """
+
+
+def insert_embedding_ignore_sql() -> str:
+    return f"""
+    INSERT OR IGNORE INTO "{EMBEDDING_STORE_TABLE_NAME}" (content_key, embedding) VALUES (?, ?);
+    """
+
+
+def update_relative_path_and_location_sql() -> str:
+    return f"""
+    UPDATE "{EMBEDDING_RECORD_TABLE_NAME}" SET relative_path = ?, path = ?, filename = ? WHERE relative_path = ? AND ongoing = 0;
+    """
+
+
+def select_tags_by_uuid_sql(en: bool) -> str:
+    tag_column: str = 'tag' if en else 'tag_cn'
+    return f"""
+    SELECT {tag_column}, score FROM "{IMAGE_TAG_TABLE_NAME}" WHERE uuid = ? ORDER BY score DESC LIMIT ?;
+    """
+
+
+def select_images_by_tag_sql(en: bool) -> str:
+    tag_column: str = 'tag' if en else 'tag_cn'
+    return f"""
+    SELECT r.uuid, r.path, r.filename FROM "{IMAGE_TAG_TABLE_NAME}" t
+    JOIN "{EMBEDDING_RECORD_TABLE_NAME}" r ON r.uuid = t.uuid AND r.ongoing = 0
+    WHERE t.{tag_column} = ? ORDER BY t.score DESC LIMIT ? OFFSET ?;
+    """
+
+
+def select_tag_counts_sql(en: bool) -> str:
+    tag_column: str = 'tag' if en else 'tag_cn'
+    return f"""
+    SELECT {tag_column}, COUNT(*) AS image_count FROM "{IMAGE_TAG_TABLE_NAME}"
+    GROUP BY {tag_column} ORDER BY image_count DESC LIMIT ?;
+    """
+
+
+def select_untagged_images_sql() -> str:
+    return f"""
+    SELECT r.uuid, r.relative_path FROM "{EMBEDDING_RECORD_TABLE_NAME}" r
+    WHERE r.ongoing = 0 AND NOT EXISTS (SELECT 1 FROM "{TAGGED_IMAGE_TABLE_NAME}" g WHERE g.uuid = r.uuid);
+    """
+
+
+def insert_tagged_image_sql() -> str:
+    return f"""
+    INSERT OR REPLACE INTO "{TAGGED_IMAGE_TABLE_NAME}" (uuid, tagged_on) VALUES (?, ?);
+    """
+
+
+def delete_tags_by_uuid_sql() -> str:
+    return f"""
+    DELETE FROM "{IMAGE_TAG_TABLE_NAME}" WHERE uuid = ?;
+    """
+
+
+def delete_orphan_tags_sql() -> str:
+    return f"""
+    DELETE FROM "{IMAGE_TAG_TABLE_NAME}"
+    WHERE uuid NOT IN (SELECT uuid FROM "{EMBEDDING_RECORD_TABLE_NAME}" WHERE uuid IS NOT NULL);
+    """
+
+
+def delete_orphan_tagged_images_sql() -> str:
+    return f"""
+    DELETE FROM "{TAGGED_IMAGE_TABLE_NAME}"
+    WHERE uuid NOT IN (SELECT uuid FROM "{EMBEDDING_RECORD_TABLE_NAME}" WHERE uuid IS NOT NULL);
+    """
+
+
+def create_tag_index_sql(en: bool) -> str:
+    tag_column: str = 'tag' if en else 'tag_cn'
+    return f"""
+    CREATE INDEX IF NOT EXISTS "{IMAGE_TAG_TABLE_NAME}_{tag_column}_score_idx"
+    ON "{IMAGE_TAG_TABLE_NAME}" ({tag_column}, score DESC);
+    """
@@ -0,0 +1,88 @@
+import os
+from uuid import uuid4
+
+from constants.lib_constants import ThumbnailSize
+from loggers import image_lib_logger as LOGGER
+from PIL import Image, features
+from utils.file_helper import load_image_for_model
+
+# Quality of encoded thumbnails, for both WebP and JPEG
+THUMBNAIL_QUALITY: int = 80
+
+
+class ThumbnailCache:
+    """A content-addressed thumbnail cache of an image library
+    - Thumbnails are keyed by the content hash of the image, so they survive renames and moves, and copies of an image
+    share the same thumbnails
+    - Each size has its own folder, and files are fanned out by the first 2 characters of the hash:
+    `<folder>/<size>/<hash[:2]>/<hash>.<extension>`
+    - Thumbnails are encoded as WebP, or as JPEG if Pillow is built without WebP support
+    - Files are written to a temp file then renamed, so a reader never sees a partially written thumbnail, and
+    concurrent writers of the same thumbnail do not break each other
+    - Entries are never invalidated, a thumbnail of a deleted image is only removed with the library data folder
+    """
+
+    def __init__(self, folder: str):
+        self.folder: str = folder
+        self.format: str = 'WEBP' if features.check('webp') else 'JPEG'
+        self.mime_type: str = f'image/{self.format.lower()}'
+        self.__extension: str = 'webp' if self.format == 'WEBP' else 'jpg'
+
+    """
+    Private methods
+    """
+
+    def __write(self, path: str, img: Image.Image, size: ThumbnailSize):
+        thumbnail: Image.Image = img.copy()
+        thumbnail.thumbnail((size.value, size.value))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path: str = f'{path}.{uuid4().hex}.tmp'
+        try:
+            thumbnail.save(temp_path, format=self.format, quality=THUMBNAIL_QUALITY)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    """
+    Public methods
+    """
+
+    def get_path(self, content_hash: str, size: ThumbnailSize) -> str:
+        return os.path.join(self.folder, size.name.lower(), content_hash[:2], f'{content_hash}.{self.__extension}')
+
+    def exists(self, content_hash: str, size: ThumbnailSize) -> bool:
+        return os.path.isfile(self.get_path(content_hash, size))
+
+    def put(self, content_hash: str, img: Image.Image, size: ThumbnailSize = ThumbnailSize.SMALL):
+        """Save the thumbnail of an already decoded image if it does not exist, the given image is not modified
+        - The image should not be smaller than the thumbnail size, otherwise the thumbnail is not sharp
+        """
+        path: str = self.get_path(content_hash, size)
+        if not os.path.isfile(path):
+            self.__write(path, img, size)
+
+    def get(self, content_hash: str, size: ThumbnailSize) -> bytes | None:
+        """Read the encoded bytes of a thumbnail, return None if it is not cached
+        """
+        try:
+            with open(self.get_path(content_hash, size), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get_or_create(self, content_hash: str, size: ThumbnailSize, source_path: str) -> bytes | None:
+        """Read the encoded bytes of a thumbnail, decode the source image to generate it on cache miss
+        - Return None if the source image cannot be decoded
+        """
+        data: bytes | None = self.get(content_hash, size)
+        if data is not None:
+            return data
+
+        try:
+            img: Image.Image = load_image_for_model(source_path, size.value)
+            self.__write(self.get_path(content_hash, size), img, size)
+        except BaseException as e:
+            LOGGER.info(f'Failed to generate thumbnail for: {source_path}, error: {e}')
+            return None
+        return self.get(content_hash, size)
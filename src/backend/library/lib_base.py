@@ -64,6 +64,8 @@ class LibraryBase:
 
     # Metadata for the library
     METADATA_FILE: str = 'metadata.bin'
+    # Type of the library, one of LibTypes, it lets callers check library type without importing library classes
+    LIB_TYPE: str = ''
 
     def __init__(self, lib_path: str):
         LOGGER.info(f'Instanizing library: {lib_path}')
@@ -162,6 +164,12 @@ class LibraryBase:
         """
         raise NotImplementedError()
 
+    def _update_record_by_relative_path(self, new_relative_path: str, old_relative_path: str) -> bool:
+        """Update the embedding record of a moved or renamed file, it is the `update_record` callback of file operator
+        - Override it if the library keeps other data by relative path, e.g., metadata in vector DB
+        """
+        return self._embedding_table.update_record_by_relative_path(new_relative_path, old_relative_path)  # type: ignore
+
     """
     File/folder A/R/W/D operation methods
     - Do pre-checks and call the file operator to do the actual work
@@ -182,29 +190,31 @@ class LibraryBase:
 
         all_success: bool = True
         dest_folder_relative_path = dest_folder_relative_path.strip().lstrip(os.path.sep)
-        for relative_path in relative_paths:
-            relative_path = relative_path.strip().lstrip(os.path.sep)
-            LOGGER.info(f'Prepare to move item from {relative_path} to {dest_folder_relative_path}')
-            full_path: str = os.path.join(self.path_lib, relative_path)
-            if not os.path.exists(full_path):
-                continue
-
-            name: str = os.path.basename(relative_path)
-            new_relative_path: str = os.path.join(dest_folder_relative_path, name)
-            if relative_path == new_relative_path:
-                continue
-
-            # Update the scan record with new relative path to retain the embedding information
-            if os.path.isfile(full_path):
-                all_success = self._file_operator.move_file(relative_path,
-                                                            new_relative_path,
-                                                            is_rename=False,
-                                                            update_record=self._embedding_table.update_record_by_relative_path) and all_success  # type: ignore
-            else:
-                all_success = self._file_operator.move_folder(relative_path,
-                                                              new_relative_path,
-                                                              is_rename=False,
-                                                              update_record=self._embedding_table.update_record_by_relative_path) and all_success  # type: ignore
+        # Record updates of all moved files are committed together
+        with self._embedding_table.write_batch():
+            for relative_path in relative_paths:
+                relative_path = relative_path.strip().lstrip(os.path.sep)
+                LOGGER.info(f'Prepare to move item from {relative_path} to {dest_folder_relative_path}')
+                full_path: str = os.path.join(self.path_lib, relative_path)
+                if not os.path.exists(full_path):
+                    continue
+
+                name: str = os.path.basename(relative_path)
+                new_relative_path: str = os.path.join(dest_folder_relative_path, name)
+                if relative_path == new_relative_path:
+                    continue
+
+                # Update the scan record with new relative path to retain the embedding information
+                if os.path.isfile(full_path):
+                    all_success = self._file_operator.move_file(relative_path,
+                                                                new_relative_path,
+                                                                is_rename=False,
+                                                                update_record=self._update_record_by_relative_path) and all_success
+                else:
+                    all_success = self._file_operator.move_folder(relative_path,
+                                                                  new_relative_path,
+                                                                  is_rename=False,
+                                                                  update_record=self._update_record_by_relative_path) and all_success
         return all_success
 
     def rename_file(self, relative_path: str, new_name: str) -> bool:
@@ -241,12 +251,12 @@ class LibraryBase:
             return self._file_operator.move_file(relative_path,
                                                  new_relative_path,
                                                  is_rename=True,
-                                                 update_record=self._embedding_table.update_record_by_relative_path)  # type: ignore
+                                                 update_record=self._update_record_by_relative_path)
         else:
             return self._file_operator.move_folder(relative_path,
                                                    new_relative_path,
                                                    is_rename=True,
-                                                   update_record=self._embedding_table.update_record_by_relative_path)  # type: ignore
+                                                   update_record=self._update_record_by_relative_path)
 
     def delete_files(self, relative_paths: list[str]) -> bool:
         """Delete the given files/folders from disk and its embedding
@@ -258,38 +268,40 @@ class LibraryBase:
             return False
 
         all_success: bool = True
-        for relative_path in relative_paths:
-            LOGGER.info(f'Prepare to delete item: {relative_path}')
-            relative_path = relative_path.strip().lstrip(os.path.sep)
-            if not relative_path:
-                continue
-
-            full_path: str = os.path.join(self.path_lib, relative_path)
-            if not os.path.exists(full_path):
-                continue
-
-            # Delete embedding first, if success then delete the file
-            if os.path.isfile(full_path):
-                LOGGER.info(f'Delete file {relative_path} from library')
-                if self.delete_file_embedding(relative_path):
-                    all_success = self._file_operator.delete_file(relative_path) and all_success
-                else:
-                    all_success = False
-            else:
-                folder_success: bool = True
-                LOGGER.info(f'Delete folder {relative_path} from library')
-                for r in self._file_operator.folder_walker(relative_path):
-                    if self.delete_file_embedding(r):
-                        folder_success = self._file_operator.delete_file(r) and folder_success
-                    else:
-                        folder_success = False
+        # Embedding removals of all deleted files are committed together
+        with self._embedding_table.write_batch():
+            for relative_path in relative_paths:
+                LOGGER.info(f'Prepare to delete item: {relative_path}')
+                relative_path = relative_path.strip().lstrip(os.path.sep)
+                if not relative_path:
+                    continue
 
-                all_success = folder_success and all_success
-                if folder_success:
-                    shutil.rmtree(full_path)
-                    LOGGER.info(f'Folder {relative_path} deleted')
+                full_path: str = os.path.join(self.path_lib, relative_path)
+                if not os.path.exists(full_path):
+                    continue
+
+                # Delete embedding first, if success then delete the file
+                if os.path.isfile(full_path):
+                    LOGGER.info(f'Delete file {relative_path} from library')
+                    if self.delete_file_embedding(relative_path):
+                        all_success = self._file_operator.delete_file(relative_path) and all_success
+                    else:
+                        all_success = False
                 else:
-                    LOGGER.info(f'Not all files under folder {relative_path} are successfully deleted')
+                    folder_success: bool = True
+                    LOGGER.info(f'Delete folder {relative_path} from library')
+                    for r in self._file_operator.folder_walker(relative_path):
+                        if self.delete_file_embedding(r):
+                            folder_success = self._file_operator.delete_file(r) and folder_success
+                        else:
+                            folder_success = False
+
+                    all_success = folder_success and all_success
+                    if folder_success:
+                        shutil.rmtree(full_path)
+                        LOGGER.info(f'Folder {relative_path} deleted')
+                    else:
+                        LOGGER.info(f'Not all files under folder {relative_path} are successfully deleted')
 
         return all_success
 
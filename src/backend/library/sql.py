@@ -1,3 +1,5 @@
+from db.sqlite.sql_basic import in_params_sql
+
 # This is the table of embedding record
 # - Each embedding record has a relative path of this embedded file under the root directory with a UUID to identify this file
 # - The `ongoing` column is used to indicate whether this file has finished embedding or not
@@ -27,6 +29,19 @@ def select_by_uuid_sql(ongoing: bool | None = None) -> str:
     """
 
 
+def select_by_uuids_sql(count: int, columns: list[str] | None = None, ongoing: bool | None = None) -> str:
+    """Select rows by `count` UUIDs, the UUID is always the first column of selected rows, followed by given columns or
+    all columns if `columns` is not given
+    """
+    state_str: str = ''
+    if ongoing is not None:
+        state_str = f'AND ongoing = {1 if ongoing else 0}'
+    projection: str = ', '.join(columns) if columns else '*'
+    return f"""
+    SELECT uuid, {projection} FROM "{EMBEDDING_RECORD_TABLE_NAME}" WHERE uuid IN {in_params_sql(count)} {state_str};
+    """
+
+
 def select_by_relative_path_sql(ongoing: bool | None = None) -> str:
     state_str: str = ''
     if ongoing is not None:
@@ -54,6 +69,18 @@ def select_all_sql(ongoing: bool | None = None) -> str:
     """
 
 
+def select_uuids_after_id_sql() -> str:
+    return f"""
+    SELECT uuid FROM "{EMBEDDING_RECORD_TABLE_NAME}" WHERE id > ?;
+    """
+
+
+def select_relative_paths_in_range_sql() -> str:
+    return f"""
+    SELECT relative_path FROM "{EMBEDDING_RECORD_TABLE_NAME}" WHERE relative_path >= ? AND relative_path < ? AND ongoing = 0;
+    """
+
+
 def update_relative_path_by_uuid_sql(ongoing: bool | None = None) -> str:
     state_str: str = ''
     if ongoing is not None:
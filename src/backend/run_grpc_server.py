@@ -1,5 +1,7 @@
 from constants.env import GRPC_PORT
-from singletons import grpc_server
 
 if __name__ == '__main__':
+    # Singletons are created under the main guard, embedding workers are spawned processes which re-import this module
+    # as `__mp_main__`, they must not build their own server and library manager
+    from singletons import grpc_server
     grpc_server.start(GRPC_PORT)
@@ -0,0 +1,73 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import grpc
+from constants.env import GRPC_PORT
+from server.grpc.backend_pb2_grpc import GrpcServerStub
+from server.grpc.obj_basic_pb2 import VoidObj
+
+# The server must answer heartbeat within given seconds after its process is started
+STARTUP_BUDGET_SECONDS: float = 1.0
+RUN_COUNT: int = 5
+HEARTBEAT_TIMEOUT_SECONDS: int = 30
+# Modules which take seconds to import, they must not be imported before the server starts
+HEAVY_MODULES: list[str] = ['torch', 'transformers', 'sentence_transformers', 'faiss', 'torchvision']
+# Import the boot path of the server in a fresh interpreter, print heavy modules imported by it
+IMPORT_CHECK_SCRIPT: str = f'''
+import json, sys
+import server.grpc_server, utils.lib_manager, utils.task_runner
+print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))
+'''
+
+
+def check_boot_imports() -> list[str]:
+    """Return heavy modules imported by the boot path of the server
+    """
+    output: str = subprocess.check_output([sys.executable, '-c', IMPORT_CHECK_SCRIPT], cwd=Path(__file__).parent)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_time_to_heartbeat() -> float:
+    """Start the server in a new process, return seconds from process start to the first successful heartbeat
+    """
+    server_file: str = f'{Path(__file__).parent}/run_grpc_server.py'
+    start: float = time.perf_counter()
+    process: subprocess.Popen = subprocess.Popen([sys.executable, server_file],
+                                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with grpc.insecure_channel(f'localhost:{GRPC_PORT}') as channel:
+            stub: GrpcServerStub = GrpcServerStub(channel)
+            while time.perf_counter() - start < HEARTBEAT_TIMEOUT_SECONDS:
+                if process.poll() is not None:
+                    raise RuntimeError(f'Server exited with code: {process.returncode}')
+                try:
+                    if stub.heartbeat(VoidObj(), timeout=0.1).value:
+                        return time.perf_counter() - start
+                except grpc.RpcError:
+                    time.sleep(0.01)
+        raise TimeoutError(f'Server did not answer heartbeat in {HEARTBEAT_TIMEOUT_SECONDS}s')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_benchmark() -> bool:
+    """Run the startup benchmark, return False if startup time regresses
+    """
+    heavy_modules: list[str] = check_boot_imports()
+    if heavy_modules:
+        print(f'Heavy modules imported on boot: {heavy_modules}')
+
+    timings: list[float] = [measure_time_to_heartbeat() for _ in range(RUN_COUNT)]
+    median: float = statistics.median(timings)
+    print(f'Time to first heartbeat in {RUN_COUNT} runs, median: {median:.3f}s, min: {min(timings):.3f}s, '
+          f'max: {max(timings):.3f}s, budget: {STARTUP_BUDGET_SECONDS:.3f}s')
+    return not heavy_modules and median <= STARTUP_BUDGET_SECONDS
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run_benchmark() else 1)
@@ -1,13 +1,14 @@
 import importlib
+import json
 from datetime import datetime
 from functools import wraps
 from time import time
-from types import ModuleType
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-from library.document.doc_lib import DocumentLib
+from constants.lib_constants import LibTypes, ThumbnailSize
+from db.vector.redis_vector_db import make_filter_expression
+from knowledge_base.micro_batcher import get_all_metrics
 from library.document.doc_provider_base import DocumentType
-from library.image.image_lib import ImageLib
 from library.lib_base import LibraryBase
 from loggers import rpc_logger as LOGGER
 from server.grpc.backend_pb2_grpc import GrpcServerServicer
@@ -18,10 +19,17 @@ from utils.file_helper import open_base64_as_image
 from utils.lib_manager import LibInfo, LibraryManager
 from utils.task_runner import TaskInfo, TaskRunner
 
-DOC_PROVIDER_MODULE_NAME: str = 'library.document.doc_provider'
-WECHAT_PROVIDER_MODULE_NAME: str = 'library.document.wechat.wechat_history_provider'
-DOC_PROVIDER_MODULE: ModuleType = importlib.import_module(DOC_PROVIDER_MODULE_NAME)
-WECHAT_PROVIDER_MODULE: ModuleType = importlib.import_module(WECHAT_PROVIDER_MODULE_NAME)
+# Library classes import model libraries, they are imported for type hints only so that the server starts without them
+# - Library instances are created by LibraryManager in background, use `LIB_TYPE` to check the type of an instance
+if TYPE_CHECKING:
+    from library.document.doc_lib import DocumentLib
+    from library.image.image_lib import ImageLib
+
+# Provider modules are imported on first use
+DOC_PROVIDER_MODULE_NAMES: list[str] = [
+    'library.document.doc_provider',
+    'library.document.wechat.wechat_history_provider',
+]
 
 
 def log_rpc_call(func):
@@ -45,18 +53,20 @@ def get_doc_provider_type(type_name: str) -> type | None:
     if not type_name:
         return None
 
-    potential_provider: type | None = None
-    try:
-        potential_provider = getattr(DOC_PROVIDER_MODULE, type_name)
-    except AttributeError:
-        pass
-    if not potential_provider:
-        try:
-            potential_provider = getattr(WECHAT_PROVIDER_MODULE, type_name)
-        except AttributeError:
-            pass
+    for module_name in DOC_PROVIDER_MODULE_NAMES:
+        potential_provider: type | None = getattr(importlib.import_module(module_name), type_name, None)
+        if potential_provider:
+            return potential_provider
+    return None
+
 
-    return potential_provider
+def get_image_filter_expression(request: ImageLibQueryObj) -> str | None:
+    """Build the metadata pre-filter of similarity search from the query, None if no filter is given
+    """
+    return make_filter_expression(path=request.filter_path if request.HasField('filter_path') else None,
+                                  filename=request.filter_filename or None,
+                                  start_time=request.start_time if request.HasField('start_time') else None,
+                                  end_time=request.end_time if request.HasField('end_time') else None)
 
 
 class Servicer(GrpcServerServicer):
@@ -87,6 +97,10 @@ class Servicer(GrpcServerServicer):
     def heartbeat(self, request: VoidObj, context) -> BooleanObj:
         return BooleanObj(value=True)
 
+    @log_rpc_call
+    def get_embedder_metrics(self, request: VoidObj, context) -> StringObj:
+        return StringObj(value=json.dumps(get_all_metrics()))
+
     """`
     Task APIs
     """
@@ -257,7 +271,7 @@ class Servicer(GrpcServerServicer):
     def query_text(self, request: DocLibQueryObj, context) -> ListOfDocLibQueryResponseObj:
         response: ListOfDocLibQueryResponseObj = ListOfDocLibQueryResponseObj()
         instance: LibraryBase | None = self.__lib_manager.instance
-        if not instance or not isinstance(instance, DocumentLib) or not request.text:
+        if not instance or instance.LIB_TYPE != LibTypes.DOCUMENT.value or not request.text:
             return response
 
         casted_instance: DocumentLib = instance
@@ -321,17 +335,19 @@ class Servicer(GrpcServerServicer):
             return response
 
         instance: LibraryBase | None = self.__lib_manager.instance
-        if not instance or not isinstance(instance, ImageLib):
+        if not instance or instance.LIB_TYPE != LibTypes.IMAGE.value:
             return response
 
         try:
             casted_instance: ImageLib = instance
-            query_result: list[tuple] = casted_instance.image_for_image_search(image, request.top_k)
+            query_result: list[tuple] = casted_instance.image_for_image_search(
+                image, request.top_k, filter_expression=get_image_filter_expression(request))
             for res in query_result:
                 r: ImageLibQueryResponseObj = ImageLibQueryResponseObj()
-                r.uuid = res[2]
-                r.path = res[3]
-                r.filename = res[4]
+                # (uuid, path, filename)
+                r.uuid = res[0]
+                r.path = res[1]
+                r.filename = res[2]
                 response.value.append(r)
             return response
         except Exception as e:
@@ -342,27 +358,97 @@ class Servicer(GrpcServerServicer):
     def text_for_image_search(self, request: ImageLibQueryObj, context) -> ListOfImageLibQueryResponseObj:
         response: ListOfImageLibQueryResponseObj = ListOfImageLibQueryResponseObj()
         instance: LibraryBase | None = self.__lib_manager.instance
-        if not instance or not isinstance(instance, ImageLib) or not request.text:
+        if not instance or instance.LIB_TYPE != LibTypes.IMAGE.value or not request.text:
             return response
 
         try:
             casted_instance: ImageLib = instance
-            query_result: list[tuple] = casted_instance.text_for_image_search(request.text, request.top_k)
+            query_result: list[tuple] = casted_instance.text_for_image_search(
+                request.text, request.top_k, filter_expression=get_image_filter_expression(request))
             for res in query_result:
                 r: ImageLibQueryResponseObj = ImageLibQueryResponseObj()
-                r.uuid = res[2]
-                r.path = res[3]
-                r.filename = res[4]
+                # (uuid, path, filename)
+                r.uuid = res[0]
+                r.path = res[1]
+                r.filename = res[2]
                 response.value.append(r)
             return response
         except Exception as e:
             LOGGER.error(f'Text for image query failed, error: {e}')
             return response
 
+    @log_rpc_call
+    def get_thumbnail(self, request: ThumbnailQueryObj, context) -> ThumbnailObj:
+        response: ThumbnailObj = ThumbnailObj()
+        instance: LibraryBase | None = self.__lib_manager.instance
+        if not instance or instance.LIB_TYPE != LibTypes.IMAGE.value or not request.relative_path:
+            return response
+
+        size_name: str = (request.size or ThumbnailSize.SMALL.name).upper()
+        if size_name not in ThumbnailSize.__members__:
+            response.error = f'Invalid thumbnail size: {request.size}'
+            return response
+
+        casted_instance: ImageLib = instance
+        data: bytes | None = casted_instance.get_thumbnail(request.relative_path, ThumbnailSize[size_name])
+        if data is None:
+            response.error = f'Failed to get thumbnail: {request.relative_path}'
+            return response
+        response.data = data
+        response.mime_type = casted_instance.get_thumbnail_mime_type()
+        return response
+
+    @log_rpc_call
+    def tag_images(self, request: VoidObj, context) -> StringObj:
+        try:
+            task_id: str | None = self.__lib_manager.tag_library()
+            if task_id is None:
+                task_id = ''
+            return StringObj(value=task_id)
+        except LibraryManagerException as e:
+            LOGGER.info(f'Failed to tag image library: {e}')
+            return StringObj(value=None, error=str(e))
+
     @log_rpc_call
     def get_image_tags(self, request: ImageLibQueryObj, context) -> ListOfImageTagObj:
-        # TODO: tagger is too slow, improve it firstly before adding tagger feature
-        raise NotImplementedError('Not implemented yet')
+        response: ListOfImageTagObj = ListOfImageTagObj()
+        instance: LibraryBase | None = self.__lib_manager.instance
+        if not instance or instance.LIB_TYPE != LibTypes.IMAGE.value or not request.relative_path:
+            return response
+
+        try:
+            casted_instance: ImageLib = instance
+            tags: list[tuple[str, float]] = casted_instance.get_image_tags(request.relative_path,
+                                                                           request.top_k or 10, request.en)
+            for tag, score in tags:
+                response.value.append(ImageTagObj(tag=tag, confidence=score))
+            return response
+        except Exception as e:
+            LOGGER.error(f'Get image tags failed, error: {e}')
+            return response
+
+    @log_rpc_call
+    def search_images_by_tag(self, request: ImageLibQueryObj, context) -> ListOfImageLibQueryResponseObj:
+        response: ListOfImageLibQueryResponseObj = ListOfImageLibQueryResponseObj()
+        instance: LibraryBase | None = self.__lib_manager.instance
+        if not instance or instance.LIB_TYPE != LibTypes.IMAGE.value or not request.text:
+            return response
+
+        try:
+            casted_instance: ImageLib = instance
+            query_result: list[tuple] = casted_instance.search_images_by_tag(request.text, request.top_k or 10,
+                                                                             request.offset, request.en)
+            for res in query_result:
+                r: ImageLibQueryResponseObj = ImageLibQueryResponseObj()
+                # (uuid, path, filename)
+                r.uuid = res[0]
+                r.path = res[1]
+                r.filename = res[2]
+                response.value.append(r)
+            return response
+        except Exception as e:
+            LOGGER.error(f'Tag search failed, error: {e}')
+            return response
 
     """
     File APIs
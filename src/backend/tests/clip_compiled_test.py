@@ -0,0 +1,57 @@
+import os
+import unittest
+
+import numpy as np
+from constants.env import CLIP_MODEL, MODEL_FOLDER
+from knowledge_base.image.clip_compiled import (FP32_TOLERANCE,
+                                                INT8_TOLERANCE, ClipBackend)
+from knowledge_base.image.image_embedder import ImageEmbedder
+from PIL import Image
+from tests.lib_info import img_lib1, img_lib2
+
+# Compiled towers are validated on random inputs when they are built, they are checked on real images and texts here
+SAMPLE_TEXTS: list[str] = ['a photo of a cat', 'a city skyline at night', 'a hand-drawn diagram on a whiteboard',
+                           'a bowl of fruit on a wooden table', '一只在草地上奔跑的狗']
+
+
+def load_sample_images() -> list[Image.Image]:
+    images: list[Image.Image] = list()
+    for folder in (img_lib1.path, img_lib2.path):
+        for filename in sorted(os.listdir(folder)):
+            with Image.open(os.path.join(folder, filename)) as img:
+                images.append(img.convert('RGB'))
+    return images
+
+
+def max_cosine_distance(actual: np.ndarray, expected: np.ndarray) -> float:
+    similarity: np.ndarray = (actual * expected).sum(axis=1) / \
+        (np.linalg.norm(actual, axis=1) * np.linalg.norm(expected, axis=1))
+    return float((1 - similarity).max())
+
+
+@unittest.skipUnless(os.path.isdir(os.path.join(MODEL_FOLDER, CLIP_MODEL)), 'CLIP model is not downloaded')
+class ClipCompiledTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.images = load_sample_images()
+        eager: ImageEmbedder = ImageEmbedder(backend=ClipBackend.EAGER.value)
+        cls.expected_images = eager.embed_images(cls.images)
+        cls.expected_texts = eager.embed_texts(SAMPLE_TEXTS)
+
+    def __check_tolerance(self, int8: bool, tolerance: float):
+        compiled: ImageEmbedder = ImageEmbedder(backend=ClipBackend.TORCHSCRIPT.value, int8=int8)
+        self.assertIsNotNone(compiled.vision_tower)
+        self.assertIsNotNone(compiled.text_tower)
+        self.assertLessEqual(max_cosine_distance(compiled.embed_images(self.images), self.expected_images), tolerance)
+        self.assertLessEqual(max_cosine_distance(compiled.embed_texts(SAMPLE_TEXTS), self.expected_texts), tolerance)
+
+    def test_fp32_matches_eager(self):
+        self.__check_tolerance(False, FP32_TOLERANCE)
+
+    def test_int8_matches_eager(self):
+        self.__check_tolerance(True, INT8_TOLERANCE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import json
+import subprocess
+import sys
+import unittest
+from multiprocessing.connection import Connection
+from pathlib import Path
+
+# Modules which build the server singletons, none of them should be imported by an embedding worker
+SERVER_MODULES: list[str] = ['singletons', 'utils.lib_manager', 'server.grpc_server']
+# Spawn a worker from a parent whose main module is the server entry, as the server does, and print the server modules
+# loaded in the worker
+# - Spawned processes re-import the parent's main module from `__main__.__file__` before running the target
+SPAWN_SCRIPT: str = f'''
+import __main__, json, multiprocessing
+__main__.__file__ = {str(Path(__file__).parent.parent / 'run_grpc_server.py')!r}
+from tests.embedding_worker_pool_test import report_server_modules
+context = multiprocessing.get_context('spawn')
+parent_conn, child_conn = context.Pipe()
+process = context.Process(target=report_server_modules, args=(child_conn,))
+process.start()
+child_conn.close()
+print(json.dumps(parent_conn.recv()))
+process.join()
+'''
+
+
+def report_server_modules(conn: Connection):
+    """Target of the spawned worker
+    """
+    conn.send([m for m in SERVER_MODULES if m in sys.modules])
+
+
+class EmbeddingWorkerSpawnTest(unittest.TestCase):
+
+    def test_worker_does_not_build_server(self):
+        output: str = subprocess.check_output([sys.executable, '-c', SPAWN_SCRIPT], cwd=Path(__file__).parent.parent,
+                                              text=True, timeout=60)
+        self.assertEqual(json.loads(output.strip().splitlines()[-1]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
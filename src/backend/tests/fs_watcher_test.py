@@ -0,0 +1,125 @@
+import os
+import unittest
+from threading import Event
+from time import sleep, time
+from typing import Callable
+
+from utils.fs_watcher import (FsChanges, FsEvent, FsEventType, FsWatcher,
+                              WatcherBackend)
+
+DEBOUNCE_SECONDS: float = 0.05
+RETRY_SECONDS: float = 0.5
+
+
+def join(*parts: str) -> str:
+    return os.path.join(*parts)
+
+
+def changes_of(events: list[FsEvent]) -> FsChanges:
+    changes: FsChanges = FsChanges()
+    for event in events:
+        changes.add(event)
+    return changes
+
+
+class FsChangesTest(unittest.TestCase):
+
+    def test_upserts_are_coalesced(self):
+        changes: FsChanges = changes_of([FsEvent(FsEventType.CREATED, 'a.jpg'),
+                                         FsEvent(FsEventType.MODIFIED, 'a.jpg'),
+                                         FsEvent(FsEventType.CREATED, 'b', is_dir=True)])
+        self.assertEqual(list(changes.upserts), ['a.jpg'])
+        self.assertEqual(changes.operations, [])
+
+    def test_move_then_upsert(self):
+        changes: FsChanges = changes_of([FsEvent(FsEventType.MOVED, 'b.jpg', src_relative_path='a.jpg'),
+                                         FsEvent(FsEventType.MODIFIED, 'b.jpg')])
+        self.assertEqual(changes.operations, [(FsEventType.MOVED, 'b.jpg', 'a.jpg')])
+        self.assertEqual(list(changes.upserts), ['b.jpg'])
+
+    def test_upsert_then_move(self):
+        changes: FsChanges = changes_of([FsEvent(FsEventType.CREATED, 'a.jpg'),
+                                         FsEvent(FsEventType.MOVED, 'b.jpg', src_relative_path='a.jpg')])
+        self.assertEqual(changes.operations, [(FsEventType.MOVED, 'b.jpg', 'a.jpg')])
+        self.assertEqual(list(changes.upserts), ['b.jpg'])
+
+    def test_delete_folder_with_pending_upserts(self):
+        changes: FsChanges = changes_of([FsEvent(FsEventType.CREATED, join('a', 'x.jpg')),
+                                         FsEvent(FsEventType.CREATED, join('a', 'b', 'y.jpg')),
+                                         FsEvent(FsEventType.CREATED, join('a0', 'z.jpg')),
+                                         FsEvent(FsEventType.CREATED, 'a.jpg'),
+                                         FsEvent(FsEventType.DELETED, 'a', is_dir=True)])
+        self.assertEqual(changes.operations, [(FsEventType.DELETED, 'a', None)])
+        # Files beside the folder are kept, even if their paths start with the folder name
+        self.assertEqual(list(changes.upserts), [join('a0', 'z.jpg'), 'a.jpg'])
+
+    def test_chained_folder_rename(self):
+        changes: FsChanges = changes_of([FsEvent(FsEventType.CREATED, join('a', 'x.jpg')),
+                                         FsEvent(FsEventType.MOVED, 'b', is_dir=True, src_relative_path='a'),
+                                         FsEvent(FsEventType.CREATED, join('b', 'y.jpg')),
+                                         FsEvent(FsEventType.MOVED, 'c', is_dir=True, src_relative_path='b')])
+        self.assertEqual(changes.operations, [(FsEventType.MOVED, 'b', 'a'), (FsEventType.MOVED, 'c', 'b')])
+        self.assertEqual(list(changes.upserts), [join('c', 'x.jpg'), join('c', 'y.jpg')])
+
+    def test_merge_applies_newer_changes_after_current(self):
+        changes: FsChanges = changes_of([FsEvent(FsEventType.CREATED, join('a', 'x.jpg'))])
+        newer: FsChanges = changes_of([FsEvent(FsEventType.MOVED, 'b', is_dir=True, src_relative_path='a'),
+                                       FsEvent(FsEventType.CREATED, join('b', 'y.jpg')),
+                                       FsEvent(FsEventType.DELETED, join('b', 'x.jpg')),
+                                       FsEvent(FsEventType.OVERFLOW, '')])
+        changes.merge(newer)
+        self.assertEqual(changes.operations, [(FsEventType.MOVED, 'b', 'a'),
+                                              (FsEventType.DELETED, join('b', 'x.jpg'), None)])
+        self.assertEqual(list(changes.upserts), [join('b', 'y.jpg')])
+        self.assertTrue(changes.overflow)
+
+
+class FakeBackend(WatcherBackend):
+
+    def __init__(self):
+        self.callback: Callable[[FsEvent], None] | None = None
+
+    def start(self, root_path: str, callback: Callable[[FsEvent], None], excluded: list[str] | None = None):
+        self.callback = callback
+
+    def stop(self):
+        self.callback = None
+
+    def emit(self, event: FsEvent):
+        self.callback(event)  # type: ignore
+
+
+class FsWatcherRetryTest(unittest.TestCase):
+
+    def test_newer_events_do_not_shorten_retry_delay(self):
+        backend: FakeBackend = FakeBackend()
+        calls: list[tuple[float, list[str]]] = list()
+        applied: Event = Event()
+
+        def handler(changes: FsChanges) -> bool:
+            calls.append((time(), list(changes.upserts)))
+            if len(calls) == 1:
+                return False
+            applied.set()
+            return True
+
+        watcher: FsWatcher = FsWatcher('', handler, backend, debounce_seconds=DEBOUNCE_SECONDS,
+                                       max_delay_seconds=DEBOUNCE_SECONDS * 2, retry_seconds=RETRY_SECONDS)
+        watcher.start()
+        try:
+            backend.emit(FsEvent(FsEventType.CREATED, 'a.jpg'))
+            sleep(DEBOUNCE_SECONDS * 4)
+            self.assertEqual(len(calls), 1)
+            # A new event during the retry delay is merged, but it does not bring the retry forward
+            backend.emit(FsEvent(FsEventType.CREATED, 'b.jpg'))
+            self.assertTrue(applied.wait(5))
+        finally:
+            watcher.stop()
+
+        self.assertEqual(len(calls), 2)
+        self.assertGreaterEqual(calls[1][0] - calls[0][0], RETRY_SECONDS)
+        self.assertEqual(calls[1][1], ['a.jpg', 'b.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from constants.lib_constants import LIB_DATA_FOLDER
+from library.image.library_diff import DiffType, merge_diff
+from utils.file_operator import FileOperator
+
+# Files in a library, names around the separator sort as: 'a-b' < 'a.b' < 'a/...' < 'a0' as '-' < '.' < '/' < '0'
+LIBRARY_FILES: list[str] = ['a-b', 'a.b', 'a/b', 'a/b.c/d.jpg', 'a/b-c/d.jpg', 'a/b0', 'a/c/d/e.jpg', 'a0', 'ab',
+                            'b.jpg', 'b/a.jpg', 'B.jpg']
+# (name, files, records, expected (diff type, relative path))
+MERGE_CASES: list[tuple[str, list[str], list[str], list[tuple[DiffType, str]]]] = [
+    ('empty', [], [], []),
+    ('all new', ['a.jpg', 'b.jpg'], [],
+     [(DiffType.NEW, 'a.jpg'), (DiffType.NEW, 'b.jpg')]),
+    ('all deleted', [], ['a.jpg', 'b.jpg'],
+     [(DiffType.DELETED, 'a.jpg'), (DiffType.DELETED, 'b.jpg')]),
+    ('unchanged', ['a.jpg', 'b/c.jpg'], ['a.jpg', 'b/c.jpg'],
+     [(DiffType.EXISTING, 'a.jpg'), (DiffType.EXISTING, 'b/c.jpg')]),
+    ('added and removed', ['a.jpg', 'c.jpg', 'e.jpg'], ['b.jpg', 'c.jpg', 'd.jpg'],
+     [(DiffType.NEW, 'a.jpg'), (DiffType.DELETED, 'b.jpg'), (DiffType.EXISTING, 'c.jpg'), (DiffType.DELETED, 'd.jpg'),
+      (DiffType.NEW, 'e.jpg')]),
+    ('nested folders', ['a/b/c.jpg', 'a/b/d/e.jpg', 'a/f.jpg'], ['a/b/d/e.jpg', 'a/b/d/f.jpg', 'a/f.jpg'],
+     [(DiffType.NEW, 'a/b/c.jpg'), (DiffType.EXISTING, 'a/b/d/e.jpg'), (DiffType.DELETED, 'a/b/d/f.jpg'),
+      (DiffType.EXISTING, 'a/f.jpg')]),
+    ('around separator', ['a-b', 'a/b', 'a0'], ['a-b', 'a.b', 'a/b'],
+     [(DiffType.EXISTING, 'a-b'), (DiffType.DELETED, 'a.b'), (DiffType.EXISTING, 'a/b'), (DiffType.NEW, 'a0')]),
+]
+
+
+def sqlite_order(paths: list[str]) -> list[str]:
+    """Order given paths as the embedding record table does, by SQLite's default BINARY collation
+    """
+    db: sqlite3.Connection = sqlite3.connect(':memory:')
+    db.execute('CREATE TABLE t (relative_path TEXT)')
+    db.executemany('INSERT INTO t VALUES (?)', [(p,) for p in paths])
+    res: list[str] = [row[0] for row in db.execute('SELECT relative_path FROM t ORDER BY relative_path')]
+    db.close()
+    return res
+
+
+class MergeDiffTest(unittest.TestCase):
+
+    def test_merge_cases(self):
+        for name, files, records, expected in MERGE_CASES:
+            with self.subTest(name):
+                file_stream = iter([(f, os.stat_result((0,) * 10)) for f in files])
+                record_stream = iter([(r, 1, 1, None) for r in records])
+                diffs: list[tuple[DiffType, str]] = [(diff_type, relative_path) for diff_type, relative_path, _, _
+                                                     in merge_diff(file_stream, record_stream)]  # type: ignore
+                self.assertEqual(diffs, expected)
+
+    def test_existing_item_has_stat_and_record(self):
+        stat: os.stat_result = os.stat_result((0,) * 10)
+        record: tuple = ('a.jpg', 1, 2, 'hash')
+        self.assertEqual(list(merge_diff(iter([('a.jpg', stat)]), iter([record]))),
+                         [(DiffType.EXISTING, 'a.jpg', stat, record)])
+
+
+class FolderScannerOrderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.root: str = self.temp_dir.name
+        for relative_path in LIBRARY_FILES + [f'{LIB_DATA_FOLDER}/data.db']:
+            full_path: str = os.path.join(self.root, *relative_path.split('/'))
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'w') as f:
+                f.write(relative_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_sorted_scan_matches_sqlite_order(self):
+        scanned: list[str] = [relative_path for relative_path, _ in
+                              FileOperator(self.root).folder_scanner(relative_path='', sort=True)]
+        expected: list[str] = [p.replace('/', os.sep) for p in LIBRARY_FILES]
+        self.assertEqual(scanned, sqlite_order(expected))
+
+    def test_merge_with_sorted_scan(self):
+        records: list[str] = sqlite_order(['a.b', 'a/b', 'a/b.c/d.jpg', 'a/b.c/x.jpg', 'a/c/d/e.jpg', 'c.jpg'])
+        diffs: dict[str, DiffType] = {
+            relative_path.replace(os.sep, '/'): diff_type for diff_type, relative_path, _, _ in
+            merge_diff(FileOperator(self.root).folder_scanner(relative_path='', sort=True),
+                       iter([(r.replace('/', os.sep), None, None, None) for r in records]))}
+        self.assertEqual(diffs, {p: DiffType.EXISTING for p in ['a.b', 'a/b', 'a/b.c/d.jpg', 'a/c/d/e.jpg']}
+                         | {p: DiffType.DELETED for p in ['a/b.c/x.jpg', 'c.jpg']}
+                         | {p: DiffType.NEW for p in ['a-b', 'a/b-c/d.jpg', 'a/b0', 'a0', 'ab', 'b.jpg', 'b/a.jpg',
+                                                      'B.jpg']})
+
+
+if __name__ == '__main__':
+    unittest.main()
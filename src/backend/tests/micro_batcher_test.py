@@ -0,0 +1,127 @@
+import unittest
+from threading import Event, Thread
+from time import sleep, time
+from typing import Any
+
+from knowledge_base.micro_batcher import MicroBatcher
+
+# Seconds to wait for submitting threads to queue their requests
+WAIT_SECONDS: float = 0.2
+
+
+class RecordingBatchFn:
+    """A batch function which records its batches and blocks until the gate is set
+    - Items are doubled, a batch fails if any of its items is negative
+    """
+
+    def __init__(self):
+        self.gate: Event = Event()
+        self.gate.set()
+        self.entered: Event = Event()
+        self.batches: list[list[int]] = list()
+        self.started_on: list[float] = list()
+
+    def __call__(self, items: list[int]) -> list[int]:
+        self.batches.append(items)
+        self.started_on.append(time())
+        self.entered.set()
+        self.gate.wait()
+        if any(item < 0 for item in items):
+            raise RuntimeError(f'bad items: {items}')
+        return [item * 2 for item in items]
+
+
+class MicroBatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.batch_fn: RecordingBatchFn = RecordingBatchFn()
+        self.results: dict[int, Any] = dict()
+        self.threads: list[Thread] = list()
+
+    def submit_async(self, batcher: MicroBatcher, item: int):
+        def submit():
+            try:
+                self.results[item] = batcher.submit(item)
+            except Exception as e:
+                self.results[item] = e
+
+        thread: Thread = Thread(target=submit)
+        thread.start()
+        self.threads.append(thread)
+
+    def block_first_batch(self, batcher: MicroBatcher):
+        """Run a batch of item 0 which is blocked until the gate is set, so that other requests are queued
+        """
+        self.batch_fn.gate.clear()
+        self.submit_async(batcher, 0)
+        self.assertTrue(self.batch_fn.entered.wait(5))
+
+    def join_all(self):
+        for thread in self.threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+    def test_single_request_is_not_delayed(self):
+        batcher: MicroBatcher = MicroBatcher('test', self.batch_fn, max_batch_size=16, max_wait_ms=1000)
+        start: float = time()
+        self.assertEqual(batcher.submit(1), 2)
+        self.assertLess(time() - start, 0.5)
+        self.assertEqual(self.batch_fn.batches, [[1]])
+
+    def test_concurrent_submits_are_coalesced_up_to_max_batch_size(self):
+        batcher: MicroBatcher = MicroBatcher('test', self.batch_fn, max_batch_size=16, max_wait_ms=50)
+        self.block_first_batch(batcher)
+        for i in range(1, 21):
+            self.submit_async(batcher, i)
+        sleep(WAIT_SECONDS)
+        self.batch_fn.gate.set()
+        self.join_all()
+
+        self.assertEqual([len(batch) for batch in self.batch_fn.batches], [1, 16, 4])
+        self.assertEqual(sorted(sum(self.batch_fn.batches, [])), list(range(21)))
+        self.assertEqual(self.results, {i: i * 2 for i in range(21)})
+        metrics: dict = batcher.get_metrics()
+        self.assertEqual((metrics['requests'], metrics['batches'], metrics['max_batch_size']), (21, 3, 16))
+
+    def test_partial_batch_is_flushed_after_wait_window(self):
+        batcher: MicroBatcher = MicroBatcher('test', self.batch_fn, max_batch_size=16, max_wait_ms=300)
+        self.block_first_batch(batcher)
+        self.submit_async(batcher, 1)
+        self.submit_async(batcher, 2)
+        sleep(WAIT_SECONDS)
+        released_on: float = time()
+        self.batch_fn.gate.set()
+        # A request arriving within the wait window joins the lingering batch
+        sleep(0.05)
+        self.submit_async(batcher, 3)
+        self.join_all()
+
+        self.assertEqual(self.batch_fn.batches, [[0], [1, 2, 3]])
+        self.assertGreaterEqual(self.batch_fn.started_on[1] - released_on, 0.25)
+        self.assertEqual(self.results, {i: i * 2 for i in range(4)})
+
+    def test_failing_batch_fails_every_caller_in_it(self):
+        batcher: MicroBatcher = MicroBatcher('test', self.batch_fn, max_batch_size=3, max_wait_ms=50)
+        self.block_first_batch(batcher)
+        for i in (1, -2, 3):
+            self.submit_async(batcher, i)
+        sleep(WAIT_SECONDS)
+        self.submit_async(batcher, 4)
+        sleep(WAIT_SECONDS)
+        self.batch_fn.gate.set()
+        self.join_all()
+
+        self.assertEqual([len(batch) for batch in self.batch_fn.batches], [1, 3, 1])
+        for i in (1, -2, 3):
+            self.assertIsInstance(self.results[i], RuntimeError)
+        # Requests of other batches are not affected
+        self.assertEqual((self.results[0], self.results[4]), (0, 8))
+
+    def test_wrong_result_count_fails_the_batch(self):
+        batcher: MicroBatcher = MicroBatcher('test', lambda items: items[:-1], max_batch_size=16, max_wait_ms=0)
+        with self.assertRaises(ValueError):
+            batcher.submit(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+from threading import Event, Lock, Thread
+from time import sleep
+
+from db.vector.redis_client import BatchedPipeline
+from utils.errors.db_errors import VectorDbCoreError
+
+# Seconds to wait for the background sender to reach a state
+WAIT_SECONDS: float = 0.2
+
+
+class FakePipeline:
+    """A redis pipeline which records executed commands to the log shared by its client
+    """
+
+    def __init__(self, client: 'FakeRedisClient'):
+        self.client: FakeRedisClient = client
+        self.commands: list[tuple[str, str]] = list()
+
+    def __len__(self) -> int:
+        return len(self.commands)
+
+    def set(self, key: str, value: str):
+        self.commands.append((key, value))
+
+    def execute(self):
+        """Commands are cleared after execution, as redis pipeline does
+        """
+        self.client.gate.wait()
+        commands, self.commands = self.commands, list()
+        with self.client.lock:
+            self.client.executions += 1
+            if self.client.fail_on_execution == self.client.executions:
+                raise RuntimeError('connection lost')
+            self.client.log.extend(commands)
+
+    def close(self):
+        pass
+
+
+class FakeRedisClient:
+    def __init__(self, fail_on_execution: int = 0):
+        self.log: list[tuple[str, str]] = list()
+        self.lock: Lock = Lock()
+        # Executions block until the gate is set
+        self.gate: Event = Event()
+        self.gate.set()
+        self.executions: int = 0
+        self.fail_on_execution: int = fail_on_execution
+
+    def pipeline(self) -> FakePipeline:
+        return FakePipeline(self)
+
+
+class BatchedPipelineTest(unittest.TestCase):
+
+    def test_sync_mode_executes_full_batches_and_rest_on_exit(self):
+        client: FakeRedisClient = FakeRedisClient()
+        with BatchedPipeline(client, batch_size=3) as pipeline:  # type: ignore
+            for i in range(7):
+                pipeline.set(f'k{i}', str(i))
+            self.assertEqual(client.executions, 2)
+        self.assertEqual(client.log, [(f'k{i}', str(i)) for i in range(7)])
+
+    def test_async_mode_keeps_order(self):
+        client: FakeRedisClient = FakeRedisClient()
+        with BatchedPipeline(client, batch_size=2, async_flush=True, max_in_flight=2) as pipeline:  # type: ignore
+            for i in range(25):
+                pipeline.set(f'k{i}', str(i))
+        self.assertEqual(client.log, [(f'k{i}', str(i)) for i in range(25)])
+        self.assertEqual(client.executions, 13)
+
+    def test_async_mode_blocks_caller_at_max_in_flight(self):
+        client: FakeRedisClient = FakeRedisClient()
+        client.gate.clear()
+        pipeline: BatchedPipeline = BatchedPipeline(client, batch_size=1, async_flush=True, max_in_flight=2)  # type: ignore
+        written: list[int] = list()
+
+        def produce():
+            for i in range(6):
+                pipeline.set(f'k{i}', str(i))
+                written.append(i)
+
+        producer: Thread = Thread(target=produce)
+        producer.start()
+        sleep(WAIT_SECONDS)
+        # One batch is held by the sender, two are waiting in the queue, the caller is blocked on the next one
+        self.assertEqual(written, [0, 1, 2])
+        self.assertTrue(producer.is_alive())
+
+        client.gate.set()
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        pipeline.sync()
+        self.assertEqual(client.log, [(f'k{i}', str(i)) for i in range(6)])
+        pipeline.__exit__(None, None, None)
+
+    def test_sync_waits_for_in_flight_batches(self):
+        client: FakeRedisClient = FakeRedisClient()
+        with BatchedPipeline(client, batch_size=2, async_flush=True) as pipeline:  # type: ignore
+            for i in range(5):
+                pipeline.set(f'k{i}', str(i))
+            pipeline.sync()
+            self.assertEqual(len(client.log), 5)
+
+    def test_async_error_is_raised_on_next_execute(self):
+        client: FakeRedisClient = FakeRedisClient(fail_on_execution=1)
+        pipeline: BatchedPipeline = BatchedPipeline(client, batch_size=1, async_flush=True)  # type: ignore
+        pipeline.set('k0', '0')
+        sleep(WAIT_SECONDS)
+        with self.assertRaises(VectorDbCoreError):
+            pipeline.set('k1', '1')
+        with self.assertRaises(VectorDbCoreError):
+            pipeline.__exit__(None, None, None)
+
+    def test_async_error_is_raised_on_exit_and_rest_batches_dropped(self):
+        client: FakeRedisClient = FakeRedisClient(fail_on_execution=1)
+        client.gate.clear()
+        with self.assertRaises(VectorDbCoreError):
+            with BatchedPipeline(client, batch_size=1, async_flush=True, max_in_flight=4) as pipeline:  # type: ignore
+                for i in range(3):
+                    pipeline.set(f'k{i}', str(i))
+                client.gate.set()
+        self.assertEqual(client.log, list())
+
+    def test_async_error_does_not_shadow_caller_error(self):
+        client: FakeRedisClient = FakeRedisClient(fail_on_execution=1)
+        with self.assertRaises(KeyError):
+            with BatchedPipeline(client, batch_size=1, async_flush=True) as pipeline:  # type: ignore
+                pipeline.set('k0', '0')
+                sleep(WAIT_SECONDS)
+                raise KeyError('caller failed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from time import sleep
+
+from db.sqlite.sql_basic import MAX_SQL_PARAMS, initialize_table_sql
+from db.sqlite.table import SqliteTable
+from utils.errors.db_errors import SqlTableError
+
+TABLE_NAME: str = 'items'
+# Write batch deadline used by the tests, and the time to sleep to pass it
+MAX_DELAY_MS: int = 50
+PASS_DEADLINE_SECONDS: float = 0.1
+
+
+class ItemTable(SqliteTable):
+
+    # Row format: (id, name)
+    TABLE_STRUCTURE: list[list[str]] = [
+        ['id', 'INTEGER PRIMARY KEY'],
+        ['name', 'TEXT'],
+    ]
+
+    def __init__(self, db_path: str):
+        super().__init__(db_path, TABLE_NAME)
+        self.db.execute(initialize_table_sql(table_name=TABLE_NAME, table_structure=self.TABLE_STRUCTURE))
+        self.db.commit()
+
+
+class WriteBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.db_path: str = os.path.join(self.temp_dir.name, 'test.db')
+        self.table: ItemTable = ItemTable(self.db_path)
+        # Another connection only sees committed rows
+        self.reader: sqlite3.Connection = sqlite3.connect(self.db_path)
+
+    def tearDown(self):
+        self.reader.close()
+        self.table.close()
+        self.temp_dir.cleanup()
+
+    def committed_names(self) -> list[str]:
+        return [row[0] for row in self.reader.execute(f'SELECT name FROM {TABLE_NAME} ORDER BY id')]
+
+    def test_commit_on_exit(self):
+        with self.table.write_batch(max_rows=100, max_delay_ms=60000):
+            for i in range(10):
+                self.assertIsNone(self.table.insert_row((f'n{i}',)))
+            self.assertEqual(self.committed_names(), [])
+        self.assertEqual(self.committed_names(), [f'n{i}' for i in range(10)])
+        self.assertIsNone(self.table.write_batch_ctx)
+
+    def test_commit_every_max_rows(self):
+        with self.table.write_batch(max_rows=4, max_delay_ms=60000):
+            for i in range(10):
+                self.table.insert_row((f'n{i}',))
+            self.assertEqual(len(self.committed_names()), 8)
+        self.assertEqual(len(self.committed_names()), 10)
+
+    def test_pending_writes_are_committed_on_exception(self):
+        with self.assertRaises(KeyError):
+            with self.table.write_batch(max_rows=100, max_delay_ms=60000):
+                self.table.insert_row(('n0',))
+                self.table.delete_row(self.table.max_row_id())
+                self.table.insert_row(('n1',))
+                raise KeyError('cancelled')
+        self.assertEqual(self.committed_names(), ['n1'])
+        self.assertIsNone(self.table.write_batch_ctx)
+
+    def test_deadline_flush_on_write(self):
+        with self.table.write_batch(max_rows=100, max_delay_ms=MAX_DELAY_MS):
+            self.table.insert_row(('n0',))
+            self.assertEqual(self.committed_names(), [])
+            sleep(PASS_DEADLINE_SECONDS)
+            self.table.insert_row(('n1',))
+            self.assertEqual(self.committed_names(), ['n0', 'n1'])
+
+    def test_deadline_flush_on_read(self):
+        with self.table.write_batch(max_rows=100, max_delay_ms=MAX_DELAY_MS):
+            self.table.insert_row(('n0',))
+            # Buffered rows are visible to the reads of the table before they are committed
+            self.assertEqual(self.table.row_count(), 1)
+            self.assertEqual(self.committed_names(), [])
+            sleep(PASS_DEADLINE_SECONDS)
+            self.assertEqual(self.table.row_count(), 1)
+            self.assertEqual(self.committed_names(), ['n0'])
+
+    def test_nested_batch_joins_outer_batch(self):
+        with self.table.write_batch(max_rows=100, max_delay_ms=60000) as outer:
+            with self.table.write_batch() as inner:
+                self.assertIs(inner, outer)
+                self.table.insert_row(('n0',))
+            self.assertIs(self.table.write_batch_ctx, outer)
+            self.assertEqual(self.committed_names(), [])
+        self.assertEqual(self.committed_names(), ['n0'])
+
+    def test_writes_without_batch_are_committed_at_once(self):
+        row_id: int | None = self.table.insert_row(('n0',))
+        self.assertEqual(row_id, 1)
+        self.assertEqual(self.committed_names(), ['n0'])
+
+
+class SharedConnectionTest(unittest.TestCase):
+
+    def test_tables_share_connection(self):
+        table: ItemTable = ItemTable(':memory:')
+        other: SqliteTable = SqliteTable(None, TABLE_NAME, connection=table.db)
+        with table.write_batch(max_rows=100, max_delay_ms=60000):
+            table.insert_row(('n0',))
+            # Rows executed by one table are visible to the other before they are committed, buffered ones are not
+            self.assertEqual(other.row_count(), 0)
+            table.write_batch_ctx.flush()  # type: ignore
+            self.assertEqual(other.row_count(), 1)
+        # A shared connection is closed by its owner only
+        other.close()
+        self.assertEqual(table.row_count(), 1)
+        table.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            other.row_count()
+
+    def test_db_path_or_connection_is_required(self):
+        with self.assertRaises(SqlTableError):
+            SqliteTable(None, TABLE_NAME)
+
+
+class SelectByKeysTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table: ItemTable = ItemTable(':memory:')
+        self.count: int = MAX_SQL_PARAMS * 2 + 10
+        self.table.insert_rows([(f'n{i}',) for i in range(1, self.count + 1)])
+
+    def tearDown(self):
+        self.table.close()
+
+    def test_more_keys_than_sql_params_in_given_order(self):
+        row_ids: list[int] = list(range(self.count, 0, -1))
+        rows: list[tuple] = self.table.select_rows(row_ids)
+        self.assertEqual(rows, [(row_id, f'n{row_id}') for row_id in row_ids])
+
+    def test_duplicated_and_missing_keys(self):
+        row_ids: list[int] = [3, self.count + 1, 1, 3, MAX_SQL_PARAMS + 5, 0, 1]
+        rows: list[tuple] = self.table.select_rows(row_ids, columns=['name'])
+        self.assertEqual(rows, [('n3',), ('n1',), ('n3',), (f'n{MAX_SQL_PARAMS + 5}',), ('n1',)])
+
+    def test_no_keys(self):
+        self.assertEqual(self.table.select_rows([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
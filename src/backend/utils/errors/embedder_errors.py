@@ -0,0 +1,5 @@
+class EmbedderError(Exception):
+    def __init__(self, message: str | None = None, code: int = 0):
+        super().__init__(message)
+        self.message: str | None = message
+        self.code: int = code
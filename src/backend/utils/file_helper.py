@@ -1,11 +1,45 @@
 import base64
 import os
 import zipfile
+from hashlib import blake2b
 from io import BytesIO
+from typing import BinaryIO
 from mimetypes import guess_extension, guess_type
 
+from constants.file_constants import T_IMAGE
 from PIL import Image
 
+# Magic numbers (file signatures) of decodable image formats, as (offset, signature)
+# - https://en.wikipedia.org/wiki/List_of_file_signatures
+IMAGE_SIGNATURES: list[tuple[int, bytes]] = [
+    (0, b'\xff\xd8\xff'),  # JPEG
+    (0, b'\x89PNG\r\n\x1a\n'),  # PNG, APNG
+    (0, b'GIF87a'),
+    (0, b'GIF89a'),
+    (0, b'BM'),  # BMP
+    (8, b'WEBP'),  # WEBP, "RIFF" at offset 0
+    (0, b'II*\x00'),  # TIFF, little endian
+    (0, b'MM\x00*'),  # TIFF, big endian
+    (0, b'\x00\x00\x01\x00'),  # ICO
+    (0, b'\x00\x00\x02\x00'),  # CUR
+    (4, b'ftypavif'),  # AVIF
+    (4, b'ftypavis'),  # AVIF sequence
+    (0, b'\x00\x00\x00\x0cjP  \r\n\x87\n'),  # JPEG 2000
+    (0, b'\xff\x4f\xff\x51'),  # JPEG 2000 codestream
+    (0, b'P1'), (0, b'P2'), (0, b'P3'), (0, b'P4'), (0, b'P5'), (0, b'P6'),  # PBM, PGM, PPM
+    (0, b'DDS '),
+    # PCX, manufacturer 0x0a, version 0, 2, 3, 4 or 5, and RLE encoding 1, as the first byte alone matches text files
+    (0, b'\x0a\x00\x01'), (0, b'\x0a\x02\x01'), (0, b'\x0a\x03\x01'), (0, b'\x0a\x04\x01'), (0, b'\x0a\x05\x01'),
+    (0, b'icns'),
+    (0, b'8BPS'),  # PSD
+    (0, b'\x01\xda'),  # SGI
+]
+# Decodable image formats without a file signature, they are checked by extension only
+UNSIGNED_IMAGE_EXTENSIONS: set[str] = {'tga', 'dib'}
+SIGNATURE_READ_SIZE: int = 16
+# Size of the chunks to be read for full file hash
+FILE_HASH_CHUNK_SIZE: int = 1024 * 1024
+
 
 def chunk_read(file_path: str, start: int, end: int | None = None) -> tuple[bytes, int, int, int]:
     """Read a chunk of file at given path, starting from byte position start and ending at byte position end
@@ -27,6 +61,23 @@ def chunk_read(file_path: str, start: int, end: int | None = None) -> tuple[byte
     return chunk, start, length, file_size
 
 
+def file_hash(file_path: str) -> str:
+    """A strong content hash (BLAKE2b) of the whole file, files with the same hash are byte-identical
+    - It equals to `bytes_hash()` of the file's content
+    """
+    hasher = blake2b(digest_size=32)
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(FILE_HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def bytes_hash(content: bytes) -> str:
+    """The same content hash as `file_hash()`, for the content already read into memory
+    """
+    return blake2b(content, digest_size=32).hexdigest()
+
+
 def zip_directory(dir: str, zip_file_path: str):
     """Compress given directory into a zip file
     """
@@ -61,6 +112,47 @@ def open_image_as_base64(path: str) -> str | None:
         return None
 
 
+def is_image_file(path: str) -> bool:
+    """Cheaply check if given file is an image, without decoding it
+    1. The extension must be a known image extension
+    2. The file header must match a known image signature, this reads only first few bytes of the file, formats
+    without a signature (see `UNSIGNED_IMAGE_EXTENSIONS`) are accepted by extension
+    """
+    _, extension = os.path.splitext(path)
+    extension = extension[1:].lower()
+    if not extension or extension not in T_IMAGE:
+        return False
+    if extension in UNSIGNED_IMAGE_EXTENSIONS:
+        return True
+
+    try:
+        with open(path, 'rb') as f:
+            header: bytes = f.read(SIGNATURE_READ_SIZE)
+    except OSError:
+        return False
+    return any(header[offset:offset + len(signature)] == signature for offset, signature in IMAGE_SIGNATURES)
+
+
+def load_image_for_model(path: str | BinaryIO, target_size: int) -> Image.Image:
+    """Open, validate and decode an image in one pass, reduced to near the model's input size
+    - JPEG is decoded by libjpeg directly at a reduced scale with `draft()`, which is much cheaper than full decode
+    - Other formats are decoded fully and then reduced by an integer factor with `reduce()`
+    - The shorter side of the result is never below `target_size`, so the model's own resize/crop is not affected
+    - Any decoding error (e.g., not an image, truncated file) is raised, so no separate `verify()` is needed
+
+    Returns: An RGB image, it is fully loaded and does not hold the file handle
+    """
+    with Image.open(path) as img:
+        if img.format == 'JPEG':
+            # draft() picks the largest scale (1/2, 1/4, 1/8) that keeps both sides >= requested size
+            img.draft('RGB', (target_size, target_size))
+        img.load()
+
+        factor: int = min(img.size) // target_size
+        reduced: Image.Image = img.reduce(factor) if factor >= 2 else img
+        return reduced.convert('RGB') if reduced.mode != 'RGB' else reduced.copy()
+
+
 def open_base64_as_image(base64_image: str) -> tuple[Image.Image | None, str | None]:
     """Convert a base64 image to PIL image and return with file extension info
     - The given base64 string MUST have file type header
@@ -49,6 +49,57 @@ class FileOperator:
                     file_relative_path: str = os.path.relpath(file_abs_path, self.root_path)
                 yield file_relative_path
 
+    def folder_scanner(self,
+                       relative_path: str,
+                       sort: bool = False) -> Generator[tuple[str, os.stat_result], None, None]:
+        """Get all files under given folder under current library, along with their stat info
+        - It uses `os.scandir()` so the stat info comes from the directory walk, and no extra stat call is needed on
+        some platforms (e.g., Windows)
+        - Symbolic links to folders are not followed, same as `folder_walker()`
+        - If `sort` is True, files are yielded in the ascending order of their relative paths (by code point, same as
+        SQLite's default BINARY collation), only one folder's entries are held in memory on each level
+
+        Args:
+            relative_path (str): The source folder to be scanned
+            sort (bool, optional): If to yield files sorted by relative path. Defaults to False.
+
+        Returns:
+            Generator[tuple[str, os.stat_result], None, None]: The generator of (relative path, stat) of all files
+        """
+        lib_data_folder_abs_path: str = os.path.join(self.root_path, LIB_DATA_FOLDER)
+        yield from self.__scan_folder(os.path.join(self.root_path, relative_path), lib_data_folder_abs_path, sort)
+
+    def __scan_folder(self,
+                      folder: str,
+                      excluded_folder: str,
+                      sort: bool) -> Generator[tuple[str, os.stat_result], None, None]:
+        try:
+            with os.scandir(folder) as it:
+                entries: list[tuple[str, os.DirEntry, bool]] = list()
+                for entry in it:
+                    try:
+                        is_dir: bool = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    # A folder's name is suffixed with separator as sort key, so that all files under it are ordered
+                    # as their full relative paths, e.g., `a.jpg` < `a/b.jpg` as '.' < '/'
+                    entries.append((entry.name + os.sep if is_dir else entry.name, entry, is_dir))
+        except OSError as e:
+            LOGGER.warning(f'Failed to list folder: {folder}, error: {e}')
+            return
+
+        if sort:
+            entries.sort(key=lambda x: x[0])
+        for _, entry, is_dir in entries:
+            try:
+                if is_dir:
+                    if entry.path != excluded_folder:
+                        yield from self.__scan_folder(entry.path, excluded_folder, sort)
+                elif entry.is_file():
+                    yield os.path.relpath(entry.path, self.root_path), entry.stat()
+            except OSError as e:
+                LOGGER.warning(f'Failed to read file info: {entry.path}, error: {e}')
+
     def add_file(self, target_relative_path: str, source_file: str) -> bool:
         raise NotImplementedError()
 
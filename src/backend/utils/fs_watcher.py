@@ -0,0 +1,392 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from threading import Condition, Event, Thread
+from time import time
+from typing import Callable
+
+from constants.env import IS_LINUX
+from loggers import lib_logger as LOGGER
+from utils.containable_enum import ContainableEnum
+
+
+class FsEventType(ContainableEnum):
+    CREATED = 'created'
+    MODIFIED = 'modified'
+    MOVED = 'moved'
+    DELETED = 'deleted'
+    # Events are lost (e.g., kernel queue overflow), changes must be found by a scan
+    OVERFLOW = 'overflow'
+
+
+class FsEvent:
+    """A file system event, paths are relative to the watched root
+    - For MOVED event, `src_relative_path` is the path before the move
+    """
+
+    def __init__(self,
+                 event_type: FsEventType,
+                 relative_path: str,
+                 is_dir: bool = False,
+                 src_relative_path: str | None = None):
+        self.event_type: FsEventType = event_type
+        self.relative_path: str = relative_path
+        self.is_dir: bool = is_dir
+        self.src_relative_path: str | None = src_relative_path
+
+
+class FsChanges:
+    """Debounced changes under the watched root
+    - `operations` are deletes (files or folders removed, or moved out of the root) and moves (files or folders moved
+    or renamed within the root) in event order, as (DELETED, path, None) or (MOVED, dest, src)
+    - `upserts` are files created or modified, events of the same file are coalesced, and they follow the moves
+
+    The handler should apply `operations` in order, then `upserts`, and re-check the file system state as the changes
+    are only hints, e.g., an upserted file can be gone when the changes are applied
+    """
+
+    def __init__(self):
+        self.operations: list[tuple[FsEventType, str, str | None]] = list()
+        self.upserts: dict[str, None] = dict()
+        self.overflow: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.operations or self.upserts or self.overflow)
+
+    def add(self, event: FsEvent):
+        path: str = event.relative_path
+        if event.event_type == FsEventType.OVERFLOW:
+            self.overflow = True
+        elif event.event_type in (FsEventType.CREATED, FsEventType.MODIFIED):
+            if not event.is_dir:
+                self.upserts[path] = None
+        elif event.event_type == FsEventType.DELETED:
+            # Pending upserts of the deleted file, or of any file under the deleted folder, are dropped
+            for pending in [p for p in self.upserts if p == path or p.startswith(path + os.sep)]:
+                self.upserts.pop(pending)
+            self.operations.append((FsEventType.DELETED, path, None))
+        elif event.event_type == FsEventType.MOVED and event.src_relative_path:
+            src: str = event.src_relative_path
+            self.operations.append((FsEventType.MOVED, path, src))
+            # Pending upserts follow the moved file or folder
+            for pending in [p for p in self.upserts if p == src or p.startswith(src + os.sep)]:
+                self.upserts.pop(pending)
+                self.upserts[path + pending[len(src):]] = None
+
+    def merge(self, newer: 'FsChanges'):
+        """Merge newer changes into current changes
+        """
+        for event_type, path, src in newer.operations:
+            self.add(FsEvent(event_type, path, src_relative_path=src))
+        for path in newer.upserts:
+            self.add(FsEvent(FsEventType.MODIFIED, path))
+        self.overflow = self.overflow or newer.overflow
+
+
+class WatcherBackend:
+    """Base class of file system watcher backends, a backend reports raw events of a folder tree to a callback
+    - Events under excluded folders are not reported
+    """
+
+    def start(self, root_path: str, callback: Callable[[FsEvent], None], excluded: list[str] | None = None):
+        raise NotImplementedError()
+
+    def stop(self):
+        raise NotImplementedError()
+
+
+class InotifyBackend(WatcherBackend):
+    """Linux inotify backend, it calls libc directly so no extra package is needed
+    - inotify is not recursive, a watch is added for each folder, and for new folders when they are created or moved in
+    - A move within the root is reported as a pair of IN_MOVED_FROM/IN_MOVED_TO with the same cookie, an unpaired
+    IN_MOVED_FROM is a move out (deleted) and an unpaired IN_MOVED_TO is a move in (created)
+    """
+
+    IN_CLOSE_WRITE: int = 0x00000008
+    IN_MOVED_FROM: int = 0x00000040
+    IN_MOVED_TO: int = 0x00000080
+    IN_CREATE: int = 0x00000100
+    IN_DELETE: int = 0x00000200
+    IN_DELETE_SELF: int = 0x00000400
+    IN_Q_OVERFLOW: int = 0x00004000
+    IN_IGNORED: int = 0x00008000
+    IN_ONLYDIR: int = 0x01000000
+    IN_ISDIR: int = 0x40000000
+    IN_NONBLOCK: int = 0x00000800
+    IN_CLOEXEC: int = 0x00080000
+
+    WATCH_MASK: int = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+    EVENT_HEADER: struct.Struct = struct.Struct('iIII')
+    READ_SIZE: int = 64 * 1024
+    POLL_INTERVAL: float = 0.5
+    # An IN_MOVED_FROM without IN_MOVED_TO after this time is treated as moved out
+    MOVE_PAIRING_TIMEOUT: float = 0.5
+
+    def __init__(self):
+        libc_path: str | None = ctypes.util.find_library('c')
+        self.__libc = ctypes.CDLL(libc_path or 'libc.so.6', use_errno=True)
+        self.__fd: int = -1
+        self.__root_path: str = ''
+        self.__excluded: set[str] = set()
+        self.__callback: Callable[[FsEvent], None] | None = None
+        # Watch descriptor -> absolute folder path
+        self.__watches: dict[int, str] = dict()
+        # Cookie -> (absolute path, is_dir, time) of unpaired IN_MOVED_FROM events
+        self.__moved_from: dict[int, tuple[str, bool, float]] = dict()
+        self.__stop_event: Event = Event()
+        self.__thread: Thread | None = None
+
+    """
+    Private methods
+    """
+
+    def __relative(self, path: str) -> str:
+        return os.path.relpath(path, self.__root_path)
+
+    def __emit(self, event_type: FsEventType, path: str, is_dir: bool = False, src_path: str | None = None):
+        self.__callback(FsEvent(event_type,  # type: ignore
+                                self.__relative(path),
+                                is_dir,
+                                self.__relative(src_path) if src_path else None))
+
+    def __add_watch(self, folder: str, report_files: bool):
+        """Add watches for given folder and its sub-folders
+        - For a folder created or moved in, the files already in it are reported as created, as they can be written
+        before the watch is added
+        """
+        if folder in self.__excluded:
+            return
+        wd: int = self.__libc.inotify_add_watch(self.__fd, os.fsencode(folder), self.WATCH_MASK)
+        if wd < 0:
+            LOGGER.warning(f'Failed to watch folder: {folder}, errno: {ctypes.get_errno()}')
+            return
+        self.__watches[wd] = folder
+
+        try:
+            with os.scandir(folder) as it:
+                entries: list[os.DirEntry] = list(it)
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                self.__add_watch(entry.path, report_files)
+            elif report_files:
+                self.__emit(FsEventType.CREATED, entry.path)
+
+    def __update_watch_paths(self, src: str, dest: str):
+        """A watched folder is moved within the root, its watch descriptors are kept but paths are changed
+        """
+        for wd, path in self.__watches.items():
+            if path == src or path.startswith(src + os.sep):
+                self.__watches[wd] = dest + path[len(src):]
+
+    def __remove_watch_paths(self, src: str):
+        for wd in [wd for wd, path in self.__watches.items() if path == src or path.startswith(src + os.sep)]:
+            self.__libc.inotify_rm_watch(self.__fd, wd)
+            self.__watches.pop(wd, None)
+
+    def __expire_moved_from(self, force: bool = False):
+        now: float = time()
+        for cookie in [c for c, v in self.__moved_from.items() if force or now - v[2] >= self.MOVE_PAIRING_TIMEOUT]:
+            path, is_dir, _ = self.__moved_from.pop(cookie)
+            if is_dir:
+                self.__remove_watch_paths(path)
+            self.__emit(FsEventType.DELETED, path, is_dir)
+
+    def __handle_event(self, wd: int, mask: int, cookie: int, name: str):
+        if mask & self.IN_Q_OVERFLOW:
+            LOGGER.warning('inotify event queue overflowed, events are lost')
+            self.__emit(FsEventType.OVERFLOW, self.__root_path, True)
+            return
+        if mask & self.IN_IGNORED:
+            self.__watches.pop(wd, None)
+            return
+
+        folder: str | None = self.__watches.get(wd)
+        if folder is None or (mask & self.IN_DELETE_SELF):
+            return
+        path: str = os.path.join(folder, name) if name else folder
+        is_dir: bool = bool(mask & self.IN_ISDIR)
+        if path in self.__excluded:
+            return
+
+        if mask & self.IN_MOVED_FROM:
+            self.__moved_from[cookie] = (path, is_dir, time())
+        elif mask & self.IN_MOVED_TO:
+            moved_from: tuple[str, bool, float] | None = self.__moved_from.pop(cookie, None)
+            if moved_from:
+                if is_dir:
+                    self.__update_watch_paths(moved_from[0], path)
+                self.__emit(FsEventType.MOVED, path, is_dir, moved_from[0])
+            elif is_dir:
+                self.__add_watch(path, report_files=True)
+            else:
+                self.__emit(FsEventType.CREATED, path)
+        elif mask & self.IN_CREATE:
+            if is_dir:
+                self.__add_watch(path, report_files=True)
+            else:
+                self.__emit(FsEventType.CREATED, path)
+        elif mask & self.IN_CLOSE_WRITE:
+            self.__emit(FsEventType.MODIFIED, path)
+        elif mask & self.IN_DELETE:
+            self.__emit(FsEventType.DELETED, path, is_dir)
+
+    def __read_loop(self):
+        while not self.__stop_event.is_set():
+            try:
+                readable, _, _ = select.select([self.__fd], [], [], self.POLL_INTERVAL)
+                self.__expire_moved_from()
+                if not readable:
+                    continue
+
+                data: bytes = os.read(self.__fd, self.READ_SIZE)
+                offset: int = 0
+                while offset < len(data):
+                    wd, mask, cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+                    offset += self.EVENT_HEADER.size
+                    name: str = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                    offset += length
+                    self.__handle_event(wd, mask, cookie, name)
+            except BlockingIOError:
+                continue
+            except BaseException as e:
+                LOGGER.error(f'inotify watcher error: {e}')
+
+    """
+    Public methods
+    """
+
+    def start(self, root_path: str, callback: Callable[[FsEvent], None], excluded: list[str] | None = None):
+        self.__fd = self.__libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.__root_path = root_path
+        self.__callback = callback
+        self.__excluded = set(excluded or list())
+        self.__stop_event.clear()
+        self.__add_watch(root_path, report_files=False)
+        LOGGER.info(f'inotify watcher started for: {root_path}, watching {len(self.__watches)} folders')
+        self.__thread = Thread(target=self.__read_loop, name='fs-watcher-inotify', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        if self.__thread:
+            self.__thread.join()
+            self.__thread = None
+        self.__expire_moved_from(force=True)
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+        self.__watches.clear()
+
+
+def get_default_backend() -> WatcherBackend | None:
+    """Get the watcher backend for current platform, None if no backend is available
+    """
+    if IS_LINUX:
+        return InotifyBackend()
+    return None
+
+
+class FsWatcher:
+    """Watch a folder tree with given backend, and feed debounced changes to a handler
+    - Changes are delivered after no new event comes for `debounce_seconds`, or at most `max_delay_seconds` after the
+    first pending event, so a burst of events (e.g., a copy of many files) is handled in batches
+    - The handler returns False if it cannot apply the changes now (e.g., a scan is running), the changes are retried
+    after `retry_seconds` with newer events merged
+    """
+
+    def __init__(self,
+                 root_path: str,
+                 handler: Callable[[FsChanges], bool],
+                 backend: WatcherBackend,
+                 excluded: list[str] | None = None,
+                 debounce_seconds: float = 1.0,
+                 max_delay_seconds: float = 5.0,
+                 retry_seconds: float = 10.0):
+        self.root_path: str = root_path
+        self.__handler: Callable[[FsChanges], bool] = handler
+        self.__backend: WatcherBackend = backend
+        self.__excluded: list[str] = excluded or list()
+        self.__debounce: float = debounce_seconds
+        self.__max_delay: float = max_delay_seconds
+        self.__retry: float = retry_seconds
+
+        self.__condition: Condition = Condition()
+        self.__pending: FsChanges = FsChanges()
+        self.__first_event: float = 0
+        self.__last_event: float = 0
+        # Changes not applied by the handler are not delivered again before this time, even if newer events come
+        self.__retry_not_before: float = 0
+        self.__stopped: bool = True
+        self.__thread: Thread | None = None
+
+    def __on_event(self, event: FsEvent):
+        with self.__condition:
+            now: float = time()
+            if not self.__pending:
+                self.__first_event = now
+            self.__last_event = now
+            self.__pending.add(event)
+            self.__condition.notify()
+
+    def __dispatch_loop(self):
+        while True:
+            with self.__condition:
+                # Wait until there are pending changes and they are quiet for a while, or delayed for too long
+                while not self.__stopped:
+                    if self.__pending:
+                        now: float = time()
+                        due: float = max(min(self.__last_event + self.__debounce,
+                                             self.__first_event + self.__max_delay),
+                                         self.__retry_not_before)
+                        if now >= due:
+                            break
+                        self.__condition.wait(due - now)
+                    else:
+                        self.__condition.wait()
+                if self.__stopped:
+                    return
+                changes: FsChanges = self.__pending
+                self.__pending = FsChanges()
+
+            try:
+                applied: bool = self.__handler(changes)
+            except BaseException as e:
+                LOGGER.error(f'Failed to apply file changes under {self.root_path}, changes dropped, error: {e}')
+                applied = True
+            if applied:
+                continue
+
+            # Retry later, newer events are merged after the changes not applied
+            with self.__condition:
+                changes.merge(self.__pending)
+                self.__pending = changes
+                self.__first_event = self.__last_event = time()
+                self.__retry_not_before = self.__first_event + self.__retry
+
+    def start(self):
+        if not self.__stopped:
+            return
+        self.__stopped = False
+        self.__backend.start(self.root_path, self.__on_event, self.__excluded)
+        self.__thread = Thread(target=self.__dispatch_loop, name='fs-watcher-dispatcher', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """Stop watching, pending changes which are not delivered yet are dropped
+        """
+        if self.__stopped:
+            return
+        self.__backend.stop()
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify()
+        if self.__thread:
+            self.__thread.join()
+            self.__thread = None
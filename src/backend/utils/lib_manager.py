@@ -1,12 +1,12 @@
 import os
 import pickle
+from threading import Event, Thread
+from time import time
 
-from constants.env import CONFIG_FOLDER
+from constants.env import (CONFIG_FOLDER, LIB_WATCHER_ENABLED,
+                           SHARE_EMBEDDING_STORE, TAGGER_MODEL)
 from constants.lib_constants import LibTypes
-from knowledge_base.document.doc_embedder import DocEmbedder
-from knowledge_base.image.image_embedder import ImageEmbedder
-from library.document.doc_lib import DocumentLib
-from library.image.image_lib import ImageLib
+from knowledge_base.model_registry import MODEL_REGISTRY
 from library.lib_base import LibraryBase
 from loggers import lib_manager_logger as LOGGER
 from utils.errors.lib_errors import LibraryError, LibraryManagerException
@@ -37,18 +37,35 @@ class LibInfo:
 
 class LibraryManager:
     """This is a single threaded, single session app, so one manager instance globally is enough
+    - Library classes and the model libraries they depend on are imported on warm-up instead of module import, and the
+    active library is instanized on warm-up as well, so the server can answer requests right after startup
+    - Warm-up runs in a background thread by default, `instance` blocks until it finishes
     """
 
-    def __init__(self, task_runner: TaskRunner):
+    def __init__(self,
+                 task_runner: TaskRunner,
+                 watch_library: bool = LIB_WATCHER_ENABLED,
+                 warm_up_in_background: bool = True):
+        """
+        Args:
+            task_runner (TaskRunner): Task runner for library initialization tasks
+            watch_library (bool, optional): If to watch the active image library's folder for file changes
+            warm_up_in_background (bool, optional): If to warm up in a background thread, otherwise `warm_up()` runs
+            in the constructor
+        """
         if not task_runner:
             raise LibraryManagerException('Task runner is not provided')
 
         self.task_runner: TaskRunner = task_runner
+        self.watch_library: bool = watch_library
         self.__path_config: str = os.path.join(CONFIG_FOLDER, CONFIG_FILE)
         # KV: uuid -> Library
         self.__libraries: dict[str, LibInfo] = dict()
-        # Current library instance
-        self.instance: LibraryBase | None = None
+        # Current library instance, use `instance` property to access it
+        self.__instance: LibraryBase | None = None
+        # Active library in config file, it is instanized on warm-up
+        self.__pending_lib: str = ''
+        self.__warm_up_done: Event = Event()
 
         LOGGER.info('Loading config file')
         current_lib: str = ''
@@ -62,19 +79,59 @@ class LibraryManager:
 
             LOGGER.info(f'Found {len(self.__libraries)} libraries in config file')
             if current_lib:
-                LOGGER.info(f'Found active library: {current_lib}, try to instanize it')
                 if current_lib not in self.__libraries:
                     LOGGER.warn('Active library is not in library list, config file might be corrupted, active library ignored')
                 else:
-                    self.__instanize_lib(current_lib)
+                    self.__pending_lib = current_lib
         except BaseException:
             raise LibraryManagerException('Config file corrupted')
 
+        if warm_up_in_background:
+            Thread(target=self.warm_up, name='lib-manager-warm-up', daemon=True).start()
+        else:
+            self.warm_up()
+
+    @property
+    def instance(self) -> LibraryBase | None:
+        """Current library instance, wait for warm-up to finish if it is not finished yet
+        """
+        self.__warm_up_done.wait()
+        return self.__instance
+
+    @instance.setter
+    def instance(self, instance: LibraryBase | None):
+        self.__warm_up_done.wait()
+        self.__instance = instance
+
+    def warm_up(self):
+        """Import library classes and instanize the active library in config file, it is called once by constructor
+        - Models are not loaded here, they are loaded by the model registry on first use
+        """
+        if self.__warm_up_done.is_set():
+            return
+
+        start: float = time()
+        try:
+            import library.document.doc_lib
+            import library.image.image_lib
+            if self.__pending_lib:
+                LOGGER.info(f'Found active library: {self.__pending_lib}, try to instanize it')
+                self.__instanize_lib(self.__pending_lib)
+        except BaseException as e:
+            LOGGER.error(f'Warm-up failed, error: {e}')
+        finally:
+            self.__pending_lib = ''
+            self.__warm_up_done.set()
+        LOGGER.info(f'Warm-up finished, cost: {time() - start:.2f}s')
+
+    def is_warmed_up(self) -> bool:
+        return self.__warm_up_done.is_set()
+
     def __save(self):
         pickle.dump(
             {
                 'libraries': self.__libraries,
-                'current_lib': self.instance.uuid if self.instance else ''
+                'current_lib': self.__instance.uuid if self.__instance else ''
             },
             open(self.__path_config, 'wb'))
 
@@ -112,6 +169,7 @@ class LibraryManager:
     def use_library(self, uuid: str) -> bool:
         """Switch to another library with given UUID
         """
+        self.__warm_up_done.wait()
         if uuid and uuid in self.__libraries:
             lib: LibInfo = self.__libraries[uuid]
             LOGGER.info(f'Switch to library, name: {lib.name}, UUID: {uuid}')
@@ -126,6 +184,7 @@ class LibraryManager:
         """Add a library to the manager, this only write the library info to config file unless the switch_to flag is set
         - Pre check to params must be done before calling this method
         """
+        self.__warm_up_done.wait()
         if new_lib.uuid in self.__libraries or new_lib.path in self.get_library_path_list():
             if new_lib.uuid in self.__libraries and new_lib.path == self.__libraries[new_lib.uuid].path:
                 # If the new library's same UUID and and same path all matched, do nothing
@@ -206,19 +265,25 @@ class LibraryManager:
 
         Return True if the instanization is succeeded, otherwise False
         """
-        if self.instance and self.instance.uuid == lib_uuid:
+        if self.__instance and self.__instance.uuid == lib_uuid:
             return True
 
-        self.instance = None
+        from library.document.doc_lib import DocumentLib
+        from library.image.image_lib import ImageLib
+
+        if isinstance(self.__instance, ImageLib):
+            self.__instance.stop_watcher()
+        self.__instance = None
         if lib_uuid in self.__libraries:
             try:
                 obj: LibInfo = self.__libraries[lib_uuid]
                 if obj.type == LibTypes.IMAGE.value:
-                    self.instance = ImageLib(obj.path, obj.name, obj.uuid, local_mode=True)
+                    self.__instance = ImageLib(obj.path, obj.name, obj.uuid, local_mode=True,
+                                               share_embedding_store=SHARE_EMBEDDING_STORE)
                 elif obj.type == LibTypes.VIDEO.value:
                     raise LibraryError('Video library is not supported yet')
                 elif obj.type == LibTypes.DOCUMENT.value:
-                    self.instance = DocumentLib(obj.path, obj.name, obj.uuid)
+                    self.__instance = DocumentLib(obj.path, obj.name, obj.uuid)
                 elif obj.type == LibTypes.GENERAL.value:
                     raise LibraryError('General library is not supported yet')
                 return True
@@ -241,13 +306,22 @@ class LibraryManager:
         if not self.instance:
             raise LibraryManagerException('Library is not selected')
 
+        from knowledge_base.document.doc_embedder import DocEmbedder
+        from knowledge_base.image.image_embedder import ImageEmbedder
+        from library.document.doc_lib import DocumentLib
+        from library.image.image_lib import ImageLib
+
         # Image library case
         if isinstance(self.instance, ImageLib):
             force_init: bool = kwargs.get('force_init', False)
             incremental: bool = kwargs.get('incremental', False)
 
             # If the library is already ready and not force init & not incremental, do nothing
-            if self.instance.is_ready() and not force_init and not incremental:
+            # The watcher applies changes only when the library is ready, changes during initialization are retried after
+            if self.watch_library:
+                self.instance.start_watcher()
+
+            if self.instance.is_ready() and not force_init and not incremental and not self.instance.has_unfinished_scan():
                 return UUID_EMPTY
 
             self.instance.set_embedder(ImageEmbedder())
@@ -275,8 +349,8 @@ class LibraryManager:
 
             lite_mode: bool = kwargs.get('lite_mode', False)
             self.instance.set_embedder(DocEmbedder(lite_mode=lite_mode))
-            # The phase count is 2 for document library's initialization task
-            task_id: str | None = self.task_runner.submit_task(self.instance.use_doc, None, True, True, 2,
+            # The phase count is 3 for document library's initialization task: DUMP, EMBEDDING and INDEXING
+            task_id: str | None = self.task_runner.submit_task(self.instance.use_doc, None, True, True, 3,
                                                                relative_path=relative_path,
                                                                provider_type=kwargs['provider_type'],
                                                                force_init=kwargs.get('force_init', False))
@@ -287,6 +361,24 @@ class LibraryManager:
 
         raise LibraryManagerException('Library type not supported')
 
+    def tag_library(self) -> str | None:
+        """Tag images of current image library which are not tagged yet in a background task
+
+        Returns:
+            str | None: Task ID, None for any failure
+        """
+        if not self.instance:
+            raise LibraryManagerException('Library is not selected')
+        if self.instance.LIB_TYPE != LibTypes.IMAGE.value:
+            raise LibraryManagerException('Only image library supports tagging')
+        if not self.instance.is_ready():
+            raise LibraryManagerException('Library is not ready, scan the library first')
+
+        from knowledge_base.image.image_tagger import ImageTagger
+
+        tagger: ImageTagger = MODEL_REGISTRY.get(f'tagger:{TAGGER_MODEL}', ImageTagger)
+        return self.task_runner.submit_task(self.instance.tag_images, None, True, True, 1, tagger=tagger)
+
     def get_embedding_records(self) -> dict[str, str]:
         """Get all embedding records of current library [relative_path: UUID]
         """